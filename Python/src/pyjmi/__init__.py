@@ -83,6 +83,8 @@ if casadi_present:
                                       transfer_to_casadi_interface,
                                       transfer_optimization_problem,
                                       transfer_model,
+                                      save_model,
+                                      load_model,
                                       CasadiModel)
 
 def get_files_path():
@@ -19,9 +19,12 @@
 Module containing the CasADi interface Python wrappers.
 """
 
+import os
 import os.path
 import numpy as N
 import sys
+import pickle
+import logging
 
 import casadi
 from collections import OrderedDict, Iterable
@@ -50,7 +53,8 @@ if modelicacasadi_present:
     from modelicacasadi_transfer import transfer_optimization_problem as _transfer_optimization_problem 
 
 def transfer_model(class_name, file_name=[],
-                   compiler_options={}, compiler_log_level='warning'):
+                   compiler_options={}, compiler_log_level='warning',
+                   cache=False):
     """ 
     Compiles and transfers a model to the ModelicaCasADi interface. 
     
@@ -86,12 +90,21 @@ def transfer_model(class_name, file_name=[],
             'warning'/'w', 'error'/'e', 'info'/'i' or 'debug'/'d'. 
             Default: 'warning'
 
+        cache --
+            If True, the transferred model is saved with save_model and 
+            loaded from file, without compiling, as long as the model files, 
+            libraries and compiler options are unchanged. A directory to 
+            store the files in can also be given.
+            Default: False
                   
     Returns::
     
         A Model representing the class given by class_name.
 
 """
+    if cache:
+        return _transfer_cached(Model, transfer_model, cache, class_name,
+                                file_name, compiler_options, compiler_log_level)
     model = Model() # no wrapper exists for Model yet
     _transfer_model(model, class_name=class_name, file_name=file_name,
                     compiler_options=compiler_options,
@@ -100,7 +113,7 @@ def transfer_model(class_name, file_name=[],
 
 def transfer_optimization_problem(class_name, file_name=[],
                                   compiler_options={}, compiler_log_level='warning',
-                                  accept_model=False):
+                                  accept_model=False, cache=False):
     """ 
     Compiles and transfers an optimization problem to the ModelicaCasADi interface. 
     
@@ -140,12 +153,22 @@ def transfer_optimization_problem(class_name, file_name=[],
             If true, allows to transfer a model. Only the model parts of the
             OptimizationProblem will be initialized.
 
+        cache --
+            If True, the transferred problem is saved with save_model and 
+            loaded from file, without compiling, as long as the model files, 
+            libraries and compiler options are unchanged. A directory to 
+            store the files in can also be given.
+            Default: False
 
     Returns::
     
         An OptimizationProblem representing the class given by class_name.
 
     """
+    if cache:
+        return _transfer_cached(OptimizationProblem, transfer_optimization_problem,
+                                cache, class_name, file_name, compiler_options,
+                                compiler_log_level, accept_model=accept_model)
     op = OptimizationProblem()
     _transfer_optimization_problem(op, class_name=class_name, file_name=file_name,
                                    compiler_options=compiler_options,
@@ -156,6 +179,298 @@ def transfer_optimization_problem(class_name, file_name=[],
 def transfer_to_casadi_interface(*args, **kwargs):
     return transfer_optimization_problem(*args, **kwargs)
 
+def _transfer_cached(cls, transfer, cache, class_name, file_name,
+                     compiler_options, compiler_log_level, **kwargs):
+    """
+    Helper function for transfer_model and transfer_optimization_problem. 
+    Loads the transferred model from the cache if it is there, otherwise 
+    transfers and saves it.
+    """
+    from pymodelica.compiler_cache import get_compilation_key
+    if cache is True:
+        cache = os.path.join(os.path.expanduser('~'), '.jmodelica.org',
+                             'casadi_cache')
+    if not os.path.isdir(cache):
+        os.makedirs(cache)
+    if isinstance(file_name, str):
+        file_name = [file_name]
+    key = get_compilation_key(class_name, file_name, 'optimica', cls.__name__,
+                              getattr(casadi, '__version__', None), None,
+                              dict(compiler_options, **kwargs))
+    cache_file = os.path.join(cache, key + '.pickle')
+    if os.path.isfile(cache_file):
+        try:
+            return load_model(cache_file)
+        except Exception as e:
+            # A stale or incompatible file, transfer the model again
+            logging.warning("Could not load %s from the cache, transferring "
+                            "it again: %s" % (class_name, e))
+            try:
+                os.remove(cache_file)
+            except OSError:
+                pass
+
+    model = transfer(class_name, file_name, compiler_options=compiler_options,
+                     compiler_log_level=compiler_log_level, **kwargs)
+    # Save under a temporary name, so that a partly written file is never
+    # loaded by another process
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        save_model(model, tmp_file)
+        os.rename(tmp_file, cache_file)
+    except CasadiSerializationError as e:
+        logging.warning("%s can not be cached: %s" % (class_name, e))
+    return model
+
+class CasadiSerializationError(Exception):
+    """
+    Raised when a model contains expressions that can not be saved.
+    """
+    pass
+
+_variable_attributes = ['bindingExpression', 'evaluatedBindingExpression',
+                        'comment', 'quantity', 'unit', 'displayUnit', 'min',
+                        'max', 'start', 'fixed', 'nominal', 'initialGuess',
+                        'free']
+
+def save_model(model, file_name):
+    """
+    Save a transferred Model or OptimizationProblem to file, so that it can be
+    loaded with load_model without compiling it again. The variables with 
+    their attributes, the DAE and initial equations and, for an 
+    OptimizationProblem, the objective, constraints, timed variables and 
+    start and final time are saved.
+
+    Only expressions built from variables, scalar constants and elementary 
+    operations can be saved, models with function calls give a 
+    CasadiSerializationError. Models with BLT information are not supported 
+    either.
+
+    Parameters::
+
+        model --
+            The Model or OptimizationProblem to save.
+
+        file_name --
+            The file to save to.
+    """
+    if model.hasBLT():
+        raise CasadiSerializationError("Models with BLT can not be saved.")
+
+    expressions = []
+    def add(expr):
+        expressions.append(expr)
+        return len(expressions) - 1
+
+    variables = []
+    for var in model.getAllVariables():
+        if var.getType() == var.REAL:
+            kind = 'derivative' if var.isDerivative() else 'real'
+        elif var.getType() == var.INTEGER:
+            kind = 'integer'
+        elif var.getType() == var.BOOLEAN:
+            kind = 'boolean'
+        else:
+            raise CasadiSerializationError(
+                "Variable %s has an unsupported type." % var.getName())
+        data = {'name': var.getName(), 'kind': kind, 'var': add(var.getVar()),
+                'causality': var.getCausality(),
+                'variability': var.getVariability(),
+                'attributes': {}}
+        if kind == 'derivative':
+            data['differentiated'] = var.getMyDifferentiatedVariable().getName()
+        if var.isAlias():
+            data['alias'] = var.getModelVariable().getName()
+            data['negated'] = var.isNegated()
+        else:
+            for attr in _variable_attributes:
+                val = var.getAttribute(attr)
+                if val is not None:
+                    data['attributes'][attr] = add(val)
+        variables.append(data)
+
+    problem = {'identifier': model.getIdentifier(),
+               'time': add(model.getTimeVariable()),
+               'variables': variables,
+               'dae': [(add(eq.getLhs()), add(eq.getRhs()))
+                       for eq in model.getDaeEquations()],
+               'initial': [(add(eq.getLhs()), add(eq.getRhs()))
+                           for eq in model.getInitialEquations()]}
+    if isinstance(model, OptimizationProblem):
+        problem['normalized_time'] = model.getNormalizedTimeFlag()
+        problem['start_time'] = add(model.getStartTime())
+        problem['final_time'] = add(model.getFinalTime())
+        problem['objective'] = add(model.getObjective())
+        problem['objective_integrand'] = add(model.getObjectiveIntegrand())
+        problem['path'] = [(add(c.getLhs()), add(c.getRhs()), c.getType())
+                           for c in model.getPathConstraints()]
+        problem['point'] = [(add(c.getLhs()), add(c.getRhs()), c.getType())
+                            for c in model.getPointConstraints()]
+        problem['timed'] = [(add(tv.getVar()), tv.getBaseVariable().getName(),
+                             add(tv.getTimePoint()))
+                            for tv in model.getTimedVariables()]
+
+    (problem['nodes'], problem['expressions']) = _serialize_mx(expressions)
+    with open(file_name, 'wb') as f:
+        pickle.dump(problem, f, 2)
+
+def load_model(file_name):
+    """
+    Load a Model or OptimizationProblem saved with save_model. No JVM is 
+    needed.
+
+    Parameters::
+
+        file_name --
+            The file to load from.
+
+    Returns::
+
+        The loaded Model or OptimizationProblem.
+    """
+    with open(file_name, 'rb') as f:
+        problem = pickle.load(f)
+
+    exprs = _deserialize_mx(problem['nodes'], problem['expressions'])
+    if 'objective' in problem:
+        model = OptimizationProblem()
+        model.initializeProblem(problem['identifier'], problem['normalized_time'])
+    else:
+        model = Model()
+        model.initializeModel(problem['identifier'])
+    model.setTimeVariable(exprs[problem['time']])
+
+    # Create the variables before adding them, since derivatives and aliases
+    # refer to other variables
+    created = {}
+    for data in problem['variables']:
+        if data['kind'] != 'derivative':
+            var_type = {'real': ci.RealVariable,
+                        'integer': ci.IntegerVariable,
+                        'boolean': ci.BooleanVariable}[data['kind']]
+            created[data['name']] = var_type(model, exprs[data['var']],
+                                             data['causality'],
+                                             data['variability'])
+    for data in problem['variables']:
+        if data['kind'] == 'derivative':
+            diff_var = created[data['differentiated']]
+            der_var = ci.DerivativeVariable(model, exprs[data['var']], diff_var)
+            diff_var.setMyDerivativeVariable(der_var)
+            created[data['name']] = der_var
+    for data in problem['variables']:
+        var = created[data['name']]
+        if 'alias' in data:
+            var.setAlias(created[data['alias']])
+            var.setNegated(data['negated'])
+        for (attr, i) in data['attributes'].items():
+            var.setAttribute(attr, exprs[i])
+        model.addVariable(var)
+
+    for (lhs, rhs) in problem['dae']:
+        model.addDaeEquation(ci.Equation(exprs[lhs], exprs[rhs]))
+    for (lhs, rhs) in problem['initial']:
+        model.addInitialEquation(ci.Equation(exprs[lhs], exprs[rhs]))
+
+    if isinstance(model, OptimizationProblem):
+        for (var, base, time_point) in problem['timed']:
+            model.addTimedVariable(ci.TimedVariable(model, exprs[var],
+                                                    created[base],
+                                                    exprs[time_point]))
+        model.setPathConstraints([ci.Constraint(exprs[lhs], exprs[rhs], ct)
+                                  for (lhs, rhs, ct) in problem['path']])
+        model.setPointConstraints([ci.Constraint(exprs[lhs], exprs[rhs], ct)
+                                   for (lhs, rhs, ct) in problem['point']])
+        model.setStartTime(exprs[problem['start_time']])
+        model.setFinalTime(exprs[problem['final_time']])
+        model.setObjectiveIntegrand(exprs[problem['objective_integrand']])
+        model.setObjective(exprs[problem['objective']])
+    return model
+
+def _serialize_mx(expressions):
+    """
+    Encode scalar MX expressions as a list of nodes in topological order, 
+    where shared subexpressions are only stored once. A node is one of 
+    ('symbol', name), ('constant', value) and ('operation', op, 
+    dependencies), where dependencies are indices of earlier nodes. Symbols 
+    are identified by their names.
+
+    Returns::
+
+        A tuple with the list of nodes and the index of the node of each 
+        expression.
+    """
+    nodes = []
+    index = {}
+    # Keep all visited expressions alive, so that their keys stay unique
+    visited = []
+    outputs = []
+    for expr in expressions:
+        stack = [(expr, None)]
+        while stack:
+            (mx, deps) = stack.pop()
+            key = _mx_key(mx)
+            if key in index:
+                continue
+            if deps is not None:
+                node = ('operation', mx.getOp(),
+                        [index[_mx_key(dep)] for dep in deps])
+            elif mx.isSymbolic():
+                node = ('symbol', mx.getName())
+            elif mx.isConstant():
+                if not mx.isScalar():
+                    raise CasadiSerializationError(
+                        "Only scalar constants are supported.")
+                node = ('constant', mx.getValue())
+            elif mx.isUnary() or mx.isBinary():
+                # Visit the dependencies first
+                deps = [mx.getDep(i) for i in range(mx.getNdeps())]
+                stack.append((mx, deps))
+                stack.extend((dep, None) for dep in deps)
+                continue
+            else:
+                raise CasadiSerializationError(
+                    "Unsupported operation in expression %s." % mx)
+            visited.append(mx)
+            index[key] = len(nodes)
+            nodes.append(node)
+        outputs.append(index[_mx_key(expr)])
+    return (nodes, outputs)
+
+def _mx_key(mx):
+    """
+    Helper function. Returns a key identifying the node of an MX expression.
+    """
+    if mx.isSymbolic():
+        return ('symbol', mx.getName())
+    try:
+        return ('node', hash(mx))
+    except TypeError:
+        # Without a hash of the underlying node, shared subexpressions can
+        # not be found
+        raise CasadiSerializationError(
+            "Can not identify the nodes of expression %s." % mx)
+
+def _deserialize_mx(nodes, outputs):
+    """
+    Rebuild the expressions encoded by _serialize_mx.
+
+    Returns::
+
+        A list with the expressions.
+    """
+    values = []
+    for node in nodes:
+        if node[0] == 'symbol':
+            values.append(casadi.MX.sym(node[1]))
+        elif node[0] == 'constant':
+            values.append(casadi.MX(node[1]))
+        elif len(node[2]) == 1:
+            values.append(casadi.MX.unary(node[1], values[node[2][0]]))
+        else:
+            values.append(casadi.MX.binary(node[1], values[node[2][0]],
+                                           values[node[2][1]]))
+    return [values[i] for i in outputs]
+
 def convert_casadi_der_name(name):
     n = name.split('der_')[1]
     qnames = n.split('.')
@@ -275,11 +590,6 @@ class Model(CI_Model):
             parameters --
                 List of parameter names for which to compute sensitivities.
         """
-        ###################################################################
-        ###           This code does not exploit DAE sparsity!          ###
-        ### Although this will probably not affect online computations. ###
-        ###################################################################
-
         # Get residuals and variables
         dae = self.getDaeResidual()
         init = self.getInitialResidual()
@@ -295,75 +605,96 @@ class Model(CI_Model):
         mvar_par = N.array([self.getVariable(par) for par in parameters])
 
         # Add sensitivity variables
+        sens_vars = {}
         for par in mvar_par:
-            par_var = par.getVar()
             for mvar in mvar_vectors['x']:
                 # States
-                mvar_var = mvar.getVar()
                 name = "d%s/d%s" % (mvar.getName(), par.getName())
                 sens_var = casadi.MX.sym(name)
                 sens = ci.RealVariable(self, sens_var, ci.RealVariable.INTERNAL, ci.RealVariable.CONTINUOUS)
                 self.addVariable(sens)
+                sens_vars[mvar.getName(), par.getName()] = sens_var
 
                 # State derivatives
                 dx_mvar = mvar.getMyDerivativeVariable()
-                dx_mvar_var = dx_mvar.getVar()
                 dx_name = "der(d%s/d%s)" % (mvar.getName(), par.getName())
                 dx_sens_var = casadi.MX.sym(dx_name)
                 dx_sens = ci.DerivativeVariable(self, dx_sens_var, sens)
                 self.addVariable(dx_sens)
+                sens_vars[dx_mvar.getName(), par.getName()] = dx_sens_var
             for mvar in mvar_vectors['w']:
                 # Algebraics
-                mvar_var = mvar.getVar()
                 name = "d%s/d%s" % (mvar.getName(), par.getName())
                 sens_var = casadi.MX.sym(name)
                 sens = ci.RealVariable(self, sens_var, ci.RealVariable.INTERNAL, ci.RealVariable.CONTINUOUS)
                 self.addVariable(sens)
+                sens_vars[mvar.getName(), par.getName()] = sens_var
+
+        # Stack variables, followed by the parameters
+        mvars = list(mvar_vectors['dx']) + list(mvar_vectors['x']) + list(mvar_vectors['w'])
+        n_var = len(mvars)
+        stacked_vars = [mvar.getVar() for mvar in mvars] + [par.getVar() for par in mvar_par]
+
+        # Compute sparse Jacobians with respect to the stacked variables
+        dae_jac_rows = self._jacobian_rows(dae, stacked_vars)
+        init_jac_rows = self._jacobian_rows(init, stacked_vars)
 
-        # Compute derivatives
-        dfdx = {}
-        df0dx = {}
-        for vk in var_kinds:
-            dfdx[vk] = {}
-            df0dx[vk] = {}
-            for mvar in mvar_vectors[vk]:
-                mvar_var = mvar.getVar()
-                dfdx[vk][mvar.getName()] = N.array([casadi.jacobian(dae_eq, mvar_var) for dae_eq in dae])
-                df0dx[vk][mvar.getName()] = N.array([casadi.jacobian(init_eq, mvar_var) for init_eq in init])
-        
         # Add sensitivity differential equations
         mx_zero = casadi.MX(0.)
-        for par in mvar_par:
-            for i in range(dae.numel()):
+        for (k, par) in enumerate(mvar_par):
+            sens = [sens_vars[mvar.getName(), par.getName()] for mvar in mvars]
+            for row in dae_jac_rows:
                 eq = mx_zero
-                for vk in var_kinds:
-                    for mvar in mvar_vectors[vk]:
-                        if vk == "dx":
-                            name = "der(d%s/d%s)" % (mvar.getMyDifferentiatedVariable().getName(), par.getName())
-                        else:
-                            name = "d%s/d%s" % (mvar.getName(), par.getName())
-                        sens_var = self.getVariable(name).getVar()
-                        eq += dfdx[vk][mvar.getName()][i] * sens_var
-                eq += casadi.jacobian(dae[i], par.getVar())
+                for (j, jac_ij) in row:
+                    if j < n_var:
+                        eq += jac_ij * sens[j]
+                    elif j == n_var + k:
+                        eq += jac_ij
                 sens_eq = ci.Equation(eq, mx_zero)
                 self.addDaeEquation(sens_eq)
 
         # Add sensitivity initial equations
-        for par in mvar_par:
-            for i in range(init.numel()):
+        for (k, par) in enumerate(mvar_par):
+            sens = [sens_vars[mvar.getName(), par.getName()] for mvar in mvars]
+            for row in init_jac_rows:
                 init_eq = mx_zero
-                for vk in var_kinds:
-                    for mvar in mvar_vectors[vk]:
-                        if vk == "dx":
-                            name = "der(d%s/d%s)" % (mvar.getMyDifferentiatedVariable().getName(), par.getName())
-                        else:
-                            name = "d%s/d%s" % (mvar.getName(), par.getName())
-                        sens_var = self.getVariable(name).getVar()
-                        init_eq += df0dx[vk][mvar.getName()][i] * sens_var
-                init_eq += casadi.jacobian(init[i], par.getVar())
+                for (j, jac_ij) in row:
+                    if j < n_var:
+                        init_eq += jac_ij * sens[j]
+                    elif j == n_var + k:
+                        init_eq += jac_ij
                 sens_init_eq = ci.Equation(init_eq, mx_zero)
                 self.addInitialEquation(sens_init_eq)
 
+    def _jacobian_rows(self, res, variables):
+        """
+        Computes the Jacobian of a residual vector with respect to stacked scalar variables.
+
+        Parameters::
+
+            res --
+                MX residual vector.
+
+            variables --
+                List of scalar MX variables.
+
+        Returns::
+
+            List with, for each element of res, a list of (j, jac_ij) for the structural nonzeros of the
+            corresponding Jacobian row, where jac_ij is the MX derivative with respect to variables[j].
+        """
+        rows = [[] for i in range(res.numel())]
+        if res.numel() == 0 or len(variables) == 0:
+            return rows
+        z = casadi.MX.sym("z", len(variables))
+        [res_z] = casadi.substitute([res], variables, casadi.vertsplit(z))
+        jac = casadi.jacobian(res_z, z)
+        [jac] = casadi.substitute([jac], [z], [casadi.vertcat(variables)])
+        sparsity = jac.sparsity()
+        for (i, j) in zip(sparsity.row(), sparsity.getCol()):
+            rows[i].append((j, jac[i, j]))
+        return rows
+
 class OptimizationProblem(Model, CI_OP, ModelBase):
 
     """
@@ -627,6 +627,17 @@ class LocalDAECollocationAlgOptions(OptionBase):
             Type: str
             Default: ""
         
+        write_result_file --
+            If True, the result is written to the file given by
+            result_file_name and the result object is loaded from that file.
+            If False, the result object is created directly from the solution
+            in memory and no file is written. The result can still be written
+            to file afterwards using the export_result_dymola method of the
+            result object.
+
+            Type: bool
+            Default: True
+        
         result_mode --
             Specifies the output format of the optimization result.
             
@@ -775,6 +786,7 @@ class LocalDAECollocationAlgOptions(OptionBase):
                 'nominal_traj': None,
                 'nominal_traj_mode': {"_default_mode": "linear"},
                 'result_file_name': "",
+                'write_result_file': True,
                 'write_scaled_result': False,
                 'print_condition_numbers': False,
                 'result_mode': "collocation_points",
@@ -38,12 +38,21 @@ def gather_solves(log):
     Each block_solve is marked up with an iterations list and initial_residual_scaling.
     Each iteration is marked up with jacobian and residual_scaling.
     """
+    return list(iterate_solves(log.find('EquationSolve')))
+
+def iterate_solves(solves):
+    """Gather information about equation solves one solve at a time.
+
+    Takes an iterable of EquationSolve nodes, such as the one returned by
+    iterate_jmi_log, and yields each solve marked up as by gather_solves.
+    The jacobians and residual scalings are carried over between the solves,
+    so only the current solve needs to be kept in memory.
+    """
     jacs = {}
     jacs_updated = {}
     scalings = {}
     scalings_updated = {}
 
-    solves = log.find('EquationSolve')    
     for solve in solves:
         block_solves = []
 
@@ -83,5 +92,4 @@ def gather_solves(log):
             else:
                 update_jacs_scalings(jacs, jacs_updated, scalings, scalings_updated, bl_node)            
         solve['block_solves'] = block_solves
-        
-    return solves
+        yield solve
@@ -20,6 +20,7 @@ Parser for the new JModelica FMU log format
 
 from xml import sax
 import re
+import sys
 import numpy as np
 from .tree import *
 from pyjmi.common import python3_flag
@@ -41,6 +42,16 @@ semicolon_re = "((?:[^;']|(?:'[^']*'))*)(?:;|\Z)"
 comma_pattern     = re.compile(comma_re)
 semicolon_pattern = re.compile(semicolon_re)
 
+# A comma separated list of numbers in the format accepted by parse_value,
+# which can be parsed without splitting on comma_pattern
+number_re         = "[-+]?[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?"
+numeric_vector_re = "^\s*" + number_re + "\s*(?:,\s*" + number_re + "\s*)*$"
+
+numeric_vector_pattern = re.compile(numeric_vector_re)
+
+# Python 3.7 and later also splits on the final empty match of semicolon_re
+split_on_empty_match = sys.version_info >= (3, 7)
+
 def parse_value(text):
     """Parse the string text and return a string, float, or int."""
     text = text.strip()
@@ -56,11 +67,24 @@ def parse_value(text):
         # for python 2 we need to avoid printing all strings as u'...'
         return text if python3_flag else text.encode('ascii', 'xmlcharrefreplace')
 
+def parse_numbers(parts, text):
+    """
+    Parse the strings parts, which all match number_re, and return them in
+    an array in the same way as parse_vector. text is the text that the
+    parts come from.
+    """
+    for c in '.eE-+':
+        if c in text:
+            return np.array(parts, dtype=float)
+    return np.asarray([int(part) for part in parts])
+
 def parse_vector(text):
     
     text = text.strip()
     if text == "":
         return np.zeros(0)
+    if numeric_vector_pattern.match(text):
+        return parse_numbers(text.split(','), text)
     parts = comma_pattern.split(text)
     parts = filter(None, map(str, parts))
     return np.asarray([parse_value(part) for part in parts])
@@ -69,8 +93,18 @@ def parse_matrix(text):
     text = text.strip()
     if text == "":
         return np.zeros((0,0))
+    rows = text.split(';')
+    if rows[-1] == '':
+        rows.pop()
+    if rows and all(numeric_vector_pattern.match(row) for row in rows):
+        n = rows[0].count(',') + 1
+        if all(row.count(',') + 1 == n for row in rows):
+            parts = ','.join(rows).split(',')
+            return parse_numbers(parts, text).reshape(len(rows), n)
     parts = semicolon_pattern.split(text)
     parts = parts[1::2]
+    if split_on_empty_match:
+        parts.pop()
     return np.asarray([parse_vector(part) for part in parts])
     
 
@@ -80,12 +114,29 @@ attribute_ns = "http://www.modelon.com/log/attribute"
 node_ns      = "http://www.modelon.com/log/node"
 
 class ContentHandler(sax.ContentHandler):
-    def __init__(self):
+    def __init__(self, stream_types=None, callback=None, index=False):
+        """
+        If stream_types is given, only nodes of these types are kept, and
+        callback is called with each of them when it is complete, instead of
+        building the whole tree. Nodes of stream_types inside such a node are
+        passed on as part of it.
+
+        If index is True, the nodes are indexed by type, see NodeIndex.
+        """
         sax.ContentHandler.__init__(self)
         self.nodes = [Node("Log")]
         self.leafparser = None
         self.leafkey    = None
         self.chars      = []
+        self.stream_types = stream_types
+        self.callback     = callback
+        # Number of open nodes of stream_types
+        self.streamed     = 0
+        self.index        = NodeIndex() if index else None
+
+    def keep(self):
+        """Return True if a node added at the current position is kept."""
+        return self.stream_types is None or self.streamed > 0
 
     def get_root(self):
         return self.nodes[0].nodes[0]
@@ -98,7 +149,7 @@ class ContentHandler(sax.ContentHandler):
     def create_comment(self):
         if len(self.chars) > 0:
             comment = self.take_chars()
-            if comment != '':
+            if comment != '' and self.keep():
                 self.nodes[-1].add(Comment(comment))
 
 # sax.ContentHandler callbacks:
@@ -126,35 +177,48 @@ class ContentHandler(sax.ContentHandler):
         else:
             node = Node(type)            
             #if len(self.nodes) > 0:
-            self.nodes[-1].add(node, key)
+            if self.keep():
+                self.nodes[-1].add(node, key)
+                if self.index is not None:
+                    self.index.open(node)
+            if self.stream_types is not None and type in self.stream_types:
+                self.streamed += 1
             self.nodes.append(node)
             
     def endElement(self, type):        
         # todo: verify name matching?
         if self.leafparser is not None:
             node = self.leafparser(self.take_chars())
-            self.nodes[-1].add(node, self.leafkey)
+            if self.keep():
+                self.nodes[-1].add(node, self.leafkey)
             self.leafparser = self.leafkey = None
         else:
             self.create_comment()
-            self.nodes.pop()
-
-def create_parser():
+            node = self.nodes.pop()
+            if node._start is not None:
+                self.index.close(node)
+            if self.stream_types is not None and type in self.stream_types:
+                self.streamed -= 1
+                if self.streamed == 0:
+                    self.callback(node)
+
+def create_parser(stream_types=None, callback=None, index=False):
     # note: hope that we get an IncrementalParser,
     # or JMI log parsing won't work
     parser = sax.make_parser()
-    handler = ContentHandler()
+    handler = ContentHandler(stream_types, callback, index)
     parser.setContentHandler(handler)
     return parser, handler
 
-def parse_xml_log(filename, accept_errors=False):
+def parse_xml_log(filename, accept_errors=False, index=True):
     """
     Parse a pure XML JMI log as created by extract_jmi_log, return the root node.
 
     If accept_errors is True and a parse error occurs, the results of parsing
-    up to that point will be returned.
+    up to that point will be returned. If index is True, the nodes are indexed
+    by type so that find does not need to walk the tree.
     """
-    parser, handler = create_parser()
+    parser, handler = create_parser(index=index)
     try:
         parser.parse(filename)
     except sax.SAXException as e:
@@ -168,15 +232,16 @@ def parse_xml_log(filename, accept_errors=False):
 
 # Support routines to parse JMI logs
 
-def parse_jmi_log(filename, modulename = 'Model', accept_errors=False):
+def parse_jmi_log(filename, modulename = 'Model', accept_errors=False, index=True):
     """
     Parse the XML contents of a JMI log and return the root node.
 
     modulename selects the module as recorded in the beginning of each line by
     FMI Library. If accept_errors is True and a parse error occurs, the
-    results of parsing up to that point will be returned.
+    results of parsing up to that point will be returned. If index is True,
+    the nodes are indexed by type so that find does not need to walk the tree.
     """
-    parser, handler = create_parser()
+    parser, handler = create_parser(index=index)
     try:
         with open(filename, 'r') as f:
             filter_jmi_log(parser.feed, f, modulename)
@@ -191,6 +256,38 @@ def parse_jmi_log(filename, modulename = 'Model', accept_errors=False):
     
     return handler.get_root()
 
+def iterate_jmi_log(filename, types=('EquationSolve',), modulename = 'Model',
+                    accept_errors=False):
+    """
+    Parse the XML contents of a JMI log incrementally and yield each node of
+    the given type(s) as soon as it is complete.
+
+    Only the yielded nodes are kept in memory, so the memory used is bounded by
+    the largest yielded node instead of the whole log. Nodes of the given types
+    inside a yielded node are yielded as part of it. modulename and
+    accept_errors are as for parse_jmi_log.
+    """
+    if isinstance(types, str if python3_flag else basestring):
+        types = (types,)
+    completed = []
+    parser, handler = create_parser(types, completed.append)
+    try:
+        with open(filename, 'r') as f:
+            for text in _filter_jmi_log(f, modulename):
+                parser.feed(text)
+                for node in completed:
+                    yield node
+                del completed[:]
+        parser.close()
+    except sax.SAXException as e:
+        if accept_errors:
+            print('Warning: Failure during parsing of XML JMI log:\n', e)
+            print('Parsed log will be incomplete')
+        else:
+            raise Exception('Failed to parse XML JMI log:\n' + repr(e))
+    for node in completed:
+        yield node
+
 def extract_jmi_log(destfilename, filename, modulename = 'Model'):
     """
     Extract the XML contents of a JMI log and write as a new file destfilename.
@@ -203,7 +300,12 @@ def extract_jmi_log(destfilename, filename, modulename = 'Model'):
             filter_jmi_log(destfile.write, sourcefile, modulename)
 
 def filter_jmi_log(write, sourcefile, modulename = 'Model'):
-    write('<?xml version="1.0" encoding="UTF-8"?>\n<JMILog category="info">\n')
+    for text in _filter_jmi_log(sourcefile, modulename):
+        write(text)
+
+def _filter_jmi_log(sourcefile, modulename = 'Model'):
+    """Yield the XML contents of a JMI log piece by piece."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n<JMILog category="info">\n'
 
     pre_re = r'FMIL: module = ' + modulename + r', log level = ([0-9]+): \[([^]]+)\]\[FMU status:([^]]+)\] '
     pre_pattern = re.compile(pre_re)
@@ -212,6 +314,7 @@ def filter_jmi_log(write, sourcefile, modulename = 'Model'):
         m = pre_pattern.match(line)
         if m is not None:
             # log_level, category, fmu_status = m.groups()
-            write(line[m.end():])
+            yield line[m.end():]
+
+    yield '</JMILog>\n'
 
-    write('</JMILog>\n')
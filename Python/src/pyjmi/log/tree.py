@@ -20,6 +20,8 @@ Tree representation for the new JModelica FMU log format
 Each node is represented as a Node, Comment, or leaf (other types)
 """
 
+from bisect import bisect_left, bisect_right
+from operator import attrgetter
 from pyjmi.common import python3_flag
 class Comment(object):
     """Log comment node.
@@ -27,6 +29,8 @@ class Comment(object):
     Attributes:
     text -- the comment text without enclosing braces {}
     """
+    __slots__ = ('text',)
+
     def __init__(self, text):
         self.text = text
 
@@ -39,44 +43,81 @@ class Node(object):
     Attributes:
     type  -- a string
     nodes -- a list of child nodes, in order
+    keys  -- a list with the key of each child node, or None
+    dict  -- a dict from key to child node
+
+    To save memory, keys and dict are only stored for nodes with keyed
+    children.
     """
+    __slots__ = ('type', 'nodes', '_keys', '_dict', '_index', '_start', '_end')
 
     def __init__(self, node_type):
         self.type  = node_type
         self.nodes = []
-        self.keys  = []
-        self.dict  = {}
+        self._keys = None
+        self._dict = None
+        # Set by NodeIndex when the node is indexed
+        self._index = None
+        self._start = self._end = None
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            return [None]*len(self.nodes)
+        return self._keys
+
+    @property
+    def dict(self):
+        if self._dict is None:
+            self._dict = {}
+        return self._dict
 
     def add(self, node, key=None):
-        self.keys.append(key)
+        if self._index is not None:
+            # The index does not contain the new node
+            self._index.valid = False
         self.nodes.append(node)
-        if key is not None:
-            if key in self.dict:
-                # Duplicate attribute value ==> record no value. (should not happen)
-                # consider: Is None the best to use for this?
-                self.dict[key] = None
-            else:
-                self.dict[key] = node
+        if key is None:
+            if self._keys is not None:
+                self._keys.append(key)
+            return
+        if self._keys is None:
+            self._keys = [None]*(len(self.nodes) - 1)
+        self._keys.append(key)
+        d = self.dict
+        if key in d:
+            # Duplicate attribute value ==> record no value. (should not happen)
+            # consider: Is None the best to use for this?
+            d[key] = None
+        else:
+            d[key] = node
 
     def __repr__(self):
         return ('<' + self.type + ' node with ' + repr(len(self.nodes))
-                + ' subnodes, and named subnodes ' + repr(list(self.dict.keys())) + '>')
+                + ' subnodes, and named subnodes ' + repr(list((self._dict or {}).keys())) + '>')
 
 
     def __iter__(self):
         return iter(self.nodes)
 
     def __contains__(self, key):
-        return key in self.dict
+        return self._dict is not None and key in self._dict
 
     def __getitem__(self, key):
-        return self.dict[key]
+        if self._dict is None:
+            raise KeyError(key)
+        return self._dict[key]
 
     def __getattr__(self, name):
+        if name.startswith('_'):
+            # Slots that are not set yet, e.g. when copying
+            raise AttributeError(name)
         return self[name]
 
     def __setitem__(self, key, value):
-         self.dict[key] = value
+        if self._dict is None:
+            self._dict = {}
+        self._dict[key] = value
     
     def find(self, types):
         """
@@ -87,6 +128,9 @@ class Node(object):
         if isinstance(types, str if python3_flag else basestring):
             types = [types]
         
+        if self._index is not None and self._index.valid:
+            return self._index.find(self, types)
+
         nodes = []        
         for node in self.nodes:
             if isinstance(node, Node):
@@ -94,4 +138,62 @@ class Node(object):
                     nodes.append(node)
                 else:
                     nodes.extend(node.find(types))
-        return nodes
\ No newline at end of file
+        return nodes
+
+class NodeIndex(object):
+    """Index of the nodes in a log tree by type.
+
+    The index is built during parsing and lets Node.find look up the nodes of
+    a type in any subtree without walking it. Each node is numbered in the
+    order that it is opened (start) and gets the number of nodes opened when
+    it is closed (end), so the nodes in the subtree of a node are the ones
+    with start numbers between its start and end.
+
+    Attributes:
+    valid -- False if nodes have been added to the tree after it was indexed
+    """
+
+    def __init__(self):
+        self.count = 0
+        # Maps a frozenset of types to a tuple with the list of nodes of
+        # these types and the list of their start numbers, in order
+        self.lists = {}
+        self.valid = True
+
+    def open(self, node):
+        """Add a node when it is opened, before its children."""
+        node._start = self.count
+        self.count += 1
+        key = frozenset((node.type,))
+        if key not in self.lists:
+            self.lists[key] = ([], [])
+        (nodes, starts) = self.lists[key]
+        nodes.append(node)
+        starts.append(node._start)
+
+    def close(self, node):
+        """Complete a node when it is closed, after its children."""
+        node._end   = self.count
+        node._index = self
+
+    def find(self, node, types):
+        """Return the result of node.find(types)."""
+        key = frozenset(types)
+        if key not in self.lists:
+            # Merge the lists of the types, done once for each set of types
+            nodes = []
+            for type in key:
+                nodes.extend(self.lists.get(frozenset((type,)), ([], []))[0])
+            nodes.sort(key=attrgetter('_start'))
+            self.lists[key] = (nodes, [n._start for n in nodes])
+        (nodes, starts) = self.lists[key]
+        found = nodes[bisect_right(starts, node._start):bisect_left(starts, node._end)]
+
+        # Leave out nodes inside other found nodes, like Node.find
+        nodes = []
+        end = -1
+        for n in found:
+            if n._start >= end:
+                nodes.append(n)
+                end = n._end
+        return nodes
@@ -18,155 +18,194 @@
 Utility functions for extracting and filtering FMU logs
 """
 
+import re
+import shutil
+import numpy as N
+
+# The tags of the lines handled by get_structured_fmu_log
+tag_pattern = re.compile(r'\[(NLE_JAC|NLE_SCALING|NLE_ITERS)\]')
+
+# The messages of [NLE_ITERS] lines, in the order that they are handled. A line
+# is handled as each of the messages that it contains, and a line with "exit
+# flag" also as "Newton solver finished".
+iters_messages = ['Model equations evaluation invoked at time:',
+                  'Newton solver invoked',
+                  'Iteration',
+                  'Residuals',
+                  'Limitation',
+                  'Max',
+                  'Initial guess',
+                  'Variable nominal',
+                  'Min',
+                  'Newton solver finished with exit flag',
+                  'Newton solver finished',
+                  'Model equations evaluation finished']
+
+iters_pattern = re.compile('|'.join(re.escape(message) for message in
+                                    sorted(iters_messages, key=len, reverse=True)))
+iters_order = dict((message, i) for (i, message) in enumerate(iters_messages))
+
 def get_structured_fmu_log(log_file):
-    
-    f = open(log_file)
-
-    l = f.readline()
-
-    d = []
-
-    jacs = {}
-    jacs_updated = {}
-    jac_parsing_in_progress = False
-
-    scalings = {}
-    scalings_updated = {}
-
-    while l != '':
-        #print l
-
-        if l.find('[NLE_JAC]')>=0:
-            ll = l.split(';')
-            if not jac_parsing_in_progress:
-                jacs[int(ll[1])] = []
-                jacs_updated[int(ll[1])] = True
-                jac_parsing_in_progress = True
-            jacs[int(ll[1])].append([])
-            for v in ll[5:-1]:
-                jacs[int(ll[1])][-1].append(float(v))
-
-        if l.find('[NLE_JAC]')==-1:
-            jac_parsing_in_progress = False
-
-        if l.find('[NLE_SCALING]')>=0 and l.find('Updating')>=0:
-            ll = l.split(';')
-            scalings[int(ll[1])] = []
-            scalings_updated[int(ll[1])] = True
-            for v in ll[5:-1]:
-                scalings[int(ll[1])].append(float(v))
-
-        if l.find('[NLE_ITERS]')>=0:
-            # Detect a solve has started
-            if l.find('Model equations evaluation invoked at time:')>=0:
-                s = {}
-                ll = l.split(';')
-                s['time'] = float(ll[-1])
-                s['block_solves'] = [] 
-
-            if l.find('Newton solver invoked')>=0:
-                bl = {}
-                bl['names'] = []
-                bl['iterations'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['names'].append(ll[i])
-                bl['block_index'] = int(ll[1])
-                bl['initial_residual_scaling'] = scalings[int(ll[1])]
-                bl['initial_residual_scaling_updated'] = scalings_updated[int(ll[1])]
-                if scalings_updated[int(ll[1])]:
-                    scalings_updated[int(ll[1])] = False
-				
-            if l.find('Iteration')>=0:
-                iteration = {}
-                bl['iterations'].append(iteration)
-                iteration['iteration_variables'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    iteration['iteration_variables'].append(float(ll[i]))
-
-                if len(jacs)>0:
-                    iteration['jacobian'] = jacs[int(ll[1])]
-                    iteration['jacobian_updated'] = jacs_updated[int(ll[1])]
-                    if jacs_updated[int(ll[1])]:
-                        jacs_updated[int(ll[1])] = False
-
-                iteration['residual_scaling'] = scalings[int(ll[1])]
-                iteration['residual_scaling_updated'] = scalings_updated[int(ll[1])]
-                if scalings_updated[int(ll[1])]:
-                    scalings_updated[int(ll[1])] = False
-                    
-            if l.find('Residuals')>=0:
-                iteration['residuals'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    iteration['residuals'].append(float(ll[i]))
-                iteration['scaled_residual_norm'] = float(ll[3])
-                
-            if l.find('Limitation')>=0:
-                iteration['at_bound'] = []
-                l2 = l.split(';')
-                for i in range(5,len(l2)-1):
-                    iteration['at_bound'].append(tuple(l2[i].split()))
-                
-            if l.find('Max')>=0:
-                bl['max'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['max'].append(float(ll[i]))
-
-            if l.find('Initial guess')>=0:
-                bl['initial_guess'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['initial_guess'].append(float(ll[i]))
-
-            if l.find('Variable nominal')>=0:
-                bl['variable_nominal'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['variable_nominal'].append(float(ll[i]))
-
-            if l.find('Min')>=0:
-                bl['min'] = []
-                ll = l.split(';')
-                for i in range(5,len(ll)-1):
-                    bl['min'].append(float(ll[i]))
-
-            if l.find('Newton solver finished with exit flag')>=0:
-                ll = l.split(';')
-                bl['kinsol_exit_flag'] = ll[3]
-
-
-            if l.find('Newton solver finished')>=0:
-                s['block_solves'].append(bl)
-
-            # Detect a solve has ended
-            if l.find('Model equations evaluation finished')>=0:
-                d.append(s)
-
-        l = f.readline()
-
-    return d
-       
+    """
+    Parse the nonlinear solver information in an FMU log and return a list
+    with a dict for each equation solve, see iterate_structured_fmu_log.
+    """
+    return list(iterate_structured_fmu_log(log_file))
+
+def iterate_structured_fmu_log(log_file):
+    """
+    Parse the nonlinear solver information in an FMU log and yield a dict
+    for each equation solve as soon as it is finished. The file is read one
+    line at a time, so only the current solve is kept in memory.
+
+    Each solve has the keys time and block_solves, and each block solve the
+    keys names, block_index, iterations, initial_residual_scaling, max, min,
+    initial_guess, variable_nominal and kinsol_exit_flag as far as they are
+    logged. Numeric values are stored as numpy arrays.
+    """
+    state = _LogState()
+    with open(log_file) as f:
+        for l in f:
+            m = tag_pattern.search(l)
+            if m is None:
+                if state.jac_rows is not None:
+                    state.end_jac()
+                continue
+            tag = m.group(1)
+            if tag == 'NLE_JAC':
+                state.jac_row(l.split(';'))
+                continue
+            if state.jac_rows is not None:
+                state.end_jac()
+            if tag == 'NLE_SCALING':
+                if l.find('Updating')>=0:
+                    state.scaling(l.split(';'))
+                continue
+            found = iters_pattern.findall(l)
+            if len(found) > 1:
+                found = sorted(set(found), key=iters_order.get)
+            for message in found:
+                solve = _iters_handlers[message](state, l.split(';'))
+                if solve is not None:
+                    yield solve
+
+def _values(ll):
+    """Helper function. Returns the values of a split log line as an array."""
+    return N.array(ll[5:-1], dtype=float)
+
+class _LogState(object):
+    """
+    Helper class for iterate_structured_fmu_log. Holds the solve, block
+    solve and iteration currently being parsed, and the latest jacobian and
+    residual scaling of each block.
+    """
+    def __init__(self):
+        self.jacs = {}
+        self.jacs_updated = {}
+        self.jac_rows = None
+        self.jac_block = None
+        self.scalings = {}
+        self.scalings_updated = {}
+        self.solve = None
+        self.block_solve = None
+        self.iteration = None
+
+    def jac_row(self, ll):
+        if self.jac_rows is None:
+            self.jac_rows = []
+            self.jac_block = int(ll[1])
+        self.jac_rows.append(ll[5:-1])
+
+    def end_jac(self):
+        self.jacs[self.jac_block] = N.array(self.jac_rows, dtype=float)
+        self.jacs_updated[self.jac_block] = True
+        self.jac_rows = None
+
+    def scaling(self, ll):
+        self.scalings[int(ll[1])] = _values(ll)
+        self.scalings_updated[int(ll[1])] = True
+
+    def solve_started(self, ll):
+        self.solve = {'time': float(ll[-1]), 'block_solves': []}
+
+    def block_solve_started(self, ll):
+        block = int(ll[1])
+        self.block_solve = bl = {}
+        bl['names'] = ll[5:-1]
+        bl['iterations'] = []
+        bl['block_index'] = block
+        bl['initial_residual_scaling'] = self.scalings[block]
+        bl['initial_residual_scaling_updated'] = self.scalings_updated[block]
+        self.scalings_updated[block] = False
+
+    def iteration_started(self, ll):
+        block = int(ll[1])
+        self.iteration = iteration = {}
+        self.block_solve['iterations'].append(iteration)
+        iteration['iteration_variables'] = _values(ll)
+        if len(self.jacs)>0:
+            iteration['jacobian'] = self.jacs[block]
+            iteration['jacobian_updated'] = self.jacs_updated[block]
+            self.jacs_updated[block] = False
+        iteration['residual_scaling'] = self.scalings[block]
+        iteration['residual_scaling_updated'] = self.scalings_updated[block]
+        self.scalings_updated[block] = False
+
+    def residuals(self, ll):
+        self.iteration['residuals'] = _values(ll)
+        self.iteration['scaled_residual_norm'] = float(ll[3])
+
+    def limitation(self, ll):
+        self.iteration['at_bound'] = [tuple(v.split()) for v in ll[5:-1]]
+
+    def exit_flag(self, ll):
+        self.block_solve['kinsol_exit_flag'] = ll[3]
+        self.block_solve_finished(ll)
+
+    def block_solve_finished(self, ll):
+        self.solve['block_solves'].append(self.block_solve)
+
+    def solve_finished(self, ll):
+        return self.solve
+
+def _block_values(key):
+    """
+    Helper function. Returns a handler that stores the values of a line in
+    the current block solve under key.
+    """
+    def handler(state, ll):
+        state.block_solve[key] = _values(ll)
+    return handler
+
+_iters_handlers = {
+    'Model equations evaluation invoked at time:': _LogState.solve_started,
+    'Newton solver invoked':                       _LogState.block_solve_started,
+    'Iteration':                                   _LogState.iteration_started,
+    'Residuals':                                   _LogState.residuals,
+    'Limitation':                                  _LogState.limitation,
+    'Max':                                         _block_values('max'),
+    'Initial guess':                               _block_values('initial_guess'),
+    'Variable nominal':                            _block_values('variable_nominal'),
+    'Min':                                         _block_values('min'),
+    'Newton solver finished with exit flag':       _LogState.exit_flag,
+    'Newton solver finished':                      _LogState.block_solve_finished,
+    'Model equations evaluation finished':         _LogState.solve_finished}
+
 def FMU_write_log_to_file(log_file, tags=[], file_name='fmu_log.txt'):
-    
-    fi = open(log_file)
-    fo = open(file_name,'w')
-
-    if len(tags)==0:
-    	l = fi.readline()
-    	while l != '':
-            fo.write(l)
-            l = fi.readline()
-			    
-    else:
-    	l = fi.readline()
-    	while l != '':
-            for tag in tags:
-            	if l.find(tag)>=0:
-                    fo.write(l.split(tag)[1])
-            l = fi.readline()
-
-    fo.close()       
-       
+    """
+    Write the lines of an FMU log that contain any of the given tags to a
+    file, with the text before the tag removed. If no tags are given, the
+    whole log is copied.
+    """
+    with open(log_file) as fi:
+        with open(file_name, 'w') as fo:
+            if len(tags)==0:
+                shutil.copyfileobj(fi, fo)
+            else:
+                # Only the lines matched by any tag need to be split
+                pattern = re.compile('|'.join(re.escape(tag) for tag in tags))
+                for l in fi:
+                    if pattern.search(l):
+                        for tag in tags:
+                            if l.find(tag)>=0:
+                                fo.write(l.split(tag)[1])
@@ -22,6 +22,7 @@ Module containing the CasADi interface Python wrappers.
 import struct
 import logging
 import codecs
+import shutil
 import operator
 import itertools
 import time
@@ -29,7 +30,9 @@ import copy
 import types
 import math
 import os
-from os import system, path
+import hashlib
+import subprocess
+from os import path
 from operator import sub
 from collections import OrderedDict, Iterable
 from scipy.sparse import csc_matrix, csr_matrix
@@ -49,6 +52,7 @@ from pyjmi.common.core import TrajectoryLinearInterpolation
 from pyjmi.common.core import TrajectoryUserFunction
 
 from pyjmi.common.io import VariableNotFoundError as jmiVariableNotFoundError
+from pyjmi.common.io import Trajectory
 from pyjmi.casadi_interface import convert_casadi_der_name
 
 #Check to see if pyfmi is installed so that we also catch the error generated
@@ -978,6 +982,11 @@ class LocalDAECollocator(CasadiCollocator):
             raise CasadiCollocatorException("Unknown discretization scheme %s."
                                             % self.discr)
         self.warm_start = False
+        self._shift_interpolation_data = None
+        self._point_indices = None
+        self._point_times = None
+        self._element_indices = {}
+        self._basis_matrices = {}
         # Get to work
         self._create_nlp()
 
@@ -992,24 +1001,40 @@ class LocalDAECollocator(CasadiCollocator):
         """
         Solve the nonlinear program and write the results to a file.
         Called e.g. by LocalDAECollocationAlg.solve.
+
+        If the option write_result_file is False, the result data is kept in
+        memory instead of being written to file.
         """
         t0 = time.clock()
         # todo: account for preprocessing time within solve_nlp separately?
         self.times['sol'] = self.solve_nlp()
-        self.result_file_name = self.export_result_dymola(self.result_file_name)
+        if self.write_result_file:
+            self.result_file_name = self.export_result_dymola(
+                    self.result_file_name)
+            self._result_data = None
+        else:
+            self._result_data = self.get_result_data()
         self.times['post_processing'] = time.clock() - t0 - self.times['sol'] - self.extra_update
 
     def get_result_object(self, include_init = True):
         """ 
         Load result data saved in e.g. solve_and_write_result and create a LocalDAECollocationAlgResult object.
 
+        If the result data was kept in memory (write_result_file is False),
+        no file is read and the result_file attribute of the result object
+        is None.
+
         Returns::
 
             The LocalDAECollocationAlgResult object.
         """
         t0 = time.clock()
-        resultfile = self.result_file_name
-        res = ResultDymolaTextual(resultfile)
+        if getattr(self, '_result_data', None) is None:
+            resultfile = self.result_file_name
+            res = ResultDymolaTextual(resultfile)
+        else:
+            resultfile = None
+            res = self._result_data
 
         # Get optimized element lengths
         h_opt = self.get_h_opt()
@@ -4447,12 +4472,10 @@ class LocalDAECollocator(CasadiCollocator):
         Create interpolated initial trajectories.
         """
         if self.init_traj is not None:
-            n = len(self.init_traj.get_data_matrix()[:, 0])
             self.init_traj_interp = traj = {}
 
             for vt in ["dx", "x", "w", "unelim_u"]:
                 for var in self.mvar_vectors[vt]:
-                    data_matrix = N.empty([n, len(self.mvar_vectors[vt])])
                     name = var.getName()
                     try:
                         data = self.init_traj.get_variable_data(name)
@@ -4494,6 +4517,71 @@ class LocalDAECollocator(CasadiCollocator):
                         (self._denorm_tf_init - self._denorm_t0_init) * time)
             return self.init_traj_interp[var].eval(time)
 
+    def _get_points(self):
+        """
+        Get the collocation points (i, k) in the order of the time points.
+        """
+        return [(i, k) for i in range(1, self.n_e + 1)
+                for k in sorted(self.time_points[i].keys())]
+
+    def _get_point_indices(self):
+        """
+        Get the NLP variable indices of the variables at all collocation
+        points.
+
+        Returns a dictionary with an integer array of shape
+        (number of points, n_var[vt]) for each variable type vt in 'dx', 'x',
+        'w' and 'unelim_u'. Row j holds the indices at the point given by
+        self._get_points()[j].
+        """
+        if self._point_indices is None:
+            points = self._get_points()
+            self._point_indices = {}
+            for vt in ['dx', 'x', 'w', 'unelim_u']:
+                if vt not in self.var_indices:
+                    continue
+                inds = N.array([self.var_indices[vt][i][k]
+                                for (i, k) in points], dtype=int)
+                self._point_indices[vt] = inds.reshape(
+                    [len(points), self.n_var[vt]])
+        return self._point_indices
+
+    def _get_variant_scaling_at_points(self):
+        """
+        Get the time-variant scaling factors at all collocation points.
+
+        Returns an array of shape (number of points, number of variables with
+        time-variant scaling), or None if variable scaling is not used.
+        """
+        if not self.variable_scaling:
+            return None
+        points = self._get_points()
+        n_variant = len([var_name for var_name in self._is_variant 
+                         if self._is_variant[var_name]])
+        if n_variant == 0:
+            return N.empty([len(points), 0])
+        return N.array([self._variant_sf[i][k] for (i, k) in points])
+
+    def _eval_initial_at_points(self, var):
+        """
+        Evaluate initial values of Variable var at all collocation points.
+
+        The points are ordered as in self._get_points().
+        self._create_initial_trajectories() must have been called first.
+        """
+        if self.init_traj is None:
+            return self.op.get_attr(var, "initialGuess")
+        else:
+            if self._point_times is None:
+                self._point_times = N.array(
+                    [self.time_points[i][k] for (i, k) in self._get_points()],
+                    dtype=float)
+            time = self._point_times
+            if self._normalize_min_time:
+                time = (self._denorm_t0_init +
+                        (self._denorm_tf_init - self._denorm_t0_init) * time)
+            return self.init_traj_interp[var].eval(time).reshape(-1)
+
     def _compute_bounds_and_init(self):
         """
         Compute bounds and intial guesses for NLP variables.
@@ -4543,78 +4631,52 @@ class LocalDAECollocator(CasadiCollocator):
         xx_ub[self.var_indices['p_opt']] = p_max
         xx_init[self.var_indices['p_opt']] = p_init
 
-        # Manipulate initial trajectories
-        if self.init_traj is not None:
-            n = len(self.init_traj.get_data_matrix()[:, 0])
-            traj = {}
-
-            for vt in ["dx", "x", "w", "unelim_u"]:
-                traj[vt] = {}
-                for var in mvar_vectors[vt]:
-                    name = var.getName()
-                    (var_index, _) = name_map[name]
-                    if name == "startTime":
-                        abscissae = N.array([0])
-                        ordinates = N.array([[self._denorm_t0_init]])
-                    elif name == "finalTime":
-                        abscissae = N.array([0])
-                        ordinates = N.array([[self._denorm_tf_init]])
-                    else:
-                        try:
-                            data = self.init_traj.get_variable_data(name)
-                        except VariableNotFoundError:
-                            if self.options['verbosity'] >= 2:
-                                print(("Warning: Could not find initial " +
-                                      "trajectory for variable " + name +
-                                      ". Using initialGuess attribute value " +
-                                      "instead."))
-                            ordinates = N.array([[
-                                op.get_attr(var, "initialGuess")]])
-                            abscissae = N.array([0])
-                        else:
-                            abscissae = N.asarray(data.t)
-                            ordinates = N.asarray(data.x).reshape([-1, 1])
-                        traj[vt][var_index] = TrajectoryLinearInterpolation(
-                            abscissae, ordinates)
-
         # Denormalize time for minimum time problems
         if self._normalize_min_time:
             t0 = self._denorm_t0_init
             tf = self._denorm_tf_init
 
         # Set bounds and initial guesses
+        point_indices = self._get_point_indices()
+        variant_sf = self._get_variant_scaling_at_points()
         for vt in ['dx', 'x', 'w', 'unelim_u']:
             for var in mvar_vectors[vt]:
                 name = var.getName()
                 v_min = op.get_attr(var, "min")
                 v_max = op.get_attr(var, "max")
                 (var_idx, _) = name_map[name]
-                
-                for i in range(1, self.n_e + 1):
-                    for k in list(self.time_points[i].keys()):
-                        
-                        #Get scaling factors
-                        d, e = self._get_affine_scaling(name, i, k)
-                        
-                        #Scale bounds and init
-                        v_init = self._eval_initial(var, i, k)
-                        if self._normalize_min_time and vt == "dx":
-                            if N.isfinite([v_min, v_max]).any():
-                                return NotImplementedError('State derivative bounds are not supported for problems ' +
-                                                           'with free time horizons.')
-                            v_init *= (tf - t0)
-                        xx_lb[self.var_indices[vt][i][k][var_idx]] = (v_min - e) / d
-                        xx_ub[self.var_indices[vt][i][k][var_idx]] = (v_max - e) / d
-                        xx_init[self.var_indices[vt][i][k][var_idx]] = (v_init - e) / d
+                inds = point_indices[vt][:, var_idx]
+
+                #Get scaling factors
+                if (self.variable_scaling and 
+                    self._using_variant_variable_scaling(name)):
+                    d = variant_sf[:, self._name_idx_sf_map[name]]
+                    e = 0.0
+                else:
+                    d, e = self._get_affine_scaling(name, -1, -1)
+
+                #Scale bounds and init
+                v_init = self._eval_initial_at_points(var)
+                if self._normalize_min_time and vt == "dx":
+                    if N.isfinite([v_min, v_max]).any():
+                        return NotImplementedError('State derivative bounds are not supported for problems ' +
+                                                   'with free time horizons.')
+                    v_init = v_init * (tf - t0)
+                xx_lb[inds] = (v_min - e) / d
+                xx_ub[inds] = (v_max - e) / d
+                xx_init[inds] = (v_init - e) / d
 
         # Set bounds and initial guesses for continuity variables
-        if not self.eliminate_cont_var:
+        if not self.eliminate_cont_var and self.n_e > 1:
             vt = 'x'
             k = self.n_cp + self.is_gauss
-            for i in range(2, self.n_e + 1):
-                xx_lb[self.var_indices[vt][i][0]]   = xx_lb[self.var_indices[vt][i - 1][k]]
-                xx_ub[self.var_indices[vt][i][0]]   = xx_ub[self.var_indices[vt][i - 1][k]]
-                xx_init[self.var_indices[vt][i][0]] = xx_init[self.var_indices[vt][i - 1][k]]
+            dest = N.array([self.var_indices[vt][i][0]
+                            for i in range(2, self.n_e + 1)], dtype=int)
+            src = N.array([self.var_indices[vt][i - 1][k]
+                           for i in range(2, self.n_e + 1)], dtype=int)
+            xx_lb[dest] = xx_lb[src]
+            xx_ub[dest] = xx_ub[src]
+            xx_init[dest] = xx_init[src]
 
         # Compute bounds and initial guesses for element lengths
         if self.hs == "free":
@@ -4782,6 +4844,73 @@ class LocalDAECollocator(CasadiCollocator):
         else:
             return self.var_map['elim_u'][i][k]['all']
 
+    def _get_element_indices(self, vt, ks):
+        """
+        Get the NLP variable indices of the variables of type vt at the
+        points ks of every element.
+
+        Returns an integer array of shape (n_e, len(ks), n_var[vt]).
+        """
+        key = (vt, tuple(ks))
+        if key not in self._element_indices:
+            inds = N.array([[self.var_indices[vt][i][k] for k in ks]
+                            for i in range(1, self.n_e + 1)], dtype=int)
+            self._element_indices[key] = inds.reshape(
+                [self.n_e, len(ks), self.n_var[vt]])
+        return self._element_indices[key]
+
+    def _get_basis_matrices(self, tau):
+        """
+        Evaluate the Lagrange basis polynomials at the normalized times tau.
+
+        Returns::
+
+            basis_cont --
+                Array of shape (len(tau), n_cp + 1) with the basis
+                polynomials that include the interpolation point at tau = 0.
+
+            basis --
+                Array of shape (len(tau), n_cp) with the basis polynomials
+                that do not include the interpolation point at tau = 0.
+
+            basis_der --
+                Array of shape (len(tau), n_cp + 1) with the derivatives of
+                the polynomials in basis_cont.
+        """
+        key = tuple(tau)
+        if key not in self._basis_matrices:
+            pol = self.pol
+            n_tau = len(key)
+            basis_cont = N.array([[pol.eval_basis(k, t, True)
+                                   for k in range(self.n_cp + 1)]
+                                  for t in key], dtype=float)
+            basis = N.array([[pol.eval_basis(k, t, False)
+                              for k in range(1, self.n_cp + 1)]
+                             for t in key], dtype=float)
+            basis_der = N.array([[pol.eval_basis_der(k, t)
+                                  for k in range(self.n_cp + 1)]
+                                 for t in key], dtype=float)
+            self._basis_matrices[key] = (
+                basis_cont.reshape([n_tau, self.n_cp + 1]),
+                basis.reshape([n_tau, self.n_cp]),
+                basis_der.reshape([n_tau, self.n_cp + 1]))
+        return self._basis_matrices[key]
+
+    def _get_elim_u_result_at_points(self, points):
+        """
+        Return an array with the values of eliminated inputs at the points
+        (i, k) in points, with one row per point.
+        """
+        if self.n_var['elim_u'] == 0:
+            return N.empty([len(points), 0])
+        if self.mutable_external_data:
+            inds = N.array([self.var_indices['elim_u'][i][k]
+                            for (i, k) in points], dtype=int)
+            return self._par_vals[inds]
+        else:
+            return N.array([N.array(self._get_elim_u_result(i, k)).reshape(-1)
+                            for (i, k) in points])
+
     def get_result(self):
         # Set model info
         n_var = self.n_var
@@ -4862,28 +4991,29 @@ class LocalDAECollocator(CasadiCollocator):
         var_opt['p_fixed'] = self._par_vals[0:self.n_var['p_fixed']]
 
         # Rescale solution
-        time_points = self.get_time_points()
+        points = self._get_points()
+        point_indices = self._get_point_indices()
         if self.variable_scaling and not self.write_scaled_result:
-            for i in range(1, self.n_e + 1):
-                for k in time_points[i]:
-                    for var_type in var_types:
-                        for var in mvar_vectors[var_type]:
-                            name = var.getName()
-                            if (var_type != "unelim_u" or
-                                self.blocking_factors is None or
-                                name not in self.blocking_factors.factors):
-                                
-                                (ind, _) = name_map[name]
-                                global_ind = self.var_indices[var_type][i][k][ind]
-                                xx_i_k = primal_opt[global_ind]
-                                
-                                #Get the scaling factors
-                                d, e = self._get_affine_scaling(name, i, k)
-                                
-                                #Compute the unscaled value
-                                xx_i_k = d * xx_i_k + e
-                                
-                                primal_opt[global_ind] = xx_i_k
+            variant_sf = self._get_variant_scaling_at_points()
+            for var_type in var_types:
+                for var in mvar_vectors[var_type]:
+                    name = var.getName()
+                    if (var_type != "unelim_u" or
+                        self.blocking_factors is None or
+                        name not in self.blocking_factors.factors):
+                        
+                        (ind, _) = name_map[name]
+                        global_inds = point_indices[var_type][:, ind]
+                        
+                        #Get the scaling factors
+                        if self._using_variant_variable_scaling(name):
+                            d = variant_sf[:, self._name_idx_sf_map[name]]
+                            e = 0.0
+                        else:
+                            d, e = self._get_affine_scaling(name, -1, -1)
+                        
+                        #Compute the unscaled values
+                        primal_opt[global_inds] = d * primal_opt[global_inds] + e
 
         # Rescale inputs with blocking factors
         if (self.variable_scaling and not self.write_scaled_result and
@@ -4909,164 +5039,131 @@ class LocalDAECollocator(CasadiCollocator):
 
         # Rescale continuity variables
         if (self.variable_scaling and not self.eliminate_cont_var and
-            not self.write_scaled_result):
-            for i in range(1, self.n_e):
-                k = self.n_cp + self.is_gauss
-                x_i_k = primal_opt[self.var_indices['x'][i][k]]
-                primal_opt[self.var_indices['x'][i + 1][0]] = x_i_k
+            not self.write_scaled_result and self.n_e > 1):
+            k = self.n_cp + self.is_gauss
+            x_end = self._get_element_indices('x', [k])[:-1, 0, :]
+            x_start = self._get_element_indices('x', [0])[1:, 0, :]
+            primal_opt[x_start] = primal_opt[x_end]
         if (self.is_gauss and self.variable_scaling and 
             not self.eliminate_cont_var and not self.write_scaled_result):
+            x_0 = primal_opt[self._get_element_indices('x', [0])[:, 0, :]]
             if self.quadrature_constraint:
-                for i in range(1, self.n_e + 1):
-                    # Evaluate x_{i, n_cp + 1} based on quadrature
-                    x_i_np1 = 0
-                    for k in range(1, self.n_cp + 1):
-                        dx_i_k = primal_opt[self.var_indices['dx'][i][k]]
-                        x_i_np1 += self.pol.w[k] * dx_i_k
-                    x_i_np1 = (primal_opt[self.var_indices['x'][i][0]] + 
-                               self.horizon * self.h[i] * x_i_np1)
-
-                    # Rescale x_{i, n_cp + 1}
-                    primal_opt[self.var_indices['x'][i][self.n_cp + 1]] = x_i_np1
+                # Evaluate x_{i, n_cp + 1} based on quadrature
+                dx = primal_opt[self._get_element_indices(
+                    'dx', list(range(1, self.n_cp + 1)))]
+                x_np1 = x_0 + (h_scaled[1:].reshape([-1, 1]) *
+                               N.einsum('k,ekv->ev', self.pol.w[1:], dx))
             else:
-                for i in range(1, self.n_e + 1):
-                    # Evaluate x_{i, n_cp + 1} based on polynomial x_i
-                    x_i_np1 = 0
-                    for k in range(self.n_cp + 1):
-                        x_i_k = primal_opt[self.var_indices['x'][i][k]]
-                        x_i_np1 += x_i_k * self.pol.eval_basis(k, 1, True)
-
-                    # Rescale x_{i, n_cp + 1}
-                    primal_opt[self.var_indices['x'][i][self.n_cp + 1]] = x_i_np1
+                # Evaluate x_{i, n_cp + 1} based on polynomial x_i
+                (basis_cont, _, _) = self._get_basis_matrices([1.])
+                x = primal_opt[self._get_element_indices(
+                    'x', list(range(self.n_cp + 1)))]
+                x_np1 = N.einsum('k,ekv->ev', basis_cont[0], x)
+
+            # Rescale x_{i, n_cp + 1}
+            x_np1_inds = self._get_element_indices('x', [self.n_cp + 1])
+            primal_opt[x_np1_inds[:, 0, :]] = x_np1
                     
         
         # Get solution trajectories
-        t_index = 0
         if self.result_mode == "collocation_points":
-            for i in range(1, self.n_e + 1):
-                for k in time_points[i]:
-                    for var_type in var_types:
-                        xx_i_k = primal_opt[self.var_indices[var_type][i][k]]
-                        var_opt[var_type][t_index, :] = xx_i_k.reshape(-1)
-                    var_opt['elim_u'][t_index, :] = self._get_elim_u_result(i, k)
-                    t_index += 1
+            for var_type in var_types:
+                var_opt[var_type][:, :] = primal_opt[point_indices[var_type]]
+            var_opt['elim_u'][:, :] = self._get_elim_u_result_at_points(points)
             if self.eliminate_der_var:
                 # dx_1_0
-                t_index = 0
-                i = 1
-                k = 0
-                dx_i_k = primal_opt[self.var_indices['dx'][i][k]]
-                var_opt['dx'][t_index, :] = dx_i_k.reshape(-1)
-                t_index += 1
+                dx_1_0 = primal_opt[self.var_indices['dx'][1][0]]
+                var_opt['dx'][0, :] = dx_1_0.reshape(-1)
 
                 # Collocation point derivatives
-                for i in range(1, self.n_e + 1):
-                    for k in range(1, self.n_cp + 1):
-                        dx_i_k = 0
-                        for l in range(self.n_cp + 1):
-                            x_i_l = primal_opt[self.var_indices['x'][i][l]]
-                            dx_i_k += (1. / h_scaled[i] * x_i_l * 
-                                       self.pol.eval_basis_der(
-                                           l, self.pol.p[k]))
-                        var_opt['dx'][t_index, :] = dx_i_k.reshape(-1)
-                        t_index += 1
+                (_, _, basis_der) = self._get_basis_matrices(
+                    self.pol.p[1:self.n_cp + 1])
+                x = primal_opt[self._get_element_indices(
+                    'x', list(range(self.n_cp + 1)))]
+                dx = (N.einsum('tk,ekv->etv', basis_der, x) /
+                      h_scaled[1:].reshape([-1, 1, 1]))
+                var_opt['dx'][1:self.n_e * self.n_cp + 1, :] = \
+                    dx.reshape([self.n_e * self.n_cp, n_var['x']])
         elif self.result_mode == "element_interpolation":
             tau_arr = N.linspace(0, 1, self.n_eval_points)
-            for i in range(1, self.n_e + 1):
-                for tau in tau_arr:
-                    # Non-derivatives and uneliminated inputs
-                    for var_type in ['x', 'unelim_u', 'w']:
-                        # Evaluate xx_i_tau based on polynomial xx^i
-                        xx_i_tau = 0
-                        for k in range(not cont[var_type], self.n_cp + 1):
-                            xx_i_k = primal_opt[self.var_indices[var_type][i][k]]
-                            xx_i_tau += xx_i_k * self.pol.eval_basis(
-                                k, tau, cont[var_type])
-                        var_opt[var_type][t_index, :] = xx_i_tau.reshape(-1)
-
-                    # eliminated inputs
-                    xx_i_tau = 0
-                    for k in range(not cont[var_type], self.n_cp + 1):
-                        xx_i_k = self._get_elim_u_result(i, k)
-                        xx_i_tau += xx_i_k * self.pol.eval_basis(
-                            k, tau, cont[var_type])
-                    var_opt['elim_u'][t_index, :] = xx_i_tau.reshape(-1)
-
-                    # Derivatives
-                    dx_i_tau = 0
-                    for k in range(self.n_cp + 1):
-                        x_i_k = primal_opt[self.var_indices['x'][i][k]]
-                        dx_i_tau += (1. / h_scaled[i] * x_i_k * 
-                                     self.pol.eval_basis_der(k, tau))
-                    var_opt['dx'][t_index, :] = dx_i_tau.reshape(-1)
-
-                    t_index += 1
+            (basis_cont, basis, basis_der) = self._get_basis_matrices(tau_arr)
+
+            # Non-derivatives and uneliminated inputs
+            for var_type in ['x', 'unelim_u', 'w']:
+                # Evaluate xx_i_tau based on polynomial xx^i
+                ks = list(range(not cont[var_type], self.n_cp + 1))
+                xx = primal_opt[self._get_element_indices(var_type, ks)]
+                if cont[var_type]:
+                    xx_tau = N.einsum('tk,ekv->etv', basis_cont, xx)
+                else:
+                    xx_tau = N.einsum('tk,ekv->etv', basis, xx)
+                var_opt[var_type][:, :] = xx_tau.reshape(var_opt[var_type].shape)
+
+            # eliminated inputs
+            elim_u = self._get_elim_u_result_at_points(
+                [(i, k) for i in range(1, self.n_e + 1)
+                 for k in range(1, self.n_cp + 1)])
+            elim_u = elim_u.reshape([self.n_e, self.n_cp, n_var['elim_u']])
+            elim_u_tau = N.einsum('tk,ekv->etv', basis, elim_u)
+            var_opt['elim_u'][:, :] = elim_u_tau.reshape(var_opt['elim_u'].shape)
+
+            # Derivatives
+            x = primal_opt[self._get_element_indices(
+                'x', list(range(self.n_cp + 1)))]
+            dx_tau = (N.einsum('tk,ekv->etv', basis_der, x) /
+                      h_scaled[1:].reshape([-1, 1, 1]))
+            var_opt['dx'][:, :] = dx_tau.reshape(var_opt['dx'].shape)
         elif self.result_mode == "mesh_points":
             # Start time
             i = 1
             k = 0
             for var_type in var_types:
                 xx_i_k = primal_opt[self.var_indices[var_type][i][k]]
-                var_opt[var_type][t_index, :] = xx_i_k.reshape(-1)
-            var_opt['elim_u'][t_index, :] = self._get_elim_u_result(i, k)
-            t_index += 1
+                var_opt[var_type][0, :] = xx_i_k.reshape(-1)
+            var_opt['elim_u'][0, :] = self._get_elim_u_result(i, k)
             k = self.n_cp + self.is_gauss
 
             # Mesh points
-            var_types.remove('x')
+            mesh_points = [(i, k) for i in range(1, self.n_e + 1)]
             if self.discr == "LGR":
-                for i in range(1, self.n_e + 1):
-                    for var_type in var_types:
-                        xx_i_k = primal_opt[self.var_indices[var_type][i][k]]
-                        var_opt[var_type][t_index, :] = xx_i_k.reshape(-1)
-                    u_i_k = self._get_elim_u_result(i, k)
-                    var_opt['elim_u'][t_index, :] = u_i_k.reshape(-1)
-                    t_index += 1
+                for var_type in var_types:
+                    if var_type != 'x':
+                        inds = self._get_element_indices(var_type, [k])
+                        var_opt[var_type][1:, :] = primal_opt[inds[:, 0, :]]
+                var_opt['elim_u'][1:, :] = \
+                    self._get_elim_u_result_at_points(mesh_points)
             elif self.discr == "LG":
-                for i in range(1, self.n_e + 1):
-                    for var_type in var_types:
-                        # Evaluate xx_{i, n_cp + 1} based on polynomial xx_i
-                        xx_i_k = 0
-                        for l in range(1, self.n_cp + 1):
-                            xx_i_l = primal_opt[self.var_indices[var_type][i][l]]
-                            xx_i_k += xx_i_l * self.pol.eval_basis(l, 1, False)
-                        var_opt[var_type][t_index, :] = xx_i_k.reshape(-1)
-                    # Evaluate u_{i, n_cp + 1} based on polynomial u_i
-                    u_i_k = 0
-                    for l in range(1, self.n_cp + 1):
-                        u_i_l = self._get_elim_u_result(i, l)
-                        u_i_k += u_i_l * self.pol.eval_basis(l, 1, False)
-                    var_opt['elim_u'][t_index, :] = u_i_k.reshape(-1)
-                    t_index += 1
-            var_types.insert(0, 'x')
+                # Evaluate xx_{i, n_cp + 1} based on polynomial xx_i
+                (_, basis, _) = self._get_basis_matrices([1.])
+                ks = list(range(1, self.n_cp + 1))
+                for var_type in var_types:
+                    if var_type != 'x':
+                        xx = primal_opt[self._get_element_indices(var_type, ks)]
+                        var_opt[var_type][1:, :] = N.einsum(
+                            'k,ekv->ev', basis[0], xx)
+                # Evaluate u_{i, n_cp + 1} based on polynomial u_i
+                elim_u = self._get_elim_u_result_at_points(
+                    [(i, l) for i in range(1, self.n_e + 1) for l in ks])
+                elim_u = elim_u.reshape([self.n_e, self.n_cp, n_var['elim_u']])
+                var_opt['elim_u'][1:, :] = N.einsum('k,ekv->ev', basis[0],
+                                                    elim_u)
 
             # Handle states separately
-            t_index = 1
-            for i in range(1, self.n_e + 1):
-                x_i_k = primal_opt[self.var_indices['x'][i][k]]
-                var_opt['x'][t_index, :] = x_i_k.reshape(-1)
-                t_index += 1
+            x_inds = self._get_element_indices('x', [k])
+            var_opt['x'][1:, :] = primal_opt[x_inds[:, 0, :]]
 
             # Handle state derivatives separately
             if self.eliminate_der_var:
                 # dx_1_0
-                t_index = 0
-                i = 1
-                k = 0
-                dx_i_k = primal_opt[self.var_indices['dx'][i][k]]
-                var_opt['dx'][t_index, :] = dx_i_k.reshape(-1)
-                t_index += 1
+                dx_1_0 = primal_opt[self.var_indices['dx'][1][0]]
+                var_opt['dx'][0, :] = dx_1_0.reshape(-1)
 
                 # Mesh point state derivatives
-                t_index = 1
-                for i in range(1, self.n_e + 1):
-                    dx_i_k = 0
-                    for l in range(self.n_cp + 1):
-                        x_i_l = primal_opt[self.var_indices['x'][i][l]]
-                        dx_i_k += (1. / h_scaled[i] * x_i_l * 
-                                   self.pol.eval_basis_der(l, 1.))
-                    var_opt['dx'][t_index, :] = dx_i_k.reshape(-1)
-                    t_index += 1
+                (_, _, basis_der) = self._get_basis_matrices([1.])
+                x = primal_opt[self._get_element_indices(
+                    'x', list(range(self.n_cp + 1)))]
+                var_opt['dx'][1:, :] = (N.einsum('k,ekv->ev', basis_der[0], x) /
+                                        h_scaled[1:].reshape([-1, 1]))
         else:
             raise CasadiCollocatorException("Unknown result mode %s." %
                                             self.result_mode)
@@ -5082,18 +5179,11 @@ class LocalDAECollocator(CasadiCollocator):
         if self.result_mode == "collocation_points":
             u_opt = var_opt['merged_u']
         else:
-            t_index = 0
-            u_opt = N.empty([self.n_e * self.n_cp + 1 + self.is_gauss,
-                             self.n_var['u']])
-            for i in range(1, self.n_e + 1):
-                for k in time_points[i]:
-                    unelim_u_i_k = primal_opt[self.var_indices['unelim_u'][i][k]]
-                    u_opt[t_index, self._unelim_input_indices] = \
-                        unelim_u_i_k.reshape(-1)
-                    elim_u_i_k = self._get_elim_u_result(i, k)
-                    u_opt[t_index, self._elim_input_indices] = \
-                        elim_u_i_k.reshape(-1)
-                    t_index += 1
+            u_opt = N.empty([len(points), self.n_var['u']])
+            u_opt[:, self._unelim_input_indices] = \
+                primal_opt[point_indices['unelim_u']]
+            u_opt[:, self._elim_input_indices] = \
+                self._get_elim_u_result_at_points(points)
         self._u_opt = u_opt
 
         # Denormalize minimum time problem
@@ -5155,6 +5245,115 @@ class LocalDAECollocator(CasadiCollocator):
         else:
             return None
 
+    def get_shift_indices(self, n_shift=1):
+        """
+        Compute an index vector that shifts NLP variable vectors a number of
+        elements backwards in time.
+
+        The returned indices are intended to be used as
+        xx_shifted = xx[indices], where xx is laid out like primal_opt or
+        dual_opt['x']. Each variable value at point (i, k) is taken from
+        point (i + n_shift, k). Points that are shifted in from beyond the
+        end of the horizon are extrapolated with the value at the last
+        point. Free parameters and element lengths are not shifted.
+
+        Parameters::
+
+            n_shift --
+                The number of elements to shift.
+                Default: 1
+
+        Returns::
+
+            indices --
+                Integer array of length n_xx.
+        """
+        if n_shift < 0 or n_shift > self.n_e:
+            raise CasadiCollocatorException(
+                "Can not shift %s elements on a horizon with " % n_shift +
+                "%s elements." % self.n_e)
+        indices = N.arange(self.n_xx)
+        for vk in ['x', 'dx', 'w', 'unelim_u']:
+            if vk not in self.var_indices:
+                continue
+            vi = self.var_indices[vk]
+            tail = vi[self.n_e][max(vi[self.n_e].keys())]
+            for i in range(1, self.n_e + 1):
+                for k in vi[i]:
+                    dest = vi[i][k]
+                    if len(dest) == 0:
+                        continue
+                    src_i = i + n_shift
+                    if src_i > self.n_e:
+                        src = tail
+                    elif k in vi[src_i]:
+                        src = vi[src_i][k]
+                    else:
+                        # Initial point of algebraic variables and inputs
+                        src = vi[src_i - 1][self.n_cp]
+                    indices[dest] = src
+        return indices
+
+    def get_shifted_xx(self, xx, time_shift):
+        """
+        Interpolate an NLP variable vector onto a time grid that is shifted
+        forward in time.
+
+        The value of each variable at the time point t of the collocation
+        grid is set to the value of the variable in xx at t + time_shift,
+        using linear interpolation between the points of the grid. Points
+        that are shifted in from beyond the end of the horizon get the value
+        at the last point. Free parameters and element lengths are not
+        shifted.
+
+        Parameters::
+
+            xx --
+                NLP variable vector laid out like primal_opt.
+
+            time_shift --
+                The time to shift the grid forward, relative to the time
+                points of the collocation grid.
+
+        Returns::
+
+            xx_shifted --
+                The interpolated NLP variable vector.
+        """
+        if self._shift_interpolation_data is None:
+            self._shift_interpolation_data = []
+            t_start = self.time_points[1][0]
+            for vk in ['x', 'dx', 'w', 'unelim_u']:
+                if vk not in self.var_indices or self.n_var[vk] == 0:
+                    continue
+                vi = self.var_indices[vk]
+                times = []
+                inds = []
+                for i in range(1, self.n_e + 1):
+                    for k in sorted(vi[i].keys()):
+                        if len(vi[i][k]) == 0:
+                            continue
+                        times.append(self.time_points[i][k] - t_start)
+                        inds.append(vi[i][k])
+                times = N.array(times)
+                order = N.argsort(times, kind='mergesort')
+                self._shift_interpolation_data.append(
+                    (times[order], N.array(inds, dtype=int)[order]))
+
+        xx_shifted = N.array(xx, dtype=float)
+        for (times, inds) in self._shift_interpolation_data:
+            t_new = N.clip(times + time_shift, times[0], times[-1])
+            hi = N.clip(N.searchsorted(times, t_new, side='right'),
+                        1, len(times) - 1)
+            lo = hi - 1
+            dt = times[hi] - times[lo]
+            weight = (t_new - times[lo]) / N.where(dt > 0, dt, 1.)
+            weight = weight.reshape([-1, 1])
+            values = xx[inds]
+            xx_shifted[inds] = ((1. - weight) * values[lo] +
+                                weight * values[hi])
+        return xx_shifted
+
     def export_result_dymola(self, file_name='', format='txt', 
                              write_scaled_result=False, result=None):
         """
@@ -5200,169 +5399,108 @@ class LocalDAECollocator(CasadiCollocator):
 
             Currently only textual format is supported.
         """
-        if result is None:
-            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = self.get_result()
-            data = N.hstack((t,dx_opt,x_opt,u_opt,w_opt,elim_vars))
-        else:
-            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = result
-            data = N.hstack((t,dx_opt,x_opt,u_opt,w_opt,elim_vars))
-
         if (format=='txt'):
-            op = self.op
-            name_map = self.name_map
-            mvar_vectors = self.mvar_vectors
-            variable_list = reduce(list.__add__,
-                                   [list(mvar_vectors[vt]) for
-                                    vt in ['p_opt', 'p_fixed',
-                                           'dx', 'x', 'u', 'w']])
-            if result is None:
-                for v in op.getEliminatedVariables():
-                    variable_list.append(v) 
-
-            # Map variable to aliases
-            alias_map = {}
-            for var in variable_list:
-                alias_map[var.getName()] = []
-            for alias_var in op.getAliases():
-                alias = alias_var.getModelVariable()
-                alias_map[alias.getName()].append(alias_var)
-
-            # Set up sections
-            # Put exactly one entry per variable in name_section etc
-            # - its length is used to determine num_vars
-            name_section = ['time\n']
-            description_section = ['Time in [s]\n']
-            data_info_section = ['0 1 0 -1 # time\n']
-
-            # Collect meta information
-            n_variant = 1
-            n_invariant = 1
-            max_name_length = len('Time')
-            max_desc_length = len('Time in [s]')
-            for var in variable_list:
-                # Name
-                name = var.getName()
-                name_section.append('%s\n' % name)
-                if len(name) > max_name_length:
-                    max_name_length = len(name)
-
-                # Description
-                description = op.get_attr(var, "comment")
-                description_section.append('%s\n' % description)
-                if len(description) > max_desc_length:
-                    max_desc_length = len(description)
-
-                # Data info
-                variability = var.getVariability()
-                if variability in [var.PARAMETER, var.CONSTANT]:
-                    n_invariant += 1
-                    data_info_section.append('1 %d 0 -1 # %s\n' %
-                                             (n_invariant, name))
-                else:
-                    n_variant += 1
-                    data_info_section.append('2 %d 0 -1 # %s\n' %
-                                             (n_variant, name))
-
-                # Handle alias variables
-                for alias_var in alias_map[var.getName()]:
-                    # Name
-                    name = alias_var.getName()
-                    name_section.append('%s\n' % name)
-                    if len(name) > max_name_length:
-                        max_name_length = len(name)
-
-                    # Description
-                    description = op.get_attr(alias_var, "comment")
-                    description_section.append('%s\n' % description)
-                    if len(description) > max_desc_length:
-                        max_desc_length = len(description)
-
-                    # Data info
-                    if alias_var.isNegated():
-                        neg = -1
-                    else:
-                        neg = 1
-                    if variability in [alias_var.PARAMETER, alias_var.CONSTANT]:
-                        data_info_section.append('1 %d 0 -1 # %s\n' %
-                                                 (neg*n_invariant, name))
-                    else:
-                        data_info_section.append('2 %d 0 -1 # %s\n' %
-                                                 (neg*n_variant, name))
-
-            # Collect parameter data (data_1)
-            data_1 = []
-            for par in mvar_vectors['p_opt']:
-                name = par.getName()
-                (ind, _) = name_map[name]
-                data_1.append(" %.14E" % p_opt[ind])
-
-            for par_val in p_fixed:
-                data_1.append(" %.14E" % par_val)
-
-            # Open file
             if file_name == '':
                 file_name = self.op.getIdentifier() + '_result.txt'
-            f = codecs.open(file_name, 'w', 'utf-8')
+            self.get_result_data(result).export_result_dymola(file_name)
+            return file_name
+        else:
+            raise NotImplementedError('Export on binary Dymola result files ' +
+                                      'not yet supported.')
 
-            # Write header
-            f.write('#1\n')
-            f.write('char Aclass(3,11)\n')
-            f.write('Atrajectory\n')
-            f.write('1.1\n')
-            f.write('\n')
+    def get_result_data(self, result=None):
+        """
+        Create result data for an optimization result without writing it to
+        file.
 
-            num_vars = len(name_section)
+        The result data has the same layout and interface as a Dymola result
+        file loaded with ResultDymolaTextual, and can be written to file
+        later with its export_result_dymola method.
 
-            # Write names
-            f.write('char name(%d,%d)\n' % (num_vars, max_name_length))
-            for name in name_section:
-                f.write(name)
-            f.write('\n')
+        Parameters::
 
-            # Write descriptions
-            f.write('char description(%d,%d)\n' % (num_vars, max_desc_length))
-            for description in description_section:
-                f.write(description)
-            f.write('\n')
+            result --
+                If a result is given, the result data is created for that
+                result. Otherwise this function will call self.get_result()
+                and use the result from the last optimization/sample.
+                Default: None
 
-            # Write dataInfo
-            f.write('int dataInfo(%d,%d)\n' % (num_vars, 4))
-            for data_info in data_info_section:
-                f.write(data_info)
-            f.write('\n')
+        Returns::
 
-            # Write data_1
-            n_parameters = (len(mvar_vectors['p_opt']) +
-                            len(mvar_vectors['p_fixed']))
-            f.write('float data_1(%d,%d)\n' % (2, n_parameters + 1))
-            par_val_str = ''
-            for par_val in data_1:
-                par_val_str += par_val
-            par_val_str += '\n'
-            f.write("%.14E" % data[0,0])
-            f.write(par_val_str)
-            f.write("%.14E" % data[-1,0])
-            f.write(par_val_str)
-            f.write('\n')
+            result_data --
+                A LocalDAECollocationResultData object.
+        """
+        if result is None:
+            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = self.get_result()
+        else:
+            (t,dx_opt,x_opt,u_opt,w_opt,p_fixed,p_opt, elim_vars) = result
+        data = N.hstack((t,dx_opt,x_opt,u_opt,w_opt,elim_vars))
 
-            # Write data_2
-            n_vars = len(data[0, :])
-            n_points = len(data[:, 0])
-            f.write('float data_2(%d,%d)\n' % (n_points, n_vars))
-            for i in range(n_points):
-                str_text = ''
-                for ref in range(n_vars):
-                    str_text = str_text + (" %.14E" % data[i, ref])
-                f.write(str_text + '\n')
+        op = self.op
+        name_map = self.name_map
+        mvar_vectors = self.mvar_vectors
+        variable_list = reduce(list.__add__,
+                               [list(mvar_vectors[vt]) for
+                                vt in ['p_opt', 'p_fixed',
+                                       'dx', 'x', 'u', 'w']])
+        if result is None:
+            for v in op.getEliminatedVariables():
+                variable_list.append(v) 
+
+        # Map variable to aliases
+        alias_map = {}
+        for var in variable_list:
+            alias_map[var.getName()] = []
+        for alias_var in op.getAliases():
+            alias = alias_var.getModelVariable()
+            alias_map[alias.getName()].append(alias_var)
+
+        # Put exactly one entry per variable in names etc
+        names = ['time']
+        descriptions = ['Time in [s]']
+        data_info = [[0, 1, 0, -1]]
+
+        # Collect meta information
+        n_variant = 1
+        n_invariant = 1
+        for var in variable_list:
+            names.append(var.getName())
+            descriptions.append(op.get_attr(var, "comment"))
+
+            # Data info
+            variability = var.getVariability()
+            if variability in [var.PARAMETER, var.CONSTANT]:
+                n_invariant += 1
+                data_info.append([1, n_invariant, 0, -1])
+            else:
+                n_variant += 1
+                data_info.append([2, n_variant, 0, -1])
 
-            # Close file
-            f.write('\n')
-            f.close()
+            # Handle alias variables
+            for alias_var in alias_map[var.getName()]:
+                names.append(alias_var.getName())
+                descriptions.append(op.get_attr(alias_var, "comment"))
 
-            return file_name
-        else:
-            raise NotImplementedError('Export on binary Dymola result files ' +
-                                      'not yet supported.')
+                # Data info
+                if alias_var.isNegated():
+                    neg = -1
+                else:
+                    neg = 1
+                if variability in [alias_var.PARAMETER, alias_var.CONSTANT]:
+                    data_info.append([1, neg*n_invariant, 0, -1])
+                else:
+                    data_info.append([2, neg*n_variant, 0, -1])
+
+        # Collect parameter data (data_1)
+        par_vals = [p_opt[name_map[par.getName()][0]]
+                    for par in mvar_vectors['p_opt']]
+        par_vals.extend(p_fixed)
+        data_1 = N.empty([2, len(par_vals) + 1])
+        data_1[:, 0] = [data[0, 0], data[-1, 0]]
+        data_1[:, 1:] = par_vals
+
+        return LocalDAECollocationResultData(names, descriptions,
+                                             data_info, [data_1, data])
 
     def get_opt_input(self):
         """
@@ -5805,7 +5943,7 @@ class LocalDAECollocator(CasadiCollocator):
         
         return (inds, i, k)
 
-    def enable_codegen(self, name=None):
+    def enable_codegen(self, name=None, cache_dir=None):
         """
         Enables use of generated C code for the collocator. Generates and
         compiles code for the NLP, gradient of f, Jacobian of g, and Hessian
@@ -5816,15 +5954,16 @@ class LocalDAECollocator(CasadiCollocator):
         Parameters::
         
             name --
-                A string that if it is not None, tries to load existing files
-                nlp_[name].so, grad_f_[name].so, jac_g_[name].so and
-                hess_lag_[name].so as ExternalFunction objects to be used
-                by the solver rather than generating new code. If any of the
-                files don't exist, new files are generated with the above
-                names.
+                A string that if it is not None, is added to the names of
+                the generated files, see enable_codegen.
+                Default: None
+                
+            cache_dir --
+                The directory in which the generated code and the compiled
+                libraries are stored, see enable_codegen.
                 Default: None
         """
-        enable_codegen(self, name)
+        enable_codegen(self, name, cache_dir)
 
 
 def _add_help_fcns(filename):
@@ -5860,43 +5999,90 @@ def _add_help_fcns(filename):
                     if add_sign:
                         outfile.write('\nd sign(d x) { return x<0 ? -1 : x>0 ? 1 : x;}\n')
 
-def _to_external_function(fcn, name, use_existing=False):
+def _to_external_functions(fcns, names, cache_dir):
     """
-    Generates C code for a Function object using its generateCode member
-    function, compiles the generated code, and returns it as an
-    ExternalFunction object. Help function to enable_codegen.
+    Generates C code for Function objects using their generateCode member
+    function, compiles the generated code, and returns the compiled
+    functions as ExternalFunction objects. Help function to enable_codegen.
+    
+    The libraries are stored in cache_dir under a hash of the generated code
+    and the compiler command, so a library is only reused if it was compiled
+    from the same code. Missing libraries are compiled in parallel.
     
     Parameters::
     
-        fcn --
-            The Function object for which to generate code.
+        fcns --
+            A list of the Function objects for which to generate code.
             
-        name --
-            A string containing the file name to be used for the
-            generated code, without file extension.
+        names --
+            A list with a string for each Function object, containing the
+            prefix of the file names of the generated code.
             
-        use_existing --
-            A boolean that if it is set, doesn't generate new code and
-            just returns name.so (where name is the function parameter)
-            as an ExternalFunction object.
-            Default: False
+        cache_dir --
+            The directory in which the generated code and the compiled
+            libraries are stored.
+    
+    Returns::
+    
+        A list with the ExternalFunction object for each Function object, or
+        the Function object itself if its code could not be compiled.
     """
     if os.name == 'nt':
         ext = '.dll'
     else:
         ext = '.so'
-    if not use_existing:
+    bitness_flag = '-m32' if struct.calcsize('P') == 4 else '-m64'
+    cmd = ['gcc', bitness_flag, '-fPIC', '-shared', '-O3']
+    if not path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    
+    libs = []
+    processes = []
+    for (fcn, name) in zip(fcns, names):
         print('Generating code for', name)
-        fcn.generateCode(name + '.c')
-        _add_help_fcns(name + '.c')
-        bitness_flag = '-m32' if struct.calcsize('P') == 4 else '-m64'
-        exit_code = system('gcc ' + bitness_flag + ' -fPIC -shared -O3 ' + name + '.c -o ' + name + ext)
-        if exit_code != 0:
-            return fcn # fall back to uncompiled version
-    fcn_e = casadi.ExternalFunction('./' + name + ext)
-    return fcn_e
+        tmp_name = path.join(cache_dir, '%s.%d.c' % (name, os.getpid()))
+        fcn.generateCode(tmp_name)
+        _add_help_fcns(tmp_name)
+        key = hashlib.sha1(repr((casadi.__version__, cmd)).encode('utf-8'))
+        with open(tmp_name, 'rb') as source:
+            key.update(source.read())
+        base = path.join(cache_dir, name + '_' + key.hexdigest())
+        libs.append(base + ext)
+        if path.isfile(base + ext):
+            os.remove(tmp_name)
+            processes.append(None)
+        else:
+            # Compile to a temporary file that is renamed when it is complete,
+            # so that a partly written library is never loaded
+            if path.isfile(base + '.c'):
+                os.remove(base + '.c')
+            os.rename(tmp_name, base + '.c')
+            tmp_lib = '%s.%d.tmp%s' % (base, os.getpid(), ext)
+            try:
+                process = subprocess.Popen(cmd + [base + '.c', '-o', tmp_lib])
+            except OSError:
+                # No compiler, fall back to uncompiled version
+                process = None
+            processes.append((process, tmp_lib))
+    
+    fcns_e = []
+    for (fcn, lib, process) in zip(fcns, libs, processes):
+        if process is not None:
+            (process, tmp_lib) = process
+            if process is None or process.wait() != 0:
+                if path.isfile(tmp_lib):
+                    os.remove(tmp_lib)
+                fcns_e.append(fcn) # fall back to uncompiled version
+                continue
+            try:
+                os.rename(tmp_lib, lib)
+            except OSError:
+                # Compiled by another process in the meantime
+                os.remove(tmp_lib)
+        fcns_e.append(casadi.ExternalFunction(lib))
+    return fcns_e
     
-def enable_codegen(coll, name=None):
+def enable_codegen(coll, name=None, cache_dir=None):
     """
     Enables use of generated C code for a collocator. Generates and compiles
     code for the NLP, gradient of f, Jacobian of g, and Hessian of the
@@ -5904,24 +6090,30 @@ def enable_codegen(coll, name=None):
     object in the solver's collocator with a new one that makes use of
     the compiled functions as ExternalFunction objects.
     
+    The compiled code is stored in cache_dir under a hash of the generated
+    code, and is reused if the same code is generated again.
+    
     Parameters::
     
         coll --
             The LocalDAECollocator for which to enable use of generated code.
             
         name --
-            A string that if it is not None, tries to load existing files
-            nlp_[name].so, grad_f_[name].so, jac_g_[name].so and
-            hess_lag_[name].so as ExternalFunction objects to be used
-            by the solver rather than generating new code. If any of the
-            files don't exist, new files are generated with the above
-            names.
+            A string that if it is not None, is added to the names of the
+            generated files, which are then nlp_[name]_[hash].so,
+            grad_f_[name]_[hash].so, jac_g_[name]_[hash].so and
+            hess_lag_[name]_[hash].so.
             Default: None
+            
+        cache_dir --
+            The directory in which the generated code and the compiled
+            libraries are stored. It is created if it does not exist.
+            Default: codegen_cache in the .jmodelica.org directory in the
+            home directory of the user.
     """
-    if os.name == 'nt':
-        ext = '.dll'
-    else:
-        ext = '.so'
+    if cache_dir is None:
+        cache_dir = path.join(path.expanduser('~'), '.jmodelica.org',
+                              'codegen_cache')
     
     old_solver = coll.solver_object
     
@@ -5934,21 +6126,11 @@ def enable_codegen(coll, name=None):
     hess_lag = old_solver.hessLag()
     hess_lag.init()
     
-    existing = False
-    if name == None:
-        enable_codegen.times += 1
-        name = str(enable_codegen.times)
-    else:
-        if (path.isfile('nlp_'+name+ext) and
-            path.isfile('grad_f_'+name+ext) and
-            path.isfile('jac_g_'+name+ext) and
-            path.isfile('hess_lag_'+name+ext)):
-            existing = True
-    
-    nlp = _to_external_function(nlp, 'nlp_' + name, existing)
-    grad_f = _to_external_function(grad_f, 'grad_f_' + name, existing)
-    jac_g = _to_external_function(jac_g, 'jac_g_' + name, existing)
-    hess_lag = _to_external_function(hess_lag, 'hess_lag_' + name, existing)
+    names = ['nlp', 'grad_f', 'jac_g', 'hess_lag']
+    if name is not None:
+        names = [fcn_name + '_' + name for fcn_name in names]
+    (nlp, grad_f, jac_g, hess_lag) = _to_external_functions(
+        [nlp, grad_f, jac_g, hess_lag], names, cache_dir)
     
     solver_cg = casadi.NlpSolver('ipopt', nlp)
     
@@ -5977,8 +6159,6 @@ def enable_codegen(coll, name=None):
     solver_cg.setInput(p, 'p')
     
     coll.solver_object = solver_cg
-    
-enable_codegen.times = 0
 
 
 class MeasurementData(object):
@@ -5992,6 +6172,160 @@ class MeasurementData(object):
         raise DeprecationWarning('MeasurementData is obsolete. ' +
                                  'Use ExternalData instead.')
 
+class LocalDAECollocationResultData(object):
+
+    """
+    Optimization result data kept in memory.
+
+    Has the same attributes and trajectory access methods as a result file
+    loaded with pyjmi.common.io.ResultDymolaTextual, but is created
+    directly from the solution of the collocator.
+
+    Attributes::
+
+        name --
+            List of variable names, starting with 'time'.
+
+        description --
+            List of variable descriptions.
+
+        dataInfo --
+            Integer array with one row per variable, with the same meaning
+            as dataInfo in a Dymola result file.
+
+        data --
+            List with the parameter data (data_1) and the trajectory data
+            (data_2) as 2D arrays. The first column of both holds the time.
+    """
+
+    def __init__(self, name, description, dataInfo, data):
+        self.name = name
+        self.description = description
+        self.dataInfo = N.array(dataInfo, dtype=int).reshape([-1, 4])
+        self.data = data
+        self._name_lookup = dict((var_name, ind) for (ind, var_name)
+                                 in enumerate(name))
+
+    def get_variable_index(self, name):
+        """
+        Get the index of the variable name in the name list.
+
+        Raises a VariableNotFoundError if the variable is not found.
+        """
+        try:
+            return self._name_lookup[name]
+        except KeyError:
+            raise jmiVariableNotFoundError(
+                "Cannot find variable " + name + " in data file.")
+
+    def get_variable_data(self, name):
+        """
+        Retrieve the data sequence for a variable with a given name.
+
+        Returns::
+
+            A Trajectory object containing the time vector and the data
+            vector of the variable.
+        """
+        if name == 'time':
+            return Trajectory(self.data[1][:, 0], self.data[1][:, 0])
+        ind = self.get_variable_index(name)
+        (kind, data_ind) = self.dataInfo[ind, 0:2]
+        factor = -1 if data_ind < 0 else 1
+        data = self.data[kind - 1]
+        return Trajectory(data[:, 0], factor * data[:, abs(data_ind) - 1])
+
+    def is_variable(self, name):
+        """
+        Returns True if the given name corresponds to a time-varying
+        variable.
+        """
+        if name == 'time':
+            return True
+        return self.dataInfo[self.get_variable_index(name), 0] == 2
+
+    def is_negated(self, name):
+        """
+        Returns True if the given name corresponds to a negated result
+        vector.
+        """
+        return self.dataInfo[self.get_variable_index(name), 1] < 0
+
+    def get_column(self, name):
+        """
+        Returns the column number in the data matrix where the values of
+        the variable are stored.
+        """
+        if not self.is_variable(name):
+            raise ValueError("Variable " + name + " is not time-varying.")
+        if name == 'time':
+            return 0
+        return abs(self.dataInfo[self.get_variable_index(name), 1]) - 1
+
+    def get_data_matrix(self):
+        """
+        Returns the trajectory data matrix.
+        """
+        return self.data[1]
+
+    def export_result_dymola(self, file_name):
+        """
+        Write the result data to file in Dymola's textual result format.
+
+        Parameters::
+
+            file_name --
+                The name of the result file.
+        """
+        (data_1, data) = self.data
+        max_name_length = max(len(name) for name in self.name)
+        max_desc_length = max(len(desc) for desc in self.description)
+        num_vars = len(self.name)
+
+        f = codecs.open(file_name, 'w', 'utf-8')
+
+        # Write header
+        f.write('#1\n')
+        f.write('char Aclass(3,11)\n')
+        f.write('Atrajectory\n')
+        f.write('1.1\n')
+        f.write('\n')
+
+        # Write names
+        f.write('char name(%d,%d)\n' % (num_vars, max_name_length))
+        for name in self.name:
+            f.write('%s\n' % name)
+        f.write('\n')
+
+        # Write descriptions
+        f.write('char description(%d,%d)\n' % (num_vars, max_desc_length))
+        for description in self.description:
+            f.write('%s\n' % description)
+        f.write('\n')
+
+        # Write dataInfo
+        f.write('int dataInfo(%d,%d)\n' % (num_vars, 4))
+        for (name, info) in zip(self.name, self.dataInfo):
+            f.write('%d %d %d %d # %s\n' % (tuple(info) + (name,)))
+        f.write('\n')
+
+        # Write data_1
+        f.write('float data_1(%d,%d)\n' % data_1.shape)
+        for row in data_1:
+            f.write("%.14E" % row[0])
+            f.write(''.join([" %.14E" % val for val in row[1:]]))
+            f.write('\n')
+        f.write('\n')
+
+        # Write data_2
+        f.write('float data_2(%d,%d)\n' % data.shape)
+        for row in data:
+            f.write(''.join([" %.14E" % val for val in row]) + '\n')
+
+        # Close file
+        f.write('\n')
+        f.close()
+
 class LocalDAECollocationAlgResult(JMResultBase):
     
     """
@@ -6069,6 +6403,33 @@ class LocalDAECollocationAlgResult(JMResultBase):
             print(("KKT matrix condition number at the optimum: %.3g" %
                   KKT_opt_cond))
 
+    def export_result_dymola(self, file_name=''):
+        """
+        Write the result to file in Dymola's textual result format.
+
+        This is mainly useful when the result was created with the option
+        write_result_file set to False.
+
+        Parameters::
+
+            file_name --
+                If no file name is given, the name of the model concatenated
+                with the string '_result.txt' is used.
+                Default: Empty string.
+
+        Returns::
+
+            used_file_name --
+                The actual file name used to write the result file.
+        """
+        if file_name == '':
+            file_name = self.model.getIdentifier() + '_result.txt'
+        if isinstance(self.result_data, LocalDAECollocationResultData):
+            self.result_data.export_result_dymola(file_name)
+        elif os.path.abspath(self.result_file) != os.path.abspath(file_name):
+            shutil.copyfile(self.result_file, file_name)
+        return file_name
+
     def get_opt_input(self):
         """
         Get the optimized input variables as a function of time.
@@ -6993,7 +7354,7 @@ class OptimizationSolver(object):
         print("---------------------------")
         self.print_jacobian_entries(self.find_nonfinite_jacobian_entries(point))
     
-    def enable_codegen(self, name):
+    def enable_codegen(self, name=None, cache_dir=None):
         """
         Enables use of generated C code for the solver's collocator.
         Generates and compiles code for the NLP, gradient of f, Jacobian of g,
@@ -7004,12 +7365,13 @@ class OptimizationSolver(object):
         Parameters::
         
             name --
-                A string that if it is not None, tries to load existing files
-                nlp_[name].so, grad_f_[name].so, jac_g_[name].so and
-                hess_lag_[name].so as ExternalFunction objects to be used
-                by the solver rather than generating new code. If any of the
-                files don't exist, new files are generated with the above
-                names.
+                A string that if it is not None, is added to the names of
+                the generated files, see enable_codegen.
+                Default: None
+                
+            cache_dir --
+                The directory in which the generated code and the compiled
+                libraries are stored, see enable_codegen.
                 Default: None
         """
-        self.collocator.enable_codegen(name)
+        self.collocator.enable_codegen(name, cache_dir)
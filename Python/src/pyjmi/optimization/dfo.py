@@ -48,6 +48,15 @@ def cost_evaluater_test(func, x, process="thread_0"):
     os.chdir("..")
     return ret
 
+class _BatchFunction(object):
+    """
+    Wraps a function which can be evaluated in several points (rows) at 
+    once, such that nelme evaluates it in all points of a step together 
+    instead of one point at a time.
+    """
+    def __init__(self,func):
+        self.feval = func
+
 def nelme_modified(func,xstart,lb=None,ub=None,h=0.3,x_tol=1e-3,f_tol=1e-6,
           max_iters=500,max_fevals=5000, disp=True,nbr_cores=None, debug=False):
     """
@@ -425,7 +434,8 @@ def nelme_modified(func,xstart,lb=None,ub=None,h=0.3,x_tol=1e-3,f_tol=1e-6,
 
 def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
           plot_conv=False,x_tol=1e-3,f_tol=1e-6,max_iters=500,max_fevals=5000,
-          disp=True,nbr_cores=None,debug=False):
+          disp=True,nbr_cores=None,debug=False,persistent_workers=False,
+          fevals_per_worker=None):
     """
     Minimize a function of one or more variables using the 
     Nelder-Mead simplex method. Handles box bound constraints rather well 
@@ -449,13 +459,20 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
         in sub-directories to the working directory when multiprocessing 
         is used.
     
+    By default a new python process is started for each function 
+    evaluation. With persistent_workers set to True, the evaluations are 
+    instead performed by a pool of worker processes (see 
+    thread_feval.FevalPool) which execute the file only once, which saves 
+    the start-up time of the interpreter and of the imports in the file.
+    
     Parameters::
     
         func -- 
-            callable func(x) or string
+            callable func(x), string or FevalPool
             The objective function OR the name of a python file 
-            containing the definition of the objective function. In case 
-            of a file name, the objective function in the file must 
+            containing the definition of the objective function OR a 
+            thread_feval.FevalPool evaluating the objective function. In 
+            case of a file name, the objective function in the file must 
             have the same name as the file itself (without '.py').  
             
         xstart -- 
@@ -540,6 +557,22 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
             separate process when using multiprocessing.
             Default: False
             
+        persistent_workers --
+            bool
+            Set to True to perform the function evaluations in a pool of 
+            nbr_cores persistent worker processes instead of starting a 
+            new process for each evaluation. Only used if func is a file 
+            name.
+            Default: False
+            
+        fevals_per_worker --
+            int
+            The number of function evaluations after which a persistent 
+            worker process is replaced by a new one, to limit the memory 
+            growth of the workers. If None the workers are kept until the 
+            optimization is finished.
+            Default: None
+            
     Returns::
     
         x_opt --
@@ -579,10 +612,25 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
             raise ValueError('xstart must be smaller than ub.')
     
     # Check that nbr of cores is provided if multithreading is to be used
+    if isinstance(func, tf.FevalPool) and nbr_cores is None:
+        nbr_cores = func.nbr_workers
     if type(func).__name__ != 'function':
         if nbr_cores is None:
             raise ValueError('The number of processor cores used must be provided.')
     
+    # Function evaluations in separate processes, either in a pool of 
+    # persistent worker processes or in a new process for each point
+    pool = None
+    if isinstance(func, (tf.FevalPool, _BatchFunction)):
+        pool = func
+    elif isinstance(func, str) and persistent_workers:
+        pool = tf.FevalPool(func,nbr_cores,fevals_per_worker,debug)
+    
+    def proc_feval(x):
+        if pool is None:
+            return tf.feval(func,x,debug)
+        return pool.feval(x)
+    
     # Convert xstart to float type array and flatten it so that 
     # len(xstart) can be used even if xstart is a scalar
     xstart = N.asfarray(xstart).flatten()   
@@ -635,7 +683,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
                 for j in range(l):
                     points.append(N.array([x_grid[i,j],y_grid[i,j]]))
             # Evaluate function in these points     
-            f_values = tf.feval(func,points,debug)
+            f_values = proc_feval(points)
             for i in range(l):
                 z[i] = f_values[i*l:(i+1)*l]
     
@@ -704,7 +752,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
                 f_val[i] = func(X[i])
                 nbr_fevals += 1
         else:
-            f_val = tf.feval(func,X,debug)
+            f_val = proc_feval(X)
             nbr_fevals += (n+1)
         
         # Order all vertices s.t f(x0) <= f(x1) <= ... <= f(xn)
@@ -801,7 +849,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
         else:
             if nbr_cores >= 4:
                 x_values = N.vstack([xr,xe,xc1,xc2])
-                f_values = tf.feval(func,x_values,debug)
+                f_values = proc_feval(x_values)
                 fr = f_values[0]
                 fe = f_values[1]
                 fc1 = f_values[2]
@@ -809,21 +857,21 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
                 nbr_fevals += 4
             elif nbr_cores == 3:
                 x_values = N.vstack([xr,xe,xc1])
-                f_values = tf.feval(func,x_values,debug)
+                f_values = proc_feval(x_values)
                 fr = f_values[0]
                 fe = f_values[1]
                 fc1 = f_values[2]
                 nbr_fevals += 3
             elif nbr_cores == 2:
                 x_values = N.vstack([xr,xe])
-                f_values = tf.feval(func,x_values,debug)
+                f_values = proc_feval(x_values)
                 fr = f_values[0]
                 fe = f_values[1]
                 nbr_fevals += 2
             elif nbr_cores == 1:
                 # This is completely unnecessary but we must compute the
                 # function value in a separate process to avoid memory problems
-                fr = tf.feval(func,xr,debug)
+                fr = proc_feval(xr)
                 nbr_fevals += 1
         
         # Reflection
@@ -837,7 +885,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
         elif fr < f_val[0]:
             if type(func).__name__ != 'function':
                 if nbr_cores == 1:
-                    fe = tf.feval(func,xe,debug)
+                    fe = proc_feval(xe)
                     nbr_fevals += 1
             if fe < fr:
                 X[n] = xe
@@ -856,7 +904,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
             if fr < f_val[n]:
                 if type(func).__name__ != 'function':
                     if nbr_cores == 1 or nbr_cores == 2:
-                        fc1 = tf.feval(func,xc1,debug)
+                        fc1 = proc_feval(xc1)
                         nbr_fevals += 1
                 if fc1 <= fr:
                     X[n] = xc1
@@ -867,7 +915,7 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
             else:
                 if type(func).__name__ != 'function':
                     if nbr_cores == 1 or nbr_cores == 2 or nbr_cores == 3:
-                        fc2 = tf.feval(func,xc2,debug)
+                        fc2 = proc_feval(xc2)
                         nbr_fevals += 1
                 if fc2 < f_val[n]:
                     X[n] = xc2
@@ -884,9 +932,13 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
     if type(func).__name__ == 'function':
             f_opt = func(x_opt)
     else:
-        f_opt = tf.feval(func,x_opt,debug)
+        f_opt = proc_feval(x_opt)
     nbr_fevals += 1
     
+    # Terminate the worker processes created here
+    if pool is not None and pool is not func:
+        pool.close()
+    
     # Number of iterations
     nbr_iters = k
 
@@ -941,18 +993,29 @@ def nelme(func,xstart,lb=None,ub=None,h=0.3,plot_con=False,plot_sim=False,
 
 
 def seqbar(f,xstart,lb=None,ub=None,mu=0.1,plot=False,x_tol=1e-3,
-           q_tol=1e-3,max_iters=1000,max_fevals=5000,disp=True):
+           q_tol=1e-3,max_iters=1000,max_fevals=5000,disp=True,
+           nbr_cores=None,debug=False,fevals_per_worker=None):
     """
     Bounded minimization of a function of one or more variables using 
     a sequential barrier function method which uses the Nelder-Mead 
     simplex method. Handles box bound constraints. Can only be used if 
     some bound (lb or ub or both) is provided.
     
+    If the objective function is provided as a file name, all function 
+    evaluations are performed in a pool of nbr_cores persistent worker 
+    processes (see thread_feval.FevalPool), which is kept for all the 
+    Nelder-Mead minimizations. As for nelme, the evaluations are performed 
+    in sub-directories to the working directory.
+    
     Parameters::
     
         f --
-            callable f(x)
-            The objective function to be minimized.
+            callable f(x) or string
+            The objective function to be minimized OR the name of a 
+            python file containing the definition of the objective 
+            function. In case of a file name, the objective function in 
+            the file must have the same name as the file itself (without 
+            '.py').
         
         xstart --
             ndarray or scalar
@@ -1008,6 +1071,25 @@ def seqbar(f,xstart,lb=None,ub=None,mu=0.1,plot=False,x_tol=1e-3,
             bool
             Set to True to print convergence messages.
             Default: True
+            
+        nbr_cores --
+            int
+            The number of worker processes used. This is only needed if 
+            f is a file name.
+            Default: None
+            
+        debug --
+            bool
+            Set to True to get separate error and output files for each
+            worker process.
+            Default: False
+            
+        fevals_per_worker --
+            int
+            The number of function evaluations after which a worker 
+            process is replaced by a new one. If None the workers are 
+            kept until the optimization is finished.
+            Default: None
     
     Returns::
     
@@ -1060,18 +1142,26 @@ def seqbar(f,xstart,lb=None,ub=None,mu=0.1,plot=False,x_tol=1e-3,
     if ub is not None:
         ub = N.asfarray(ub).flatten()
     
-    # Auxiliary function
+    # Evaluate f in a pool of worker processes if it is given as a file name
+    pool = None
+    if isinstance(f, str):
+        if nbr_cores is None:
+            raise ValueError('The number of processor cores used must be provided.')
+        pool = tf.FevalPool(f,nbr_cores,fevals_per_worker,debug)
+        f = pool.feval
+    
+    # Auxiliary function, evaluated in one point or in several points (rows)
     def q(x):
     
         if lb is None and ub is None:
             out = f(x)
         else:
             if lb is None:
-                b = - N.sum(N.log(ub-x))
+                b = - N.sum(N.log(ub-x),-1)
             elif ub is None:
-                b = - N.sum(N.log(x-lb))
+                b = - N.sum(N.log(x-lb),-1)
             else:
-                b = - N.sum(N.log(ub-x)) - N.sum(N.log(x-lb))
+                b = - N.sum(N.log(ub-x),-1) - N.sum(N.log(x-lb),-1)
             out = f(x) + mu*b
 
         return out
@@ -1169,8 +1259,14 @@ def seqbar(f,xstart,lb=None,ub=None,mu=0.1,plot=False,x_tol=1e-3,
         nbr_fevals += 1
         
         # Minimize q with Nelder-Mead
-        x_new,q_new,iters,func_evals,solve_time = nelme(q,x_pre,lb=lb,ub=ub,h=h,
-                                                        plot_sim=plot,disp=False)
+        if pool is None:
+            x_new,q_new,iters,func_evals,solve_time = nelme(q,x_pre,lb=lb,ub=ub,h=h,
+                                                            plot_sim=plot,disp=False)
+        else:
+            x_new,q_new,iters,func_evals,solve_time = nelme(_BatchFunction(q),x_pre,
+                                                            lb=lb,ub=ub,h=h,
+                                                            plot_sim=plot,disp=False,
+                                                            nbr_cores=nbr_cores)
         
         # Increase number of iterations and function evaluations
         nbr_iters += iters
@@ -1211,6 +1307,9 @@ def seqbar(f,xstart,lb=None,ub=None,mu=0.1,plot=False,x_tol=1e-3,
     x_opt = x_new
     f_opt = f(x_opt)
     nbr_fevals += 1
+    
+    if pool is not None:
+        pool.close()
         
     t1 = time.clock()
     solve_time = t1 - t0
@@ -1480,7 +1579,8 @@ def galileo(f,lb,ub,plot=False,x_tol=1e-6,f_tol=1e-6,max_iters=1000,
 
 def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
          x_tol=1e-6,f_tol=1e-6,max_iters=1000,max_fevals=10000,disp=True,
-         nbr_cores=None,debug=False):
+         nbr_cores=None,debug=False,persistent_workers=False,
+         fevals_per_worker=None):
     """
     Minimize a function of one or more variables using a derivative-free 
     method which can be chosen from the following alternatives: 
@@ -1497,7 +1597,8 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
            Genetic Algorithm. Handles box bound constraints. Can only be 
            chosen if bounds (both lb and ub) are provided.
            
-    If the Nelder-Mead method is chosen, then all function evaluations in 
+    If the Nelder-Mead method or the sequential barrier method is chosen, 
+    then all function evaluations in 
     the algorithm can be performed in separate processes (multiprocessing)
     to save memory. For example, when the function evaluation involves the 
     loading of an FMU, there is a risk of running out of memory after a 
@@ -1516,6 +1617,10 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
         in sub-directories to the working directory when multiprocessing 
         is used.
     
+    With the sequential barrier method, or with the Nelder-Mead method and 
+    persistent_workers set to True, the evaluations are performed by a pool 
+    of persistent worker processes which execute the file only once.
+    
     Parameters::
     
         func --
@@ -1524,7 +1629,8 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
             containing the definition of the objective function. In case 
             of a file name, the objective function in the file must 
             have the same name as the file itself (without ".py") and this
-            feature is only available when using the Nelder-Mead method.
+            feature is only available when using the Nelder-Mead method or
+            the sequential barrier method.
         
         xstart --
             ndarray or scalar
@@ -1615,15 +1721,31 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
         nbr_cores --
             int
             The number of processor cores used. This is only needed if the
-            Nelder-Mead algorithm is to be used and the function evaluations 
-            should be performed in separate processes.
+            Nelder-Mead algorithm or the sequential barrier method is to be 
+            used and the function evaluations should be performed in 
+            separate processes.
             Default: None
             
         debug --
             bool
             Set to True to get separate error and output files for each
-            separate process when using Nelder-Mead with multiprocessing.
+            separate process when using multiprocessing.
             Default: False
+            
+        persistent_workers --
+            bool
+            Set to True to perform the function evaluations of the 
+            Nelder-Mead method in a pool of persistent worker processes 
+            instead of starting a new process for each evaluation. The 
+            sequential barrier method always uses persistent workers.
+            Default: False
+            
+        fevals_per_worker --
+            int
+            The number of function evaluations after which a persistent 
+            worker process is replaced by a new one. If None the workers 
+            are kept until the optimization is finished.
+            Default: None
     
     Returns::
     
@@ -1672,8 +1794,8 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
             raise ValueError('Methods 1 and 2 require a starting point.')
     
     if type(func).__name__ != 'function':
-        if alg != 1:
-            raise ValueError('If other than the Nelder-Mead method is chosen, func must be of function type.')
+        if alg != 1 and alg != 2:
+            raise ValueError('If other than the Nelder-Mead method or the sequential barrier method is chosen, func must be of function type.')
     
     # Solve the problem
     if alg == 1:
@@ -1684,14 +1806,18 @@ def fmin(func,xstart=None,lb=None,ub=None,alg=None,plot=False,plot_conv=False,
                                                                max_iters=max_iters,
                                                                max_fevals=max_fevals,
                                                                disp=disp,nbr_cores=nbr_cores,
-                                                               debug=debug)
+                                                               debug=debug,
+                                                               persistent_workers=persistent_workers,
+                                                               fevals_per_worker=fevals_per_worker)
     elif alg == 2:
         x_opt,f_opt,nbr_iters,nbr_fevals,solve_time = seqbar(func,xstart,lb=lb,ub=ub,
                                                                 plot=plot,x_tol=x_tol,
                                                                 q_tol=f_tol,
                                                                 max_iters=max_iters,
                                                                 max_fevals=max_fevals,
-                                                                disp=disp)
+                                                                disp=disp,nbr_cores=nbr_cores,
+                                                                debug=debug,
+                                                                fevals_per_worker=fevals_per_worker)
     
     elif alg == 3:
         x_opt,f_opt,nbr_iters,nbr_fevals,solve_time = de(func,lb,ub,plot=plot,x_tol=x_tol,
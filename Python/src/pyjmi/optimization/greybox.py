@@ -116,6 +116,9 @@ class GreyBox(object):
         
         self.prefix = "GreyBox_"
         self.free_parameters = set()
+        self._solver = None
+        self._candidate_bounds = {}
+        self._last_result = None
         
         # if non-constant sample period for measurements
         if hs:
@@ -303,11 +306,67 @@ class GreyBox(object):
         self.op.addTimedVariable(timed_var)
         return timed_var
         
+    def prepare_identification(self, candidate_parameters):
+        """
+        Discretizes the optimization problem once with all candidate 
+        parameters as free parameters. Subsequent calls to identify reuse 
+        the prepared solver and only change the bounds of the candidates: 
+        a candidate that is not free in an identification is fixed to its 
+        parameter value by setting its lower and upper bound equal to it. 
+        Each identification is initialized from the initial trajectory if 
+        one has been set, otherwise from the result of the previous 
+        identification.
+        
+        The bounds and values of the candidates are taken when this method 
+        is called, so they must be set before it.
+        
+        Parameters::
+            candidate_parameters --
+                A set of parameters that may be free in the identifications. 
+                The currently free parameters are always candidates.
+        """
+        candidates = set(candidate_parameters).union(self.free_parameters)
+        
+        self._candidate_bounds = {}
+        for name in candidates:
+            par = self.op.getVariable(name)
+            self._candidate_bounds[name] = (self.op.get_attr(par, 'min'), 
+                                            self.op.get_attr(par, 'max'), 
+                                            self.op.get(name))
+            if not par.hasAttributeSet('initialGuess'):
+                par.setAttribute('initialGuess', self.op.get(name))
+            par.setAttribute('free', 1)
+        self._set_candidate_bounds(self.free_parameters)
+        
+        self._solver = self.op.prepare_optimization(options=self.options)
+        self._last_result = None
+        
+    def _set_candidate_bounds(self, parameters):
+        """
+        Fixes the candidate parameters that are not in parameters through 
+        their bounds and restores the bounds of the others.
+        
+        Parameters::
+            parameters --
+                The candidate parameters to be free in the next optimization.
+        """
+        for (name, (lb, ub, value)) in self._candidate_bounds.items():
+            par = self.op.getVariable(name)
+            if name in parameters:
+                par.setAttribute('min', lb)
+                par.setAttribute('max', ub)
+            else:
+                par.setAttribute('min', value)
+                par.setAttribute('max', value)
+        
     def identify(self, free_parameters):
         """
         Sets the parameters to be free in the optimization and solves the optimization problem.
         If the solver fails to converge the cost returned will be Inf.
         
+        If prepare_identification has been called, the prepared solver is 
+        reused and free_parameters must be a subset of the candidates.
+        
         Parameters::
             free_parameters --
                 A set of parameters that are to be free in this optimization.
@@ -316,18 +375,39 @@ class GreyBox(object):
             identification --
                 An Identification object with results from this optimization.
         """
-        self._set_free_parameters(free_parameters)
+        if self._solver is None:
+            self._set_free_parameters(free_parameters)
+        else:
+            unknown = set(free_parameters).difference(self._candidate_bounds)
+            if len(unknown) > 0:
+                raise ValueError("Parameters %s were not candidates when the "
+                                 "identification was prepared." % list(unknown))
+            self._set_candidate_bounds(free_parameters)
+            self.free_parameters = set(free_parameters)
         # print currently free parameters
         print ('Identifying with free parameters:')
         print(self.free_parameters)
-        res = self.op.optimize(options=self.options)
         
         # optimize
+        if self._solver is None:
+            res = self.op.optimize(options=self.options)
+        else:
+            init_traj = self.options.get('init_traj')
+            if init_traj is None:
+                init_traj = self._last_result
+            if init_traj is not None:
+                # Also updates the bounds from the variable attributes
+                self._solver.set_init_traj(init_traj)
+            else:
+                self._solver.collocator._compute_bounds_and_init()
+            res = self._solver.optimize()
+            self._last_result = res
+        
         returnStatus = res.solver.get_solver_statistics()[0]
         if (returnStatus == 'Solve_Succeeded') or (returnStatus=='Solved_To_Acceptable_Level'):
             cost = res.solver.get_solver_statistics()[2]
         else:
-            cost = Inf
+            cost = np.inf
         
         # return identification object
         return Identification(self, frozenset(self.free_parameters), res, cost)
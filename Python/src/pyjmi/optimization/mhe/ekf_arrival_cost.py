@@ -191,6 +191,22 @@ class EKFArrivalCost(object):
                 i = i + 1
 
 
+        # Indices used to build the linearised system
+        self._input_cols = N.array([self._name_map[name][0] for name in
+                                    self._input_names], dtype=int)
+        self._noise_cols = N.array([self._name_map[name][0] for name in
+                                    self._process_noise_names], dtype=int)
+        meas = [(i,) + self._name_map[name] for (i, name) in
+                enumerate(self._measured_var_names)]
+        self._meas_x = (N.array([i for (i, k, vt) in meas if vt == 'x'],
+                                dtype=int),
+                        N.array([k for (i, k, vt) in meas if vt == 'x'],
+                                dtype=int))
+        self._meas_c = (N.array([i for (i, k, vt) in meas if vt != 'x'],
+                                dtype=int),
+                        N.array([k for (i, k, vt) in meas if vt != 'x'],
+                                dtype=int))
+
         # DAEResidual in terms of the substituted variables
         self._dae = casadi.substitute([self.op.getDaeResidual()],
                                       named_vars, 
@@ -220,6 +236,7 @@ class EKFArrivalCost(object):
         self.dF_dc.init()
         self.dF_du = self.Fdae.jacobian(4,0)
         self.dF_du.init()
+        self._create_linearization_function()
     
     def recalculate_jacobian_functions(self):
         """
@@ -266,6 +283,22 @@ class EKFArrivalCost(object):
         self.dF_dc.init()
         self.dF_du = self.Fdae.jacobian(4,0)
         self.dF_du.init()
+        self._create_linearization_function()
+    
+    def _create_linearization_function(self):
+        """
+        Creates a function that evaluates the Jacobians created in 
+        _create_jacobian_functions in a single call. The outputs are 
+        the matrices E, A, B and C, see _evaluate_jacobian_functions.
+        """
+        inputs = [self._mvar_struct[vt] for vt in 
+                  ["time", "dx", "x", "c", "u"]]
+        E = self.dF_dxdot.call(inputs)[0]
+        A = -self.dF_dx.call(inputs)[0]
+        B = -self.dF_du.call(inputs)[0]
+        C = -self.dF_dc.call(inputs)[0]
+        self._linearization_fcn = casadi.MXFunction(inputs, [E, A, B, C])
+        self._linearization_fcn.init()
     
     def update_process_noise_covariance_matrix(self, process_noise_cov):
         """
@@ -395,27 +428,25 @@ class EKFArrivalCost(object):
             if self._nvar[vk]==0:
                 RefPoint[vk] = N.zeros(self._nvar[vk])
 
-        # Set inputs
-        var_kinds = ["time"] + var_kinds
-        for i,varType in enumerate(var_kinds):
-            self.dF_dxdot.setInput(RefPoint[varType],i)
-            self.dF_dx.setInput(RefPoint[varType],i)
-            self.dF_dc.setInput(RefPoint[varType],i)
-            self.dF_du.setInput(RefPoint[varType],i)
-
-        # Evaluate derivatives
-        self.dF_dxdot.evaluate()
-        self.dF_dx.evaluate()
-        self.dF_dc.evaluate()
-        self.dF_du.evaluate()
-
-        # Store result in Matrices
-        E = self.dF_dxdot.getOutput()
-        A = -self.dF_dx.getOutput()
-        B = -self.dF_du.getOutput()
-        C = -self.dF_dc.getOutput()
+        return self._evaluate_linearization(t0, RefPoint["dx"], 
+                                            RefPoint["x"], RefPoint["c"], 
+                                            RefPoint["u"])
+    
+    def _evaluate_linearization(self, t0, dx, x, c, u):
+        """
+        Evaluates the Jacobians of the DAE residual at a point given 
+        as vectors in the order of the variables in _mvar_vectors.
         
-        return E, A, B, C
+        Returns::
+    
+            E, A, B, C -- 
+                See _evaluate_jacobian_functions.
+        """
+        fcn = self._linearization_fcn
+        for (i, value) in enumerate([t0, dx, x, c, u]):
+            fcn.setInput(value, i)
+        fcn.evaluate()
+        return tuple(fcn.getOutput(i) for i in range(4))
     
     def _update_P(self, A, C, G):
         """
@@ -435,11 +466,13 @@ class EKFArrivalCost(object):
             G --
                 The G-matrix found in the system above. 2D numpy array   
         """
-        GQGT = N.dot(N.dot(G, self._Q), N.transpose(G))
-        APAT = N.dot(N.dot(A, self._P), N.transpose(A))
-        APCT = N.dot(N.dot(A, self._P), N.transpose(C))
-        R_CPCT = self._R + N.dot(N.dot(C, self._P),N.transpose(C))
-        CPAT = N.dot(N.dot(C, self._P),N.transpose(A))
+        GQGT = N.dot(N.dot(G, self._Q), G.T)
+        AP = N.dot(A, self._P)
+        CP = N.dot(C, self._P)
+        APAT = N.dot(AP, A.T)
+        APCT = N.dot(AP, C.T)
+        R_CPCT = self._R + N.dot(CP, C.T)
+        CPAT = N.dot(CP, A.T)
         self._P = GQGT + APAT - N.dot(APCT, N.linalg.solve(R_CPCT, CPAT))
     
     def _calculate_A_B_C_and_G(self, A, B, C, E):
@@ -494,13 +527,15 @@ class EKFArrivalCost(object):
         """
         xN = self._nvar['x']
         E_C = N.concatenate((E,-C),1)
-        E_C_A = N.linalg.solve(E_C, A)
+        #Solve for A and B with the same factorization
+        E_C_A_B = N.linalg.solve(E_C, N.concatenate((A, B), 1))
+        E_C_A = E_C_A_B[:,:xN]
     
         C = self._calculate_C(E_C_A)
     
         A_dx = A[0:xN,:]
     
-        (B, G) = self._calculate_B_and_G(E_C, B)
+        (B, G) = self._calculate_B_and_G(E_C_A_B[:,xN:])
     
         return A_dx, B, C, G
   
@@ -526,36 +561,31 @@ class EKFArrivalCost(object):
         """
         xN = self._nvar['x']
         C = N.zeros((len(self._measured_var_names),xN))
-        for i, name in enumerate(self._measured_var_names):
-            (index, type) = self._name_map[name]
-            if type == 'x':
-                C[i, index] = 1.
-            else:
-                C[i,:] = E_C_A[xN+index,:]
+        C[self._meas_x] = 1.
+        (rows, indices) = self._meas_c
+        C[rows,:] = E_C_A[xN+indices,:]
     
         return C
   
-    def _calculate_B_and_G(self, E_C, B):
+    def _calculate_B_and_G(self, E_C_B):
         """
-        Calculates the B and G matrices of the linearised system. 
-        This is done by solving the linear system
+        Calculates the B and G matrices of the linearised system 
+        from the solution of the linear system
         
         [E - C][xdot c]^T = Bu
         
-        to get the equations corresponding to the derivatives of the 
-        state vector. The rows corresponding to control signal are 
-        then used to create the B matrix of the linearised system and 
-        the rows corresponding to process noise variables are used to 
-        create the G matrix.
+        The equations corresponding to the derivatives of the state 
+        vector are used. The columns corresponding to control signals 
+        then form the B matrix of the linearised system and the 
+        columns corresponding to process noise variables form the G 
+        matrix.
         
         Parameters::
-            E_C --  
-                The [E - C] matrix in the linear system of equations 
-                above. 2D numpy array
-            
-            B --  
-                The jacobian matrix of the systems DAE with respect 
-                to the control signals. 2D numpy array
+            E_C_B --  
+                The matrix [E - C]^(-1)B from the solved linear 
+                system described above, where B is the jacobian 
+                matrix of the systems DAE with respect to the 
+                control signals. 2D numpy array
         Returns::
             B --
                 The B matrix of the linearised system. 2D numpy array
@@ -563,18 +593,9 @@ class EKFArrivalCost(object):
             G --
                 The G matrix of the linearised system. 2D numpy array
         """
-        B_du = N.linalg.solve(E_C, B)
-        B_du = B_du[0:self._nvar['x'],:]
-        noise_cols = []
-        input_cols = []
-        for input in self._input_names:
-            input_cols.append(self._name_map[input][0])
-
-        for name in self._process_noise_names:
-            noise_cols.append(self._name_map[name][0])
-    
-        G = B_du[:,noise_cols]
-        B = B_du[:,input_cols]
+        B_du = E_C_B[0:self._nvar['x'],:]
+        G = B_du[:,self._noise_cols]
+        B = B_du[:,self._input_cols]
         return B, G
   
     def _backward_euler_discretize(self, Ac, Bc, Gc):
@@ -608,10 +629,16 @@ class EKFArrivalCost(object):
                 The G matrix of the discrete, linearised system. 
                 2D numpy array
         """
-        I = N.eye(self._nvar['x'])
-        Ad = N.linalg.solve((I - self.sample_time*Ac),I)
-        Bd = self.sample_time*N.dot(Ad,Bc)
-        Gd = self.sample_time*N.dot(Ad,Gc)
+        xN = self._nvar['x']
+        nB = Bc.shape[1]
+        I = N.eye(xN)
+        #Solve for all matrices with the same factorization
+        AdBdGd = N.linalg.solve((I - self.sample_time*Ac), 
+                                N.concatenate((I, self.sample_time*Bc, 
+                                               self.sample_time*Gc), 1))
+        Ad = AdBdGd[:,:xN]
+        Bd = AdBdGd[:,xN:xN+nB]
+        Gd = AdBdGd[:,xN+nB:]
         return Ad, Bd, Gd
   
     def get_next_P(self, t, x, dx, u, c):
@@ -662,6 +689,53 @@ class EKFArrivalCost(object):
               'c':c}
         
         E, A, B, C = self._evaluate_jacobian_functions(z0, t)
+        return self._next_P(E, A, B, C)
+    
+    def get_next_P_vectors(self, t, x, dx, u, c):
+        """
+        Calculate the error covariance matrix at the next time step, 
+        see get_next_P. The work point is given as vectors instead of 
+        lists of tuples, which avoids looking up the variables by name.
+        
+        Parameters::
+            t --
+                The time of the work point. Given as a float.
+          
+            x --
+                1D numpy array with the values of the states, in the 
+                order of state_names.
+            
+            dx --
+                1D numpy array with the values of the derivatives of 
+                the states, in the order of state_names.
+          
+            u --
+                1D numpy array with the values of the control signals, 
+                in the order of the input_names option. The process 
+                noise and the undefined inputs are zero.
+            
+            c --
+                1D numpy array with the values of the algebraic 
+                variables, in the order of alg_var_names.
+            
+        Returns::
+            P --
+                The updated error covariance matrix. 2D numpy array.
+        """
+        u_all = N.zeros(self._nvar['u'])
+        u_all[:len(self._input_names)] = u
+        E, A, B, C = self._evaluate_linearization(t, dx, x, c, u_all)
+        return self._next_P(E, A, B, C)
+    
+    def _next_P(self, E, A, B, C):
+        """
+        Linearises, discretizes and updates the error covariance 
+        matrix from the Jacobians of the DAE residual. 
+        
+        Returns::
+            P --
+                The updated error covariance matrix. 2D numpy array.
+        """
         A, B, C, G = self._calculate_A_B_C_and_G(A, B, C, E)
         
         Ad, Bd, Gd = self._backward_euler_discretize(A, B, G)
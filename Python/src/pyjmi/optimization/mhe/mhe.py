@@ -15,10 +15,12 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import numpy as N
+from scipy.linalg import cho_factor, cho_solve
 from collections import Iterable, OrderedDict
 from casadi import MX
 from pyjmi.optimization.casadi_collocation import ExternalData
 from pyjmi.common.algorithm_drivers import OptionBase
+from pyjmi.jmi_algorithm_drivers import LocalDAECollocationAlg
 import modelicacasadi_wrapper as mc
 
 from .ekf_arrival_cost import EKFArrivalCost
@@ -127,20 +129,40 @@ class MHE(object):
         alg_list = [(name, k) for k, name in enumerate(self._alg_var_names)]
         self._variable_row_map = dict(x_list + dx_list + alg_list)
     
-        self._dx_est = N.zeros((self._size_dict['x'], 1))
+        #Create the buffers that keep track of the data over the horizon. 
+        #They hold at most horizon + 2 samples, the time vector including 
+        #the next sample
+        size = int(self.horizon) + 2
+        keep_history = self.MHE_opts['keep_history']
+        self._time_buffer = HorizonBuffer(1, size, keep_history)
+        self._u_buffer = HorizonBuffer(self._size_dict['u'], size, 
+                                       keep_history, extend=True)
+        self._y_buffer = HorizonBuffer(self._size_dict['y'], size, 
+                                       keep_history, extend=True)
+        self._x_est_buffer = HorizonBuffer(self._size_dict['x'], size, 
+                                           keep_history)
+        self._dx_est_buffer = HorizonBuffer(self._size_dict['x'], size, 
+                                            keep_history)
+        self._c_est_buffer = HorizonBuffer(self._size_dict['c'], size, 
+                                           keep_history)
+    
+        dx_est = N.zeros(self._size_dict['x'])
         for name, value in dx_0:
             row = self._variable_row_map[name]
-            self._dx_est[row,0] = value
+            dx_est[row] = value
+        self._dx_est_buffer.append(dx_est)
     
-        self._c_est = N.zeros((self._size_dict['c'],1))
+        c_est = N.zeros(self._size_dict['c'])
         for name, value in c_0:
             row = self._variable_row_map[name]
-            self._c_est[row,0] = value
+            c_est[row] = value
+        self._c_est_buffer.append(c_est)
     
-        self.x_est = N.zeros((self._size_dict['x'],1))
+        x_est = N.zeros(self._size_dict['x'])
         for name, value in list(self._x_0_guess.items()):
             row = self._variable_row_map[name]
-            self.x_est[row,0] = value
+            x_est[row] = value
+        self._x_est_buffer.append(x_est)
         
         #Create the EKF-object
         self.EKF_object = EKFArrivalCost(self.op, 
@@ -166,8 +188,8 @@ class MHE(object):
     
     
         self.next_time_index = 1
-        #Creates an array that keeps track of the time points
-        self._time_vector = [0]
+        #Add the first time point
+        self._time_buffer.append(0.)
         #Creates the options object for the optimization
         self._opts = self.op.optimize_options()
         #Specifies backward Euler
@@ -177,6 +199,9 @@ class MHE(object):
         self._opts["IPOPT_options"] = self.MHE_opts['IPOPT_options']
         ###Dirty flag indicating change of the parameters
         self._dirty = False
+        #The persistent collocator used once the horizon is full, created 
+        #on demand if the persistent_solver option is set
+        self._collocator = None
             
          
     def _create_alias_dict(self, x_0_guess):
@@ -977,6 +1002,40 @@ class MHE(object):
         timed_part = w_timed_part + v_timed_part
         return timed_part
     
+    @property
+    def x_est(self):
+        """
+        The state estimates over the current horizon, as a 2D numpy 
+        array with one row per state and one column per time point. 
+        The array is a copy of the estimates.
+        """
+        return self._x_est_buffer.get().copy()
+    
+    @property
+    def u(self):
+        """
+        The control signals over the current horizon, as a 2D numpy 
+        array with one row per input. The array is a copy of the 
+        control signals.
+        """
+        return self._u_buffer.get().copy()
+    
+    @property
+    def y(self):
+        """
+        The measurements over the current horizon, as a 2D numpy 
+        array with one row per measured variable. The array is a copy 
+        of the measurements.
+        """
+        return self._y_buffer.get().copy()
+    
+    @property
+    def _time_vector(self):
+        """
+        The time points of the current horizon, as a 1D numpy array.
+        """
+        return self._time_buffer.get()[0]
+    
     def step(self, u, y):
         """
         Estimates the state vector at the next sample using the 
@@ -1003,7 +1062,7 @@ class MHE(object):
                 values.
         """
         #Add the time of the next sample to the time vector
-        self._time_vector.append(self.next_time_index*self.sample_time)
+        self._time_buffer.append(self.next_time_index*self.sample_time)
         #Check the input and measurement names for errors and aliases
         (u, y) = self._check_u_and_y(u, y)
         self._append_new_data(u,y)
@@ -1015,40 +1074,29 @@ class MHE(object):
                 self.EKF_object.recalculate_jacobian_functions()
                 self._dirty = False
             #LINEARIZE
-            u_lin = []
-            x_lin = []
-            dx_lin = []
-            alg_lin = []
+            #The rows of the buffers are in the order expected by the 
+            #EKF, the undefined inputs are zero
             t0 = self._time_vector[0]
-      
-            for k, name in enumerate(self._state_names):
-                x_lin.append((name, self.x_est[k,0]))
-      
-            for k, name in enumerate(self.MHE_opts['input_names']):
-                u_lin.append((name, self.u[k,0]))
-            
-            #Add undefined inputs
-            for name in self._undefined_input_names:
-                u_lin.append((name, 0.))
-            
-            for k, name in enumerate(self._state_names):
-                dx_lin.append(('der(' + name + ')', self._dx_est[k,0]))
-      
-            for k, name in enumerate(self._alg_var_names):
-                alg_lin.append((name, self._c_est[k,0]))
-      
-            P = self.EKF_object.get_next_P(t0, x_lin, dx_lin, u_lin , 
-                                            alg_lin)
-            Pinv = N.linalg.inv(P)
+            P = self.EKF_object.get_next_P_vectors(t0, 
+                                        self._x_est_buffer.get()[:,0], 
+                                        self._dx_est_buffer.get()[:,0], 
+                                        self._u_buffer.get()[:,0], 
+                                        self._c_est_buffer.get()[:,0])
+            #P is a covariance matrix, invert it using its Cholesky 
+            #factorization
+            try:
+                Pinv = cho_solve(cho_factor(P), N.eye(len(P)))
+            except N.linalg.LinAlgError:
+                Pinv = N.linalg.inv(P)
             for (index, name) in self._P_index_name_list:
                 self.op.set(name, Pinv[index])
       
             #Remove the oldest data
             self._remove_old_data()
             
-            
+            x_est = self._x_est_buffer.get()
             for (k, name) in enumerate(self._state_names):
-                self.op.set('_MHE_x_0_guess_' + name, self.x_est[k,0])
+                self.op.set('_MHE_x_0_guess_' + name, x_est[k,0])
       
             startTime = self._time_vector[0]
     
@@ -1062,21 +1110,140 @@ class MHE(object):
         n_e = (len(self._time_vector) - 1)
         self._opts['n_e'] = n_e
         self._opts['blocking_factors'] = [1] * (n_e)
+        #The inputs and measurements are extended by one sample to 
+        #account for the next time point
         t_interval = self._time_vector
-        y_interval = self.y
-        u_interval = self.u
-        external_data = self._create_external_data(t_interval, 
-                                                   y_interval, 
-                                                   u_interval)
-        self._opts['external_data'] = external_data
-        res = self.op.optimize(options = self._opts)
+        y_interval = self._y_buffer.get(extended=True)
+        u_interval = self._u_buffer.get(extended=True)
+        if self.MHE_opts['persistent_solver'] and \
+           self.next_time_index > self.horizon:
+            res = self._solve_persistent(t_interval, y_interval, u_interval)
+        else:
+            external_data = self._create_external_data(t_interval, 
+                                                       y_interval, 
+                                                       u_interval)
+            self._opts['external_data'] = external_data
+            res = self.op.optimize(options = self._opts)
         x_est_dict = self._append_results(res)
         self.next_time_index += 1
         return x_est_dict
           
+    def _solve_persistent(self, t, y, u):
+        """
+        Solves the estimation problem for a full horizon using a 
+        collocator that is only discretized once. 
+        
+        The collocator is created the first time the horizon is full. 
+        In each subsequent call only the eliminated inputs, measurements 
+        and parameters are updated and the NLP solver is warm started 
+        from the previous solution shifted one sample.
+        
+        The NLP keeps the time points of the horizon it was created 
+        for. Explicit time dependence in the model is thus evaluated 
+        in that frame, and the external data is shifted into it.
+        
+        Parameters::
+            t --
+                List of the time points of the current horizon.
+            
+            y --
+                2D numpy array of the measurements of the current 
+                horizon, extended with the next sample. Each row 
+                corresponds to a measured variable.
+            
+            u --
+                2D numpy array of the control signals of the current 
+                horizon, extended with the next sample. Each row 
+                corresponds to an input.
+                
+        Returns::
+            res --
+                A dictionary with the names of the states, their 
+                derivatives and the algebraic variables as keys and 
+                their trajectories over the horizon as values.
+        """
+        if self._collocator is None:
+            self._create_persistent_collocator(t, y, u)
+        else:
+            coll = self._collocator
+            #Shift the external data into the time frame of the NLP
+            t_nlp = N.array(t) - t[0] + coll.time_points[1][0]
+            external_data = self._create_external_data(t_nlp, y, u)
+            for (name, data) in external_data.eliminated.items():
+                coll.set_external_variable_data(name, data)
+            #Warm start from the previous solution shifted one sample.
+            #The constraint multipliers belong to the unshifted horizon,
+            #so they are reset.
+            if not coll.warm_start:
+                self._set_persistent_warm_start()
+            coll.xx_init = coll.primal_opt[self._shift_indices]
+            coll.dual_opt['x'] = coll.dual_opt['x'][self._shift_indices]
+            coll.dual_opt['g'] = N.zeros_like(coll.dual_opt['g'])
+        coll = self._collocator
+        coll._recalculate_model_parameters()
+        coll.solve_nlp()
+        
+        #Move the result time vector to the current horizon
+        coll.time = coll.time + (t[0] - coll.time[0])
+        coll.t0 = t[0]
+        coll.tf = t[-1]
+        result = coll.get_result()
+        
+        trajectories = {'dx':result[1], 'x':result[2], 'w':result[4], 
+                        'elim_var':result[7]}
+        res = {}
+        names = self._state_names + self._alg_var_names + \
+                ['der(' + name + ')' for name in self._state_names]
+        for name in names:
+            (index, kind) = coll.name_map[name]
+            res[name] = trajectories[kind][:,index]
+        return res
+    
+    def _create_persistent_collocator(self, t, y, u):
+        """
+        Discretizes the estimation problem for the full horizon and 
+        stores the collocator for reuse in the following samples.
+        
+        Parameters::
+            t --
+                List of the time points of the current horizon.
+            
+            y --
+                2D numpy array of the measurements of the current 
+                horizon, extended with the next sample.
+            
+            u --
+                2D numpy array of the control signals of the current 
+                horizon, extended with the next sample.
+        """
+        opts = self.op.optimize_options()
+        opts.update(self._opts)
+        opts['external_data'] = self._create_external_data(t, y, u)
+        opts['mutable_external_data'] = True
+        opts['result_mode'] = 'collocation_points'
+        self._collocator = LocalDAECollocationAlg(self.op, opts).nlp
+        self._shift_indices = self._collocator.get_shift_indices(1)
+    
+    def _set_persistent_warm_start(self):
+        """
+        Enables warm start of the NLP solver in the persistent 
+        collocator. The IPOPT options given by the user take 
+        precedence over the default warm start options.
+        """
+        coll = self._collocator
+        solver = coll.solver_object
+        ipopt_opts = self.MHE_opts['IPOPT_options']
+        if ipopt_opts.get('warm_start_init_point') is None:
+            solver.setOption('warm_start_init_point', 'yes')
+        if ipopt_opts.get('mu_init') is None:
+            solver.setOption('mu_init', 1e-3)
+        solver.init()
+        coll._init_and_set_solver_inputs()
+        coll.warm_start = True
+    
     def _append_new_data(self, u, y):
         """
-        Appends the input for the next sample to the arrays that 
+        Appends the input for the next sample to the buffers that 
         keep track of them.
     
         Parameters::
@@ -1090,31 +1257,18 @@ class MHE(object):
             tuples on the form (name, value) where name is the name 
             of the measured variable and value is its value.
         """
-        #Check if first time step, if so create the arrays used to save the 
-        #data, otherwise add the new data to the already existing arrays
-        if self.next_time_index == 1:
-            self.y = N.zeros((self._size_dict['y'],1))
-            for name, value in y:
-                row = self._input_row_map[name]
-                self.y[row,0] = value
-            
-            self.u = N.zeros((self._size_dict['u'],1))
-            for name, value in u:
-                row = self._input_row_map[name]
-                self.u[row,0] = value
-        else:
-            #Append y-data
-            y_t = N.zeros((self._size_dict['y'],1))
-            for name, value in y:
-                row = self._input_row_map[name]
-                y_t[row,0] = value
-            self.y = N.hstack([self.y, y_t])
-            #Append u-data  
-            u_t = N.zeros((self._size_dict['u'],1))
-            for name, value in u:
-                row = self._input_row_map[name]
-                u_t[row,0] = value
-            self.u = N.hstack([self.u, u_t])
+        #Append y-data
+        y_t = N.zeros(self._size_dict['y'])
+        for name, value in y:
+            row = self._input_row_map[name]
+            y_t[row] = value
+        self._y_buffer.append(y_t)
+        #Append u-data  
+        u_t = N.zeros(self._size_dict['u'])
+        for name, value in u:
+            row = self._input_row_map[name]
+            u_t[row] = value
+        self._u_buffer.append(u_t)
     
     def _check_u_and_y(self, u, y):
         """
@@ -1161,16 +1315,14 @@ class MHE(object):
         """
         Removes the data at the oldest time sample.
         """
-        self._time_vector = self._time_vector[1:]
-        self.u = self.u[:,1:]
-        self.y = self.y[:,1:]
-        self.x_est = self.x_est[:,1:]
-        self._dx_est = self._dx_est[:,1:]
-        self._c_est = self._c_est[:,1:]
+        for buf in [self._time_buffer, self._u_buffer, self._y_buffer, 
+                    self._x_est_buffer, self._dx_est_buffer, 
+                    self._c_est_buffer]:
+            buf.remove_first()
     
     def _append_results(self, res):
         """
-        Adds the latest set of results to the arrays containing the 
+        Adds the latest set of results to the buffers containing the 
         estimated variables. And returns the estimate for the next 
         time point.
         
@@ -1184,32 +1336,54 @@ class MHE(object):
                 as keys and the state estimates at the next sample as 
                 values.
         """
-        x_est_t = N.zeros((self._size_dict['x'],1))
+        x_est_t = N.zeros(self._size_dict['x'])
         x_est_dict = {}
         for k, name in enumerate(self._state_names):
             value = res[name][-1]
             x_est_dict[self._state_alias_dict[name]] = value
-            x_est_t[k,0] = value 
-        self.x_est = N.hstack((self.x_est, x_est_t))
+            x_est_t[k] = value 
+        self._x_est_buffer.append(x_est_t)
     
-        dx_est_t = N.zeros((self._size_dict['x'],1))
+        dx_est_t = N.zeros(self._size_dict['x'])
         for k, name in enumerate(self._state_names):
             dx_name = 'der(' + name + ')'
-            dx_est_t[k,0] = res[dx_name][-1]
-        self._dx_est = N.hstack((self._dx_est,dx_est_t))
+            dx_est_t[k] = res[dx_name][-1]
+        self._dx_est_buffer.append(dx_est_t)
     
-        c_est_t = N.zeros((self._size_dict['c'],1))
+        c_est_t = N.zeros(self._size_dict['c'])
         for k, name in enumerate(self._alg_var_names):
-            c_est_t[k,0] = res[name][-1]
-        self._c_est = N.hstack((self._c_est,c_est_t))
+            c_est_t[k] = res[name][-1]
+        self._c_est_buffer.append(c_est_t)
         return x_est_dict
+    
+    def get_history(self):
+        """
+        Returns the estimates of all samples so far. Requires that the 
+        option keep_history is True.
+        
+        Returns::
+            history --
+                A dictionary with 'time' and the state names defined 
+                by the user as keys. The values are 1D numpy arrays 
+                with the time points and the state estimates at these, 
+                starting with the initial guess. The arrays are views 
+                that are only valid until the next step.
+        """
+        if not self.MHE_opts['keep_history']:
+            raise RuntimeError("The history is only kept if the option " + 
+                               "keep_history is True.")
+        x_est = self._x_est_buffer.get_history()
+        history = {'time':self._time_buffer.get_history()[0,:x_est.shape[1]]}
+        for k, name in enumerate(self._state_names):
+            history[self._state_alias_dict[name]] = x_est[k]
+        return history
   
     def _create_external_data(self, t, y, u):
         """
         Creates the ExternalData object that is used to eliminate 
         inputs in the optimization. The input signals and the 
-        measurements are extended by one to account for the next 
-        sample. The masking signal removes the importance of 
+        measurements are given extended by one to account for the 
+        next sample. The masking signal removes the importance of 
         the last measurement by adopting the appropriate values. 
         
         Also eliminates the unspecified input signals by putting them 
@@ -1222,11 +1396,13 @@ class MHE(object):
           
           y --
             2D numpy array of the measurements that are to be 
-            eliminated. Each row corresponds to a measured variable.
+            eliminated, with one column per time point. Each row 
+            corresponds to a measured variable.
             
           u --
             2D numpy array of the control signal that are to be 
-            eliminated. Each row corresponds to an input.
+            eliminated, with one column per time point. Each row 
+            corresponds to an input.
             
         Returns::
           external_data --
@@ -1234,9 +1410,6 @@ class MHE(object):
             the optimization.
         """
         eliminated = OrderedDict()
-        #Extend the input signals
-        u = N.vstack((u.T, u[:,-1])).T
-    
         #Eliminate input signals 
         for (k, input_name) in enumerate(self._input_var_names):
             self._add_eliminated_row(t, u[k,:], input_name, eliminated)
@@ -1244,9 +1417,6 @@ class MHE(object):
         for name in self._undefined_input_names:
             self._add_eliminated_row(t, N.zeros(N.shape(t)), name, eliminated)
         
-        #Extend the measurement signal
-        y = N.vstack((y.T, y[:,-1])).T
-        
         #Eliminate measurements
         for (k, name) in enumerate(self._measured_var_names):
             meas_name = '_MHE_y_meas_' + name
@@ -1333,6 +1503,8 @@ class MHE(object):
                                                    '_MHE_Qinv')
         #Set the objective
         self._set_objectives()
+        #The objective of the persistent NLP is no longer valid
+        self._collocator = None
         #Change the matrix in the EKF_object
         self.EKF_object.update_process_noise_covariance_matrix(
                                                        process_noise_cov)
@@ -1370,6 +1542,8 @@ class MHE(object):
                                                    '_MHE_Rinv')
         #Set the objective
         self._set_objectives()
+        #The objective of the persistent NLP is no longer valid
+        self._collocator = None
         #Change the matrix in the EKF_object
         self.EKF_object.update_measurement_noise_covariance_matrix(
                                                             measurement_cov)
@@ -1516,13 +1690,134 @@ class MHEOptions(OptionBase):
             IPOPT options for solution of NLP. See IPOPT's 
             documentation for available options.
             Default: Empty dictionary.
+            
+        persistent_solver --
+            If True, the NLP is only discretized once the horizon 
+            is full. Each following sample then only updates the 
+            inputs, measurements and arrival cost parameters, and 
+            warm starts the NLP solver from the previous solution 
+            shifted one sample. Explicit time dependence in the 
+            model is evaluated in the time frame of the first full 
+            horizon.
+            Default: False
+            
+        keep_history --
+            If True, the estimates of all samples are kept and can be 
+            retrieved with MHE.get_history. Otherwise only the data 
+            of the current horizon is stored.
+            Default: False
     """
     def __init__(self, *args, **kw):
         _defaults = {'input_names':[],
                      'process_noise_cov':[],
                      'measurement_cov':[],
                      'P0_cov':[],
-                     'IPOPT_options':{}}
+                     'IPOPT_options':{},
+                     'persistent_solver':False,
+                     'keep_history':False}
         super(MHEOptions, self).__init__(_defaults)
         self.update(*args, **kw)
 
+
+class HorizonBuffer(object):
+    """
+    Storage of the columns of a 2D array over a moving horizon. Columns 
+    are appended at the end and removed from the beginning, and the 
+    current columns are returned as a view without copying them. 
+    
+    Unless the history is kept, the storage has a fixed size of twice 
+    the horizon, and the current columns are moved to the beginning of 
+    it when it is full. This happens at most once every size samples.
+    """
+    
+    def __init__(self, n_rows, size, keep_history=False, extend=False):
+        """
+        Create an empty buffer.
+        
+        Parameters::
+            n_rows --
+                The number of rows.
+            
+            size --
+                The maximum number of columns in the horizon.
+            
+            keep_history --
+                If True, removed columns are kept and can be retrieved 
+                with get_history. The storage then grows when needed.
+                Default: False
+            
+            extend --
+                If True, the last appended column is repeated once 
+                after the end of the horizon, see get.
+                Default: False
+        """
+        self._n_extra = 1 if extend else 0
+        self._keep_history = keep_history
+        self._data = N.zeros((n_rows, 2*size + self._n_extra))
+        self._start = 0
+        self._end = 0
+    
+    def __len__(self):
+        return self._end - self._start
+    
+    def append(self, column):
+        """
+        Append a column at the end of the horizon.
+        
+        Parameters::
+            column --
+                1D numpy array with one element per row.
+        """
+        if self._end + 1 + self._n_extra > self._data.shape[1]:
+            self._make_room()
+        self._data[:,self._end:self._end + 1 + self._n_extra] = \
+            N.reshape(column, (-1, 1))
+        self._end += 1
+    
+    def remove_first(self):
+        """
+        Remove the first column of the horizon.
+        """
+        self._start += 1
+    
+    def get(self, extended=False):
+        """
+        Returns a view of the columns of the horizon.
+        
+        Parameters::
+            extended --
+                If True, the last column is repeated once at the end. 
+                Requires that the buffer was created with extend.
+                Default: False
+                
+        Returns::
+            2D numpy array, only valid until the next call to append.
+        """
+        end = self._end + (self._n_extra if extended else 0)
+        return self._data[:,self._start:end]
+    
+    def get_history(self):
+        """
+        Returns a view of all columns appended so far. Requires that the 
+        buffer was created with keep_history.
+        
+        Returns::
+            2D numpy array, only valid until the next call to append.
+        """
+        return self._data[:,:self._end]
+    
+    def _make_room(self):
+        """
+        Makes room for a new column by growing the storage if the 
+        history is kept, otherwise by moving the columns of the 
+        horizon to the beginning of the storage.
+        """
+        if self._keep_history:
+            data = N.zeros((self._data.shape[0], 2*self._data.shape[1]))
+            data[:,:self._end] = self._data[:,:self._end]
+            self._data = data
+        else:
+            n = self._end - self._start
+            self._data[:,:n] = self._data[:,self._start:self._end]
+            self._start = 0
+            self._end = n
@@ -14,7 +14,6 @@
 #
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
-from pyjmi.common.io import ResultDymolaTextual
 from pyjmi.jmi_algorithm_drivers import MPCAlgResult, LocalDAECollocationAlg, LocalDAECollocationAlgOptions
 from pyjmi.optimization.casadi_collocation import BlockingFactors
 import time, types
@@ -48,7 +47,7 @@ class MPC(object):
     def __init__(self, op, options, sample_period, horizon, 
                  initial_guess='shift', create_comp_result=True,
                  constr_viol_costs={}, warm_start_options={},
-                 noise_seed=None):
+                 noise_seed=None, comp_result_file=None):
         """
         Creates the NLP that corresponds to the op we want to solve with MPC.
 
@@ -72,10 +71,9 @@ class MPC(object):
                 guess for the primal variables.
                 'shift': Use the shift method to shift the NLP result vector 
                 from the last successful optimization one collocation element.  
-                'trajectory': Extract xx_init from the result reajectories of
-                the last successful optimization.
-                optimization.
-                from a result file.
+                'trajectory': Interpolate the NLP result vector from the last
+                successful optimization onto the shifted time grid of the
+                next optimization. No result file is written.
                 'prev': Use the NLP result vector from the last successful 
                 optimization as it is.
                 Default: 'shift'
@@ -101,6 +99,14 @@ class MPC(object):
                 The seed to use for adding noise when using the method
                 extract_states().
                 Default: None
+                
+            comp_result_file --
+                The name of a file to which the complete result is appended
+                after each sample, instead of keeping it in memory while the
+                MPC runs. The file is in binary format and is read by 
+                get_complete_results, which still creates the complete result
+                in memory. Only used if create_comp_result is True.
+                Default: None
         """
         self._create_clock()
         self.op = op
@@ -122,16 +128,7 @@ class MPC(object):
         self.create_comp_result = create_comp_result
         self.warm_start_options = warm_start_options
         
-        # Create complete result lists
-        if self.create_comp_result:
-            self.res= {}
-            self.res['t'] = []
-            self.res['dx'] = []
-            self.res['x'] = []
-            self.res['u'] = []
-            self.res['w'] = []
-            self.res['elim_vars'] = []
-
+        self.comp_result_file = comp_result_file
             
         # Create array to storage eliminated variables
         self.eliminated_variables = op.getEliminatedVariables()
@@ -145,6 +142,7 @@ class MPC(object):
         self._mpc_result_file_name = op.getIdentifier()+'_mpc_result.txt'
         self.result_file_name = op.getIdentifier()
         self._init_traj_set_by_user = False
+        self._shift_indices = None
 
         self.startTime= self.op.get('startTime')
         if noise_seed:
@@ -181,6 +179,16 @@ class MPC(object):
 
         self.collocator.result_file_name= self.result_file_name
         
+        # Create complete result storage
+        if self.create_comp_result:
+            self._res_names = [var.getName() for vt in ['dx', 'x', 'u', 'w']
+                               for var in self.collocator.mvar_vectors[vt]]
+            self._res_elim_names = [var.getName() for var in
+                                    self.eliminated_variables]
+            self.res = MPCResultStore(1 + len(self._res_names) +
+                                      len(self._res_elim_names),
+                                      self.comp_result_file)
+        
         if self.options['solver'] == 'IPOPT':
             self.successful_optimization = ['Solve_Succeeded', 
                                             'Solved_To_Acceptable_Level']
@@ -507,34 +515,25 @@ class MPC(object):
 
     def _append_to_result_file(self, sim_res):
         """
-        Extracts the results in sim_res and appends it to the result lists.
+        Extracts the results in sim_res and appends it to the complete result
+        as one block, with one column per variable.
         """
-        var_type = ['dx', 'x', 'u', 'w']
-        n_values = len(sim_res['time'])
+        time = sim_res['time']
+        block = N.empty([len(time), self.res.n_columns])
+        block[:, 0] = time
         
-        for k in range(n_values):
-            self.res['t'].append(sim_res['time'][k])
-        for k in range(n_values):
-            for n in var_type:   
-                n_var_type = self.collocator.n_var[n]
-                
-                if n_var_type == 0:
-                    self.res[n].append([])
-                    
-                for i in range(n_var_type):
-                    try:
-                        res_var = sim_res[self.collocator.mvar_vectors[n][i].\
-                                          getName()]
-                    except VariableNotFoundError:
-                        res_var = N.array([0]*n_values)
-                    self.res[n].append(res_var[k])
-                    
-        elims = N.zeros(len(self.eliminated_variables))
-        for k in range(n_values):
-            for i,var in enumerate (self.eliminated_variables):
-                elims[i] = sim_res[var.getName()][k]
-            
-            self.res['elim_vars'].append(elims)
+        col = 1
+        for name in self._res_names:
+            try:
+                block[:, col] = sim_res[name]
+            except VariableNotFoundError:
+                block[:, col] = 0
+            col += 1
+        for name in self._res_elim_names:
+            block[:, col] = sim_res[name]
+            col += 1
+        
+        self.res.append(block)
        
     def _add_times(self):
         """
@@ -593,9 +592,17 @@ class MPC(object):
         if self._sample_nbr == 1:
             return measurements
         else:
+            # In trajectory mode no result object is created in sample, the 
+            # states are read from the result of the last optimization
+            from_result = self.initial_guess == 'trajectory'
             for name in self.state_names:
                 name_init = "_start_"+name
-                measurements[name_init] = self._result_object[name]\
+                if from_result:
+                    (ind, _) = self.collocator.name_map[name]
+                    measurements[name_init] = self.result[2]\
+                                    [self._nbr_values_sample-1, ind]
+                else:
+                    measurements[name_init] = self._result_object[name]\
                                     [self._nbr_values_sample-1]
                 val = N.abs(measurements[name_init])
                 if val != 0:
@@ -607,10 +614,10 @@ class MPC(object):
     def _shift_xx(self):
         """
         Shifts the result from the previous optimation and gives it as initial 
-        guess for the next optimation.
+        guess for the next optimation. If the last optimization was 
+        successful, the dual variables of the variable bounds are shifted in 
+        the same way.
         """
-
-        xx_result = {}
         # If last optimization was successful, shift the result.
         # Otherwise shift the last successful result.
         if self.found_solution: 
@@ -620,6 +627,42 @@ class MPC(object):
             
         #~ xx_result = self.collocator.named_xx  #Used for debugging 
 
+        if self._shift_indices is None:
+            self._shift_indices = self._get_shift_indices(len(xx_result))
+        shifted_xx = xx_result[self._shift_indices]
+
+        # The dual variables are in the order of the solver. The constraint 
+        # multipliers are kept as they are.
+        if self.found_solution and self.collocator.order == "default":
+            self.collocator.dual_opt['x'] = \
+                            self.collocator.dual_opt['x'][self._shift_indices]
+        
+        # Save the shifted result in the collocator and locally
+        self.collocator.xx_init = shifted_xx
+        self.shifted_xx = shifted_xx
+
+    def _get_shift_indices(self, n_xx):
+        """
+        Computes the indices that shift the result of an optimization one 
+        sample, such that the shifted result is xx_result[indices]. Values 
+        that are shifted in from beyond the end of the horizon are 
+        extrapolated with the last value. 
+        
+        The indices only depend on the structure of the NLP, and are 
+        therefore only computed once.
+
+        Parameters::
+
+            n_xx --
+                The number of NLP variables.
+
+        Returns::
+
+            indices --
+                Integer array of length n_xx.
+        """
+        xx = N.arange(n_xx)
+
         # Map with splited order
         split_map = dict()
         split_map['x'] = 0
@@ -634,25 +677,20 @@ class MPC(object):
         n_e = self.options['n_e']
         n_cp = self.options['n_cp']
         n_e_s= self.n_e_s
-        # Create map for the shifted results
-        shifted_xx = xx_result[0:0]
+        # List of the index blocks of the shifted result
+        shifted = []
 
         is_x = 1
 
         # Shift x, dx and w
-        
         for vk in ['x', 'dx', 'w']:
             start=gsi[split_map[vk]]
             end = gsi[split_map[vk]+1]
 
             n_var = self.collocator.n_var[vk]
 
-            new_xx = xx_result[start+n_var*n_e_s*(n_cp+is_x):end]
-            new_xx_extrapolate = xx_result[end-n_var:end]
-            shifted_xx = N.concatenate((shifted_xx, new_xx))
-            
-            for i in range((n_cp+is_x)*n_e_s):
-                shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+            shifted.append(xx[start+n_var*n_e_s*(n_cp+is_x):end])
+            shifted.append(N.tile(xx[end-n_var:end], (n_cp+is_x)*n_e_s))
             is_x = 0
 
         # Shift inputs without blocking factors
@@ -665,12 +703,9 @@ class MPC(object):
         start_cont_u=gsi[split_map['unelim_u']]
         end_cont_u = start_cont_u + n_cont_u*n_cp*n_e
 
-        new_xx = xx_result[start_cont_u+n_cont_u*n_cp*n_e_s:end_cont_u]
-        new_xx_extrapolate = xx_result[end_cont_u-n_cont_u:end_cont_u]
-        shifted_xx = N.concatenate((shifted_xx, new_xx))
-
-        for i in range(n_cp*n_e_s):
-            shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+        shifted.append(xx[start_cont_u+n_cont_u*n_cp*n_e_s:end_cont_u])
+        shifted.append(N.tile(xx[end_cont_u-n_cont_u:end_cont_u], 
+                              n_cp*n_e_s))
 
         # Shift inputs with blocking factors 
         n_bf_u = self.collocator.n_var['unelim_u'] - n_cont_u
@@ -681,19 +716,15 @@ class MPC(object):
 
             end_bf_u = start_bf_u + len(factors)
 
-            new_xx = xx_result[start_bf_u+n_bf_u:end_bf_u]
-            new_xx_extrapolate = xx_result[end_bf_u-n_bf_u:end_bf_u]
-            
-            shifted_xx = N.concatenate((shifted_xx, new_xx))
-            shifted_xx = N.concatenate((shifted_xx, new_xx_extrapolate))
+            shifted.append(xx[start_bf_u+n_bf_u:end_bf_u])
+            shifted.append(xx[end_bf_u-n_bf_u:end_bf_u])
             start_bf_u = end_bf_u
 
         # Shift initial controls (without blocking factors)
         start_init_u = gsi[split_map['unelim_u']] + (n_cp*n_e_s-1)*n_cont_u
         end_init_u = start_init_u + n_cont_u
 
-        new_xx = xx_result[start_init_u:end_init_u]
-        shifted_xx = N.concatenate((shifted_xx, new_xx))
+        shifted.append(xx[start_init_u:end_init_u])
 
         # Shift initial dx, w
         for vk in ['dx', 'w']:
@@ -702,20 +733,25 @@ class MPC(object):
             start=gsi[split_map[vk]] + (n_cp*n_e_s-1)*n_var
             end = start+n_var
 
-            new_xx = xx_result[start:end]
-            shifted_xx = N.concatenate((shifted_xx, new_xx))
+            shifted.append(xx[start:end])
 
         # Add p_opt
         start_p = gsi[split_map['p_opt']]
         end_p = gsi[split_map['p_opt']+1]
         
-        new_xx = xx_result[start_p:end_p]
-        shifted_xx = N.concatenate((shifted_xx, new_xx))
+        shifted.append(xx[start_p:end_p])
         
-        # Save the shifted result in the collocator and locally
-        self.collocator.xx_init = shifted_xx
-        self.shifted_xx = shifted_xx
+        return N.concatenate(shifted)
         
+    def _interpolate_xx(self):
+        """
+        Interpolates the result from the last successful optimization onto 
+        the time grid of the next optimization and gives it as initial guess.
+        """
+        time_shift = self.startTime - self._traj_start_time
+        self.collocator.xx_init = self.collocator.get_shifted_xx(
+                                                self._traj_xx, time_shift)
+
     def _recalculate_parameters(self):
         """
         Method that extracts and sets the parameter values from op.
@@ -824,8 +860,7 @@ class MPC(object):
                 if self.initial_guess == 'shift':
                     self._shift_xx()
                 elif self.initial_guess == 'trajectory':
-                    self._init_traj = self._result_object
-                    self._set_inittraj()
+                    self._interpolate_xx()
                 elif self.initial_guess == 'prev':
                     if self.status in self.successful_optimization: 
                         self.collocator.xx_init = self.collocator.primal_opt
@@ -857,11 +892,8 @@ class MPC(object):
             self.result = self.collocator.get_result()
             self.consec_fails = 0
             if self.initial_guess == 'trajectory':
-                self.collocator.export_result_dymola(self.result_file_name)
-                self.collocator.times['init'] = self.update_time
-                self.collocator.times['sol'] = self.sol_time
-                self.collocator.times['post_processing']= time.clock()-self.post_time 
-                self._result_object = self.collocator.get_result_object()
+                self._traj_xx = self.collocator.primal_opt
+                self._traj_start_time = self.startTime
         else:
             if self._sample_nbr == 1:
                 raise RuntimeError("The solver was unable to find a "+\
@@ -923,58 +955,54 @@ class MPC(object):
         Returns the results for the last optimization.
         (a LocalDAECollocationAlgResult-object). 
         """
-        if self.initial_guess != 'trajectory':
-             self.collocator.export_result_dymola(self.result_file_name)
-             self.collocator.times['init'] = self.update_time
-             self.collocator.times['sol'] = self.sol_time
-             self.collocator.times['post_processing']= time.clock()-self.post_time 
-             self._result_object = self.collocator.get_result_object()
+        self.collocator.export_result_dymola(self.result_file_name)
+        self.collocator.times['init'] = self.update_time
+        self.collocator.times['sol'] = self.sol_time
+        self.collocator.times['post_processing']= time.clock()-self.post_time 
+        self._result_object = self.collocator.get_result_object()
              
         return self._result_object
         
     def get_complete_results(self):
         """
-        Creates and returns the patched together resultfile from all 
-        optimizations.
+        Creates and returns the patched together result from all 
+        optimizations. The result file is only written if the option 
+        write_result_file is True. The complete result is created in memory,
+        also if it has been stored in comp_result_file.
         """
         # Check if complete results have been saved
         if self.create_comp_result is False:
             raise  ValueError("'get_complete_results()' only works if" +\
                                 "'create_comp_result' is True.")
         
-        # Convert the complete restults lists to arrays
-        self.res_t = N.array(self.res['t']).reshape([-1, 1])
-        self.res_dx = N.array(self.res['dx']).reshape\
-                                            ([-1, self.collocator.n_var['dx']])
-        self.res_x = N.array(self.res['x']).reshape\
-                                            ([-1, self.collocator.n_var['x']])
-        self.res_u = N.array(self.res['u']).reshape\
-                                            ([-1, self.collocator.n_var['u']])
-        if self.collocator.n_var['w'] >= 1:
-            self.res_w = N.array(self.res['w']).reshape\
-                                            ([-1, self.collocator.n_var['w']])
-        else:
-            self.res_w = N.array(self.res['w'])
-        res_p = N.array(0).reshape(-1)
-        
-        if len(self.eliminated_variables) == 0:
-            self.res_elim_vars = N.ones([len(self.res['t']),0])    
-        else:
-            self.res_elim_vars = N.array(self.res['elim_vars']).reshape\
-                                            ([-1, len(self.eliminated_variables)])                        
+        # Split the columns of the complete result into the variable types
+        data = self.res.get_data()
+        cols = [1]
+        for vt in ['dx', 'x', 'u', 'w']:
+            cols.append(cols[-1] + self.collocator.n_var[vt])
+        self.res_t = data[:, :1]
+        self.res_dx = data[:, cols[0]:cols[1]]
+        self.res_x = data[:, cols[1]:cols[2]]
+        self.res_u = data[:, cols[2]:cols[3]]
+        self.res_w = data[:, cols[3]:cols[4]]
+        self.res_elim_vars = data[:, cols[4]:]
         res_p = N.array(0).reshape(-1)
         
         res = (self.res_t, self.res_dx, self.res_x, self.res_u, 
                         self.res_w, self.p_fixed, res_p, self.res_elim_vars) 
 
-        self.collocator.export_result_dymola(self._mpc_result_file_name, 
-                                                result=res)
-
-        complete_res = ResultDymolaTextual(self._mpc_result_file_name)
+        # The result is created from the data in memory, the result file is
+        # only written if requested
+        complete_res = self.collocator.get_result_data(res)
+        if self.options['write_result_file']:
+            complete_res.export_result_dymola(self._mpc_result_file_name)
+            result_file_name = self._mpc_result_file_name
+        else:
+            result_file_name = None
 
         # Create and return result object
         self._result_object_complete = MPCAlgResult(self.op, 
-                                self._mpc_result_file_name, self.collocator,
+                                result_file_name, self.collocator,
                                 complete_res, self.options,
                                 self.times, self._sample_nbr,
                                 self.sample_period)
@@ -1053,3 +1081,68 @@ class MPC(object):
         optimization.
         """
         return (self.solver_stats, self.tot_times)
+
+class MPCResultStore(object):
+
+    """
+    Storage of the complete result of an MPC, with one column per variable.
+    
+    The result of each sample is stored as a separate block, so that 
+    appending a sample does not copy the earlier ones. The blocks are either
+    kept in memory or appended to a binary file, in which case the memory 
+    used does not grow with the number of samples.
+    """
+
+    def __init__(self, n_columns, file_name=None):
+        """
+        Create an empty result store.
+        
+        Parameters::
+        
+            n_columns --
+                The number of columns, including the time.
+                
+            file_name --
+                The name of the file to append the blocks to. If None, the 
+                blocks are kept in memory. An existing file is overwritten.
+                Default: None
+        """
+        self.n_columns = n_columns
+        self.file_name = file_name
+        self.n_rows = 0
+        self._blocks = []
+        if file_name is not None:
+            open(file_name, 'wb').close()
+
+    def append(self, block):
+        """
+        Append a block of rows.
+        
+        Parameters::
+        
+            block --
+                A 2D array with n_columns columns.
+        """
+        block = N.asarray(block, dtype=float).reshape([-1, self.n_columns])
+        if self.file_name is None:
+            self._blocks.append(block)
+        else:
+            with open(self.file_name, 'ab') as f:
+                block.tofile(f)
+        self.n_rows += block.shape[0]
+
+    def get_data(self):
+        """
+        Returns all rows as a 2D array. If the blocks are stored in a file, 
+        the array is a read-only memory map of the file.
+        """
+        if self.file_name is not None:
+            if self.n_rows == 0:
+                return N.empty([0, self.n_columns])
+            return N.memmap(self.file_name, dtype=float, mode='r',
+                            shape=(self.n_rows, self.n_columns))
+        if len(self._blocks) != 1:
+            # Join the blocks, so that they are only copied once
+            self._blocks = [N.vstack(self._blocks) if self._blocks else
+                            N.empty([0, self.n_columns])]
+        return self._blocks[0]
@@ -385,7 +385,7 @@ class RealTimeMPCBase(RealTimeBase):
         
         self.solver = MPC(op, opt_opts, dt, horizon, constr_viol_costs = constr_viol_costs)  
             
-    def enable_codegen(self, name=None):
+    def enable_codegen(self, name=None, cache_dir=None):
         """
         Enables use of generated C code for the MPC solver.
         
@@ -397,13 +397,18 @@ class RealTimeMPCBase(RealTimeBase):
         Parameters::
                 
             name --
-                A string that if it is not None, loads existing files
-                nlp_[name].so, grad_f_[name].so, jac_g_[name].so and
-                hess_lag_[name].so as ExternalFunction objects to be used
-                by the solver rather than generating new code.
+                A string that if it is not None, is added to the names of
+                the generated files, see
+                pyjmi.optimization.casadi_collocation.enable_codegen.
+                Default: None
+                
+            cache_dir --
+                The directory in which the generated code and the compiled
+                libraries are stored. Libraries compiled from the same code
+                are reused from this directory.
                 Default: None
         """
-        self.solver.collocator.enable_codegen(name)
+        self.solver.collocator.enable_codegen(name, cache_dir)
             
     def enable_integral_action(self, mu, M, error_names=None, u_e=None):
         """
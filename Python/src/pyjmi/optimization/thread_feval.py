@@ -17,6 +17,9 @@
 import threading
 import os
 import sys
+import multiprocessing
+import multiprocessing.util
+from multiprocessing.queues import Empty
 import numpy as N
 
 class FevalThread(threading.Thread):
@@ -111,3 +114,148 @@ def feval(func_file_name,x,debug):
 			fval[i] = eval(f_string)
 	
 	return fval
+
+def _get_func_name(func_file_name):
+    """
+    Get the name of the function defined in a file, i.e. the name of the 
+    file without directory and ".py".
+    """
+    if func_file_name.endswith(".py"):
+        return func_file_name[:-3].split('/')[-1].split('\\')[-1]
+    else:
+        return func_file_name.split('/')[-1].split('\\')[-1]
+
+# The function evaluated by a worker process in a FevalPool
+_worker_func = None
+
+def _init_worker(func_file_name,debug,slots,nbr_slots):
+    """
+    Initialize a worker process in a FevalPool. The file containing the 
+    function definition is executed once and the worker then moves to the 
+    sub-directory of its slot, dir_<slot>, in which all its evaluations are 
+    performed. The slot is given back when the worker exits, so that a 
+    worker replacing it reuses the same sub-directory.
+    """
+    global _worker_func
+    try:
+        slot = slots.get(timeout=1)
+    except Empty:
+        # The slot of a worker that did not exit normally is lost
+        with nbr_slots.get_lock():
+            nbr_slots.value += 1
+            slot = nbr_slots.value
+    multiprocessing.util.Finalize(None, slots.put, (slot,), exitpriority=20)
+    
+    dir_name = 'dir_' + str(slot)
+    if debug:
+        outfile = open('out_file_' + dir_name + '.txt', 'a')
+        errfile = open('err_file_' + dir_name + '.txt', 'a')
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(outfile.fileno(), 1)
+        os.dup2(errfile.fileno(), 2)
+    
+    namespace = {'__name__': _get_func_name(func_file_name)}
+    exec(compile(open(func_file_name, "rb").read(), func_file_name, 'exec'), namespace)
+    _worker_func = namespace[_get_func_name(func_file_name)]
+    
+    # try-except so that it works even if the sub-directory already exists
+    try:
+        os.mkdir(dir_name)
+    except OSError:
+        pass
+    os.chdir(dir_name)
+
+def _feval_worker(x):
+    """
+    Evaluate the function of a worker process in a FevalPool in x.
+    """
+    return _worker_func(x)
+
+class FevalPool(object):
+    """
+    A pool of persistent worker processes for function evaluations. 
+    
+    In contrast to feval, which starts a new python interpreter for each 
+    point, each worker executes the file containing the function definition 
+    only once and then evaluates the function in all points it is given. 
+    Points and function values are passed to and from the workers through 
+    pipes. Each worker performs its evaluations in one of the 
+    sub-directories dir_1 ... dir_n of the current one, just like feval. To 
+    limit the memory growth of long-lived workers, for example when an FMU 
+    is loaded in each evaluation, the workers can be replaced by fresh ones 
+    after a given number of evaluations. A new worker takes over the 
+    sub-directory of the worker it replaces.
+    """
+    
+    def __init__(self,func_file_name,nbr_workers,fevals_per_worker=None,
+                 debug=False):
+        """
+        Create the worker processes.
+        
+        Parameters::
+        
+            func_file_name --
+                string
+                The name of a python file containing the function definition.
+                The function in the file must have the same name as the file 
+                itself (without ".py").
+                
+            nbr_workers --
+                int
+                The number of worker processes.
+                
+            fevals_per_worker --
+                int
+                The number of function evaluations after which a worker is 
+                replaced by a new one. If None the workers live as long 
+                as the pool.
+                Default: None
+                
+            debug --
+                bool
+                Set to True to get separate error and output files for each
+                worker process.
+                Default: False
+        """
+        self.nbr_workers = nbr_workers
+        # The workers evaluate in the sub-directories dir_1 ... dir_n
+        slots = multiprocessing.Queue()
+        for i in range(nbr_workers):
+            slots.put(i+1)
+        nbr_slots = multiprocessing.Value('i', nbr_workers)
+        self._pool = multiprocessing.Pool(nbr_workers, _init_worker, 
+                                          (os.path.abspath(func_file_name), debug,
+                                           slots, nbr_slots), 
+                                          fevals_per_worker)
+    
+    def feval(self,x):
+        """
+        Evaluate the function in x. If x contains multiple points (rows) 
+        then the points are distributed over the worker processes.
+        
+        Parameters::
+        
+            x --
+                ndarray (1 or 2 dimensions)
+                The point(s) in which to evaluate the function.
+        
+        Returns::
+        
+            fval --
+                float or ndarray (1 dimension)
+                The function value(s) in x.
+        """
+        if N.ndim(x) == 1:
+            return self._pool.apply(_feval_worker, (N.asarray(x),))
+        else:
+            return N.array(self._pool.map(_feval_worker, [N.asarray(xi) for xi in x], 1), dtype=float)
+    
+    def close(self):
+        """
+        Terminate the worker processes.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
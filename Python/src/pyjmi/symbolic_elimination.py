@@ -27,6 +27,10 @@ from modelicacasadi_wrapper import Model
 from pyjmi.common.core import ModelBase
 from pyjmi.common.algorithm_drivers import OptionBase
 from functools import reduce
+try:
+    from scipy.sparse.csgraph import maximum_bipartite_matching
+except ImportError:
+    maximum_bipartite_matching = None
 
 class EliminationOptions(OptionBase):
 
@@ -102,6 +106,15 @@ class EliminationOptions(OptionBase):
 
             Default: False
 
+        matching --
+            Algorithm for matching equations and variables. Possible values: ['hopcroft_karp', 'scipy']
+
+            'scipy' uses scipy.sparse.csgraph.maximum_bipartite_matching, and falls back to 'hopcroft_karp' if it is
+            not available in the installed SciPy. The matching is always computed with the layered implementation
+            of Hopcroft-Karp if plots is True.
+
+            Default: 'hopcroft_karp'
+
         inline_solved --
             Whether to inline solved expressions in the closed form expressions (only applicable
             if closed_form == True).
@@ -123,7 +136,8 @@ class EliminationOptions(OptionBase):
                 'ineliminable': [],
                 'linear_solver': "symbolicqr",
                 'dense_tol': 15,
-                'dense_measure': 'lmfi'}
+                'dense_measure': 'lmfi',
+                'matching': 'hopcroft_karp'}
         
         super(EliminationOptions, self).__init__(_defaults)
         self._update_keep_dict_defaults(*args, **kw)
@@ -215,18 +229,6 @@ class DigraphVertex(object):
         self.number = None
         self.lowlink = None
 
-def find_deps(expr, mx_vars, deps=None):
-    """
-    Recursively finds which mx_vars expr depends on.
-    """
-    if deps is None:
-        deps = len(mx_vars) * [False]
-    for i in range(expr.getNdeps()):
-        dep = expr.getDep(i)
-        deps = list(map(any, list(zip(deps, [casadi.isEqual(dep, var) for var in mx_vars]))))
-        deps = find_deps(dep, mx_vars, deps)
-    return deps
-
 class Component(object):
 
     def __init__(self, vertices, causalization_options, edges):
@@ -777,6 +779,116 @@ class BipartiteGraph(object):
     def maximum_match(self):
         """
         Computes a new perfect matching.
+
+        self.matches is set to a list of (equation, variable) pairs, ordered by equation local index.
+        """
+        if self.options['plots']:
+            self._maximum_match_layered()
+            return
+
+        # Index equations and variables by their local indices
+        equations = self.n * [None]
+        for eq in self.equations:
+            equations[eq.local_index] = eq
+        variables = self.n * [None]
+        for vari in self.variables:
+            variables[vari.local_index] = vari
+
+        # Adjacency arrays of the incidence matrix
+        incidences = self.incidences.tocsr()
+        incidences.sum_duplicates()
+        incidences.sort_indices()
+        empty = np.flatnonzero(np.diff(incidences.indptr) == 0)
+        if len(empty) > 0:
+            raise RuntimeError("The following equations contain no variables: %s" % [equations[i] for i in empty])
+
+        # Compute matched variable of each equation
+        if self.options['matching'] == 'scipy' and maximum_bipartite_matching is not None:
+            incidences.data = np.ones(len(incidences.data))
+            eq_mates = maximum_bipartite_matching(incidences, perm_type='column')
+            if np.any(eq_mates < 0):
+                raise RuntimeError("Unable to find perfect matching")
+            eq_mates = eq_mates.tolist()
+        else:
+            eq_mates = self._hopcroft_karp(incidences.indptr.tolist(), incidences.indices.tolist())
+        self.matches = [(equations[i], variables[j]) for (i, j) in enumerate(eq_mates)]
+
+    def _hopcroft_karp(self, indptr, indices):
+        """
+        Hopcroft-Karp maximum matching on the CSR adjacency arrays of the incidence matrix.
+
+        Equations are boys and variables are girls. Returns the matched variable index of each equation.
+        """
+        n = self.n
+        adj = [indices[indptr[i]:indptr[i+1]] for i in range(n)]
+        eq_mates = n * [-1]
+        var_mates = n * [-1]
+
+        # Greedy initial matching
+        for i in range(n):
+            for j in adj[i]:
+                if var_mates[j] < 0:
+                    eq_mates[i] = j
+                    var_mates[j] = i
+                    break
+
+        inf = n + 1
+        while True:
+            free_eqs = [i for i in range(n) if eq_mates[i] < 0]
+            if free_eqs == []:
+                return eq_mates
+
+            # Breadth-first search for layers of equations, alternating along unmatched and matched edges
+            dist = n * [inf]
+            for i in free_eqs:
+                dist[i] = 0
+            queue = free_eqs[:]
+            found = False
+            head = 0
+            while head < len(queue):
+                i = queue[head]
+                head += 1
+                for j in adj[i]:
+                    k = var_mates[j]
+                    if k < 0:
+                        found = True
+                    elif dist[k] == inf:
+                        dist[k] = dist[i] + 1
+                        queue.append(k)
+            if not found:
+                raise RuntimeError("Unable to find perfect matching")
+
+            # Depth-first search for vertex-disjoint augmenting paths along the layers
+            pos = n * [0]
+            for root in free_eqs:
+                stack = [root]
+                while stack:
+                    i = stack[-1]
+                    adj_i = adj[i]
+                    while pos[i] < len(adj_i):
+                        j = adj_i[pos[i]]
+                        pos[i] += 1
+                        k = var_mates[j]
+                        if k < 0:
+                            # Augment along the path in the stack
+                            for i in reversed(stack):
+                                previous = eq_mates[i]
+                                eq_mates[i] = j
+                                var_mates[j] = i
+                                j = previous
+                            stack = []
+                            break
+                        elif dist[k] == dist[i] + 1:
+                            stack.append(k)
+                            break
+                    else:
+                        # Dead end
+                        dist[i] = inf
+                        stack.pop()
+
+    def _maximum_match_layered(self):
+        """
+        Computes a new perfect matching, plotting the layers of each augmentation phase.
         """
         self.matches = [] # Step 0
         i = 0
@@ -942,21 +1054,26 @@ class BipartiteGraph(object):
         """
         vertices = [DigraphVertex(i, eq, vari) for (i, (eq, vari)) in enumerate(self.matches)]
 
-        # Create edges (without self-loops)
-        dig_edgs = []
+        # Create successor lists of vertices (without self-loops)
+        matches = set(self.matches)
+        successors = [[] for v in vertices]
         for edge in self.edges:
-            if (edge.eq, edge.var) not in self.matches:
-            #~ if (edge.var, edge.eq) not in self.matches:
-                dig_edgs.append((edge.eq.dig_vertex, edge.var.dig_vertex))
-        self.dig_edgs = dig_edgs
+            if (edge.eq, edge.var) not in matches:
+                successors[edge.eq.dig_vertex.index].append(edge.var.dig_vertex.index)
 
         # Strong connect
-        self.i = 0
-        self.stack = []
         self.components = []
+        number = len(vertices) * [0]
+        lowlink = len(vertices) * [0]
+        on_stack = len(vertices) * [False]
+        stack = []
+        i = 0
+        for root in range(len(vertices)):
+            if number[root] == 0:
+                i = self._strong_connect(root, vertices, successors, number, lowlink, on_stack, stack, i)
         for v in vertices:
-            if v.number is None:
-                self._strong_connect(v)
+            v.number = number[v.index]
+            v.lowlink = lowlink[v.index]
 
         # Create new equation and variable indices
         i = 0
@@ -968,47 +1085,71 @@ class BipartiteGraph(object):
                 vertex.variable.global_blt_index = global_index + i
                 i += 1
 
-    def _strong_connect(self, v):
+    def _strong_connect(self, root, vertices, successors, number, lowlink, on_stack, stack, i):
         """
-        Finds a strong connection for v.
+        Finds the strongly connected components reachable from root.
+
+        Iterative depth-first search, with an explicit stack of visited vertices and the positions in their
+        successor lists. Components are appended to self.components in the order they are completed, which is a
+        reverse topological order. Returns the updated vertex counter i.
         """
-        self.i += 1
-        v.number = self.i
-        v.lowlink = self.i
-        self.stack.append(v)
-
-        for (v1, w) in self.dig_edgs:
-            if v1 == v:
-                if w.number is None: # (v, w) is a tree arc
-                    self._strong_connect(w)
-                    v.lowlink = min(v.lowlink, w.lowlink)
-                elif w.number < v.number: # (v, w) is a frond or cross-link
-                    if w in self.stack:
-                        v.lowlink = min(v.lowlink, w.number)
-
-        if v.lowlink == v.number: # v is the root of a component
-            # Start new strongly connected component
-            vertices = []
-            while self.stack and self.stack[-1].number >= v.number:
-                vertices.append(self.stack.pop())
-            self.components.append(Component(vertices, self.options, self.edges))
+        i += 1
+        number[root] = lowlink[root] = i
+        stack.append(root)
+        on_stack[root] = True
+        path = [root]
+        positions = [0]
+        while path:
+            v = path[-1]
+            if positions[-1] < len(successors[v]):
+                w = successors[v][positions[-1]]
+                positions[-1] += 1
+                if number[w] == 0: # (v, w) is a tree arc
+                    i += 1
+                    number[w] = lowlink[w] = i
+                    stack.append(w)
+                    on_stack[w] = True
+                    path.append(w)
+                    positions.append(0)
+                elif on_stack[w]: # (v, w) is a frond or cross-link
+                    lowlink[v] = min(lowlink[v], number[w])
+            else:
+                path.pop()
+                positions.pop()
+                if path:
+                    lowlink[path[-1]] = min(lowlink[path[-1]], lowlink[v])
+                if lowlink[v] == number[v]: # v is the root of a component
+                    # Start new strongly connected component
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component.append(vertices[w])
+                        if w == v:
+                            break
+                    self.components.append(Component(component, self.options, self.edges))
+        return i
 
 def create_edges(equations, variables):
         """
         Create edges between Equations and Variables.
+
+        The incidences are found in one pass from the sparsity pattern of the Jacobian of the equation residuals
+        with respect to the stacked variables. The edges are ordered by equation and then by variable.
         """
-        # This can probably be made more efficient by analyzing Jacobian sparsity of a SISO function with latest CasADi
-        edges = []
-        mx_vars = [var.mx_var for var in variables]
-        for equation in equations:
-            expr = equation.expression
-            deps_incidence = np.array(find_deps(expr, mx_vars))
-            deps_equal = np.array([casadi.isEqual(expr, mx_var) for mx_var in mx_vars])
-            deps = deps_incidence + deps_equal
-            for (i, var) in enumerate(variables):
-                if deps[i]:
-                    edges.append(Edge(equation, var))
-        return edges
+        if len(equations) == 0 or len(variables) == 0:
+            return []
+        stacked_vars = casadi.MX.sym("stacked_vars", len(variables))
+        res = casadi.vertcat([equation.expression for equation in equations])
+        [res] = casadi.substitute([res], [var.mx_var for var in variables], casadi.vertsplit(stacked_vars))
+        res_f = casadi.MXFunction([stacked_vars], [res])
+        res_f.setOption("name", "incidence_residual")
+        res_f.init()
+        sparsity = res_f.jacSparsity()
+        rows = np.array(sparsity.row(), dtype=int)
+        cols = np.array(sparsity.getCol(), dtype=int)
+        order = np.lexsort((cols, rows))
+        return [Edge(equations[i], variables[j]) for (i, j) in zip(rows[order], cols[order])]
 
 class BLTModel(object):
     
@@ -27,6 +27,7 @@ import collections
 from pyfmi.fmi import FMUException
 from assimulo.solvers.sundials import CVodeError 
 import random
+import multiprocessing
 
 class UKF:
     """A class representing a Non-augmented Unscented Kalman Filter.
@@ -67,6 +68,14 @@ class UKF:
         xp -- The a priori predicted state estimates (numpy.array)
         yp -- The a priori predicted measurements (numpy.array)
         fails -- Dict containing the number of failed sigma-point simulations at each time instance ({float:int})
+    
+    If the option nbr_processes is larger than 1, the sigma points are simulated in parallel by a pool of
+    worker processes, each holding its own instance of the FMU given by the option fmu_file. The pool is
+    created at the first prediction and is terminated with close().
+    
+    Parameter values that have been set on the model before the UKF is created are kept: they are set 
+    again each time the model is reset before a sigma point simulation, both in the calling process and 
+    in the worker processes. Parameter values set on the model later are not used.
     """
     
     def __init__(self, model, x_0, measurements, h, options):
@@ -122,14 +131,15 @@ class UKF:
         self.xp = N.zeros((len(self.x),1))
         self.yp = N.zeros((len(self.mes),1))
         self.fails = {}
+        self._pool = None
         
         #Calculate and assign sigma point weights
         [Wm, Wc] = self._calc_weights(options)                                      
         self.Wm = Wm
         self.Wc = Wc 
         
-        #Make sure the model is properly reset
-        self.model.reset()
+        #Make sure the model is properly reset, but keep the parameter values set by the user
+        self._parameters = _reset_keeping_parameters(self.model)
         
     def _calc_weights(self, options):
         """Calculate weights for sigma points. 
@@ -161,6 +171,9 @@ class UKF:
         #Update options attribute
         self.options.update(*args, **kw)
         
+        #The worker processes are recreated with the new options when needed
+        self.close()
+        
         #Update weights
         [Wm, Wc] = self._calc_weights(self.options)
         self.Wm = Wm
@@ -177,6 +190,29 @@ class UKF:
             P_n[i,i] = self.options['P_n'][measurement.get_name()]/measurement.get_nominal_value()**2
         self.P_n = P_n
         
+    def close(self):
+        """Terminates the worker processes used for parallel sigma point simulation, if any.
+        
+        """
+        
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        
+    def _get_pool(self):
+        """Returns the pool of worker processes used for parallel sigma point simulation,
+        creating it if needed.
+        
+        """
+        
+        if self._pool is None:
+            if self.options['fmu_file'] == '':
+                raise InvalidAlgorithmOptionException('The option fmu_file must be set when nbr_processes > 1')
+            self._pool = multiprocessing.Pool(self.options['nbr_processes'], _init_worker, 
+                (self.options['fmu_file'],))
+        return self._pool
+        
     def get_options(self):
         """Returns a copy of the current options for the UKF.
         
@@ -338,61 +374,32 @@ class UKF:
         Xxp = N.zeros(sigma.shape)
         Y = N.zeros([L_meas, sigma.shape[1]])
         
-        #Simulate each sigma point h seconds
-        for i in range(0, sigma.shape[1]):
-        
-            #If sigma point simulation fails, try perturbing initial value and start again. Maximum 10 times,
-            #then use the result of the last simulated sigma point.
-            retry = True
-            k = 1
-			
-            while retry:
-                retry = False
-                #Reset the observer model
-                model.reset()
+        #Simulate each sigma point h seconds, in parallel if so requested
+        n_sigma = sigma.shape[1]
+        args = [(self._parameters, i, n_sigma, sigma[:,i], sigma[:,0], x, measurements, known_values, u, 
+            currTime, h) for i in range(0, n_sigma)]
+        if self.options['nbr_processes'] > 1:
+            results = self._get_pool().map(_simulate_sigma_point_in_worker, args)
+        else:
+            results = [_simulate_sigma_point(model, *arg) for arg in args]
+        
+        for i, (sigma_i, x_i, y_i, failed) in enumerate(results):
+            sigma[:,i] = sigma_i
+            if failed:
+                if currTime in list(self.fails.keys()):
+                    self.fails[currTime] = self.fails[currTime] + 1
+                else:
+                    self.fails[currTime] = 1
             
-                #Set the initial states as the current sigma point
-                for j, state in enumerate(x):
-                    #If the sigma point has previously failed, try perturbing the state values
-                    if k > 1:
-                        dist = N.abs(sigma[j,0] - sigma[j,i])                #Distance in this coordinate to mean point
-                        sigma[j,i] = sigma[j,i] + random.gauss(0, k*1e-3*dist) #Perturb with 0.1% of distance as std. Increase times k after each iteration.
-                    model.set(state.get_name()+'_0', sigma[j,i]*state.get_nominal_value())
-                    
-                #Set known values
-                for known in known_values:
-                    model.set(known+'_0', known_values[known])
-                    
-                #Simulate and extract result
-                opt = model.simulate_options()
-                opt['CVode_options']['atol'] = 1e-8
-                opt['CVode_options']['rtol'] = 1e-6
-                opt['CVode_options']['maxh'] = 0.0
-                opt['ncp'] = 0
-                print('Simulating sigma-point '+str(i+1)+' out of '+str(sigma.shape[1])+' :')
-                try:
-                    result = model.simulate(start_time = currTime, final_time = currTime + h, options = opt, input = u)
-                except (CVodeError, ValueError, FMUException) as e:
-                    print(e)
-                    retry = True
-                    print('Failed sigma point simulation')
-                    if k == 1:
-                        if currTime in list(self.fails.keys()):
-                            self.fails[currTime] = self.fails[currTime] + 1
-                        else:
-                            self.fails[currTime] = 1
-                    if k == 10:
-                        print('Simulation failed 10 times, will use result from last sigma point instead')
-                        break
-                k = k + 1
-			
-            #Assign result to matrix, and add process noise. Initialize anew so that all variables are updated
-            for k, state in enumerate(x):
-                Xxp[k,i] = result[state.get_name()][-1]/state.get_nominal_value()             
-     
-            #Assign measurements and add measurement noise
-            for k, meas in enumerate(measurements):
-                Y[k,i] = result[meas.get_name()][-1]/meas.get_nominal_value()
+            #If the simulation failed 10 times, use the result of the last simulated sigma point
+            if x_i is None:
+                if i == 0:
+                    raise FMUException('Simulation of the first sigma point failed 10 times')
+                Xxp[:,i] = Xxp[:,i-1]
+                Y[:,i] = Y[:,i-1]
+            else:
+                Xxp[:,i] = x_i
+                Y[:,i] = y_i
         
         #Compute predictions and covariances
         xp = N.multiply(Wm, Xxp[:])                         #Multiply each point with corresponding weight
@@ -428,6 +435,150 @@ class UKF:
         P = Pxx - K.dot(Pyy.dot(K.T))
         return [xp, yp, K, P]
         
+def _simulate_sigma_point(model, parameters, i, n_sigma, sigma_i, sigma_0, x, measurements, known_values, u, 
+                          currTime, h):
+    """Simulates a sigma point h seconds.
+    
+    If the simulation fails, the initial value is perturbed and the simulation is started again.
+    This is done at most 10 times.
+    
+        Arguments:
+        model -- Observer model (FMUModel)
+        parameters -- Parameter values to set after each reset of the model ([(string, value)])
+        i -- Index of the sigma point (int)
+        n_sigma -- Number of sigma points (int)
+        sigma_i -- The sigma point (numpy.array)
+        sigma_0 -- The first sigma point, i.e. the current state estimate (numpy.array)
+        x -- The current state estimates ([ScaledVariable])
+        measurements -- Contains the measured variables ([ScaledVariable])
+        known_values -- Known state values ({string:float})
+        u -- Input trajectory to the process model (([string], numpy.array))
+        currTime -- Current time instant (float)
+        h -- Sample interval in seconds (float)
+        
+        Returns:
+        sigma_i -- The sigma point, perturbed if the first simulation failed (numpy.array)
+        x_i -- The scaled simulated states, or None if all simulations failed (numpy.array)
+        y_i -- The scaled simulated measurements, or None if all simulations failed (numpy.array)
+        failed -- True if the first simulation failed (bool)
+    
+    """
+    
+    sigma_i = N.array(sigma_i, dtype=float)
+    failed = False
+    result = None
+    k = 1
+    
+    while True:
+        #Reset the observer model
+        model.reset()
+        _set_parameters(model, parameters)
+    
+        #Set the initial states as the current sigma point
+        for j, state in enumerate(x):
+            #If the sigma point has previously failed, try perturbing the state values
+            if k > 1:
+                dist = N.abs(sigma_0[j] - sigma_i[j])                #Distance in this coordinate to mean point
+                sigma_i[j] = sigma_i[j] + random.gauss(0, k*1e-3*dist) #Perturb with 0.1% of distance as std. Increase times k after each iteration.
+            model.set(state.get_name()+'_0', sigma_i[j]*state.get_nominal_value())
+            
+        #Set known values
+        for known in known_values:
+            model.set(known+'_0', known_values[known])
+            
+        #Simulate and extract result
+        opt = model.simulate_options()
+        opt['CVode_options']['atol'] = 1e-8
+        opt['CVode_options']['rtol'] = 1e-6
+        opt['CVode_options']['maxh'] = 0.0
+        opt['ncp'] = 0
+        print('Simulating sigma-point '+str(i+1)+' out of '+str(n_sigma)+' :')
+        try:
+            result = model.simulate(start_time = currTime, final_time = currTime + h, options = opt, input = u)
+            break
+        except (CVodeError, ValueError, FMUException) as e:
+            print(e)
+            print('Failed sigma point simulation')
+            if k == 1:
+                failed = True
+            if k == 10:
+                print('Simulation failed 10 times, will use result from last sigma point instead')
+                return (sigma_i, None, None, failed)
+        k = k + 1
+    
+    #Extract scaled states and measurements
+    x_i = N.array([result[state.get_name()][-1]/state.get_nominal_value() for state in x])
+    y_i = N.array([result[meas.get_name()][-1]/meas.get_nominal_value() for meas in measurements])
+    return (sigma_i, x_i, y_i, failed)
+    
+def _reset_keeping_parameters(model):
+    """Resets a model and returns the parameter values that were changed from their default values
+    before the reset, so that they can be set again with _set_parameters.
+    
+        Arguments:
+        model -- Observer model (FMUModel)
+        
+        Returns:
+        parameters -- The changed parameter values ([(string, value)])
+    
+    """
+    
+    #Real, integer and boolean parameters
+    if model.get_version() == '1.0':
+        from pyfmi.fmi import FMI_PARAMETER, FMI_STRING
+        variables = model.get_model_variables(variability=FMI_PARAMETER, include_alias=False)
+        string_type = FMI_STRING
+    else:
+        from pyfmi.fmi import FMI2_PARAMETER, FMI2_STRING
+        variables = model.get_model_variables(causality=FMI2_PARAMETER, include_alias=False)
+        string_type = FMI2_STRING
+    names = [name for (name, var) in variables.items() if var.type != string_type]
+    
+    if len(names) == 0:
+        model.reset()
+        return []
+    values = model.get(names)
+    model.reset()
+    defaults = model.get(names)
+    parameters = [(name, value) for (name, value, default) in zip(names, values, defaults) 
+        if value != default]
+    _set_parameters(model, parameters)
+    return parameters
+    
+def _set_parameters(model, parameters):
+    """Sets parameter values in a model.
+    
+        Arguments:
+        model -- Observer model (FMUModel)
+        parameters -- The parameter values ([(string, value)])
+    
+    """
+    
+    for (name, value) in parameters:
+        try:
+            model.set(name, value)
+        except FMUException:
+            #Dependent parameters follow the parameters they are calculated from
+            pass
+    
+_worker_model = None
+
+def _init_worker(fmu_file):
+    """Loads the observer model in a worker process used for parallel sigma point simulation.
+    
+    """
+    
+    global _worker_model
+    from pyfmi import load_fmu
+    _worker_model = load_fmu(fmu_file)
+    
+def _simulate_sigma_point_in_worker(args):
+    """Simulates a sigma point with the observer model of a worker process.
+    
+    """
+    
+    return _simulate_sigma_point(_worker_model, *args)
+    
 class UKFOptions(OptionBase):
     """Class containing covariance matrices and weight parameters for the UKF.
     The covariance matrices are considered diagonal, with the variance of each
@@ -446,6 +597,12 @@ class UKFOptions(OptionBase):
             where beta = 2 is optimal for Gaussian distributions (float)
         kappa -- Secondary scaling parameter, used to ensure semi-positive definiteness
             of covariance matrix. Usually set to zero (float)
+        nbr_processes -- Number of worker processes used to simulate the sigma points
+            in parallel. With the default value 1 the sigma points are simulated one
+            after another in the calling process (int)
+        fmu_file -- Path to the FMU of the observer model, loaded by each worker process.
+            The parameter values set on the model given to the UKF are set in the loaded 
+            models as well. Required when nbr_processes > 1 (string)
     """
     
     def __init__(self, *args, **kw):
@@ -453,7 +610,8 @@ class UKFOptions(OptionBase):
         """
       
         #Set default values, and then update to user input arguments
-        defaults = {'P_0': {} , 'P_v': {}, 'P_n': {}, 'alpha': 1e-3, 'beta': 2.0, 'kappa':0.0}
+        defaults = {'P_0': {} , 'P_v': {}, 'P_n': {}, 'alpha': 1e-3, 'beta': 2.0, 'kappa':0.0,
+            'nbr_processes': 1, 'fmu_file': ''}
         super(UKFOptions, self).__init__(defaults)
         
         #Update options with user input
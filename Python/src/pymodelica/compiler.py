@@ -39,7 +39,8 @@ from pymodelica.common.core import get_unit_name, list_to_string
 
 def compile_fmu(class_name, file_name=[], compiler='auto', target='me', version='2.0', 
                 platform='auto', compiler_options={}, compile_to='.', 
-                compiler_log_level='warning', separate_process=True, jvm_args=''):
+                compiler_log_level='warning', separate_process=True, jvm_args='',
+                compiler_server=False, cache=False):
     """ 
     Compile a Modelica model to an FMU.
     
@@ -130,6 +131,24 @@ def compile_fmu(class_name, file_name=[], compiler='auto', target='me', version=
             separate process.
             Default: Empty string
             
+        compiler_server --
+            Run the compilation in a persistent compiler server instead of 
+            starting a new JVM for each compilation. The server is started on 
+            first use and keeps its JVM between compilations, it is stopped 
+            with pymodelica.compiler_server.stop_compiler_server. A 
+            CompilerServer object can also be given, in which case jvm_args 
+            are given when the server is created. Only used if 
+            separate_process is True.
+            Default: False
+            
+        cache --
+            Reuse the result of an earlier compilation with the same model 
+            files, libraries, compiler options and target, see 
+            pymodelica.compiler_cache. No compiler log is written when the 
+            result is taken from the cache. A CompilerCache object can also 
+            be given, to use another cache than the default one.
+            Default: False
+            
             
     Returns::
     
@@ -145,11 +164,11 @@ def compile_fmu(class_name, file_name=[], compiler='auto', target='me', version=
         raise IllegalCompilerArgumentError("Unknown target '" + target + "'. Use 'me', 'cs' or 'me+cs' to compile an FMU.")
     return _compile_unit(class_name, file_name, compiler, target, version,
                 platform, compiler_options, compile_to, compiler_log_level,
-                separate_process, jvm_args)       
+                separate_process, jvm_args, compiler_server, cache)
 
 def compile_fmux(class_name, file_name=[], compiler='auto', compiler_options={}, 
                  compile_to='.', compiler_log_level='warning', separate_process=True,
-                 jvm_args=''):
+                 jvm_args='', compiler_server=False, cache=False):
     """ 
     Compile a Modelica model to an FMUX.
     
@@ -211,6 +230,24 @@ def compile_fmux(class_name, file_name=[], compiler='auto', compiler_options={},
             separate process.
             Default: Empty string
             
+        compiler_server --
+            Run the compilation in a persistent compiler server instead of 
+            starting a new JVM for each compilation. The server is started on 
+            first use and keeps its JVM between compilations, it is stopped 
+            with pymodelica.compiler_server.stop_compiler_server. A 
+            CompilerServer object can also be given, in which case jvm_args 
+            are given when the server is created. Only used if 
+            separate_process is True.
+            Default: False
+            
+        cache --
+            Reuse the result of an earlier compilation with the same model 
+            files, libraries, compiler options and target, see 
+            pymodelica.compiler_cache. No compiler log is written when the 
+            result is taken from the cache. A CompilerCache object can also 
+            be given, to use another cache than the default one.
+            Default: False
+            
     Returns::
     
         A compilation result, represents the name of the FMUX which has been
@@ -219,11 +256,111 @@ def compile_fmux(class_name, file_name=[], compiler='auto', compiler_options={},
     """
     return _compile_unit(class_name, file_name, compiler, 'fmux', None, 'auto',
                 compiler_options, compile_to, compiler_log_level,
-                separate_process, jvm_args)
+                separate_process, jvm_args, compiler_server, cache)
+
+def compile_fmus(jobs, max_workers=None, jvm_args='', max_memory=None):
+    """
+    Compile several models in parallel, each in a separate process. The 
+    compilations are run by at most max_workers processes at the same time, 
+    which is further limited so that the JVM heaps of the running compilations 
+    fit in the physical memory of the computer.
+    
+    A failed compilation does not stop the other compilations, instead the 
+    raised exception, e.g. a CompilerError or a CcodeCompilationError, is 
+    returned in place of the result of the job.
+    
+    Parameters::
+    
+        jobs --
+            A list of compilation jobs. Each job is a dict with the keyword 
+            arguments of compile_fmu, class_name must be given. If target is 
+            'fmux' the job is compiled with compile_fmux instead. Jobs which 
+            would generate a unit with the same name must be given different 
+            compile_to arguments.
+            
+        max_workers --
+            The maximum number of compilations that run at the same time.
+            Default: The number of processors.
+            
+        jvm_args --
+            String of arguments to be passed to the JVM of each compilation, 
+            in addition to the jvm_args of the job. The maximum heap size 
+            (-Xmx) of a job is never changed. Jobs for which it is not given 
+            here, in the job or in the environment variable JVM_ARGS are 
+            assumed to use the default of the JVM, a quarter of the physical 
+            memory.
+            Default: Empty string
+            
+        max_memory --
+            The memory in bytes that the JVM heaps of the running compilations 
+            may use in total. The number of workers is reduced so that the 
+            largest heap of the jobs fits this many times in max_memory.
+            Default: 75 % of the physical memory, or unlimited if the physical 
+            memory can not be determined.
+            
+    Returns::
+    
+        A list with, for each job in the same order, either the CompilerResult 
+        of the compilation or the exception raised by it.
+    """
+    import threading
+    import multiprocessing
+    
+    jobs = [dict(job) for job in jobs]
+    for job in jobs:
+        job['jvm_args'] = ' '.join([jvm_args, job.get('jvm_args', '')]).strip()
+        job['separate_process'] = True
+    if max_workers is None:
+        max_workers = multiprocessing.cpu_count()
+    workers = max(1, min(max_workers, len(jobs)))
+    
+    memory = _get_physical_memory()
+    if max_memory is None and memory is not None:
+        max_memory = int(0.75 * memory)
+    if max_memory is not None and jobs:
+        # Run fewer compilations at the same time rather than giving them 
+        # smaller heaps than when they are compiled one by one
+        heaps = []
+        for job in jobs:
+            job_heap = _get_max_heap(pym.environ['JVM_ARGS'] + ' ' + job['jvm_args'])
+            if job_heap is None and memory is not None:
+                # The default maximum heap size of the JVM
+                job_heap = memory // 4
+            if job_heap is not None:
+                heaps.append(job_heap)
+        if heaps:
+            workers = max(1, min(workers, max_memory // max(heaps)))
+    
+    results = [None] * len(jobs)
+    next_job = [0]
+    lock = threading.Lock()
+    def work():
+        while True:
+            with lock:
+                i = next_job[0]
+                if i >= len(jobs):
+                    return
+                next_job[0] += 1
+            kwargs = jobs[i]
+            try:
+                if kwargs.get('target') == 'fmux':
+                    del kwargs['target']
+                    results[i] = compile_fmux(**kwargs)
+                else:
+                    results[i] = compile_fmu(**kwargs)
+            except Exception as ex:
+                results[i] = ex
+    
+    threads = [threading.Thread(target=work) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
 
 def _compile_unit(class_name, file_name, compiler, target, version,
                 platform, compiler_options, compile_to, compiler_log_level,
-                separate_process, jvm_args):
+                separate_process, jvm_args, compiler_server=False, cache=False):
     """
     Helper function for compile_fmu and compile_fmux.
     """
@@ -237,6 +374,20 @@ def _compile_unit(class_name, file_name, compiler, target, version,
     if platform == 'auto':
         platform = _get_platform()
         
+    if cache:
+        from .compiler_cache import CompilerCache, get_compiler_cache
+        if not isinstance(cache, CompilerCache):
+            cache = get_compiler_cache()
+        key = cache.get_key(class_name, file_name, compiler, target, version, 
+                            platform, compiler_options, compile_to)
+        result = cache.lookup(key, compile_to)
+        if result is None:
+            result = _compile_unit(class_name, file_name, compiler, target, version,
+                platform, compiler_options, compile_to, compiler_log_level,
+                separate_process, jvm_args, compiler_server)
+            cache.store(key, class_name, result)
+        return result
+        
     if not separate_process:
         # get a compiler based on 'compiler' argument or files listed in file_name
         comp = _get_compiler(files=file_name, selected_compiler=compiler)
@@ -252,6 +403,13 @@ def _compile_unit(class_name, file_name, compiler, target, version,
         # compile unit in java
         return comp.compile_Unit(class_name, file_name, target, version, compile_to)
 
+    elif compiler_server:
+        from .compiler_server import CompilerServer, get_compiler_server
+        if not isinstance(compiler_server, CompilerServer):
+            compiler_server = get_compiler_server()
+        return compiler_server.compile(class_name, file_name, compiler, target, version, 
+                                       platform, compiler_options, compile_to, compiler_log_level)
+
     else:
         return compile_separate_process(class_name, file_name, compiler, target, version, platform, 
                                         compiler_options, compile_to, compiler_log_level, jvm_args)
@@ -389,16 +547,17 @@ def _gen_compiler_options(compiler_options):
     opts = opts.replace('False', 'false')
     return opts
     
-def _gen_log_level(log_string):
+def _gen_log_level(log_string, xml_destination='|stderr'):
     """
     Helper function. Takes log level as accepted by Python and generates a string
-    which is understood by the Java compiler.
+    which is understood by the Java compiler. The XML log that is parsed by the
+    CompilerLogHandler is written to xml_destination, stderr by default.
     """
     if "|stderr" in log_string:
         raise IllegalLogStringError("Piping compiler log to stderr is not allowed in separate process.")
     if len(log_string) == 0:
         log_string = 'w'
-    log_string += ",w|xml|stderr"
+    log_string += ",w|xml" + xml_destination
     return log_string
     
 def _get_separate_JVM():
@@ -432,6 +591,51 @@ def _get_separate_JVM():
  
     return separate_jvm
 
+def _get_physical_memory():
+    """
+    Helper function. Returns the size of the physical memory in bytes, or None 
+    if it can not be determined.
+    """
+    try:
+        if sys.platform == 'win32':
+            import ctypes
+            class MEMORYSTATUSEX(ctypes.Structure):
+                _fields_ = [('dwLength', ctypes.c_ulong),
+                            ('dwMemoryLoad', ctypes.c_ulong),
+                            ('ullTotalPhys', ctypes.c_ulonglong),
+                            ('ullAvailPhys', ctypes.c_ulonglong),
+                            ('ullTotalPageFile', ctypes.c_ulonglong),
+                            ('ullAvailPageFile', ctypes.c_ulonglong),
+                            ('ullTotalVirtual', ctypes.c_ulonglong),
+                            ('ullAvailVirtual', ctypes.c_ulonglong),
+                            ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+            status = MEMORYSTATUSEX()
+            status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+                return status.ullTotalPhys
+            return None
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def _get_max_heap(jvm_args):
+    """
+    Helper function. Returns the maximum heap size in bytes given with -Xmx in 
+    the JVM arguments, or None if it is not given. If given several times the 
+    last one is used, as by the JVM.
+    """
+    units = {'': 1, 'k': 1024, 'm': 1024**2, 'g': 1024**3, 't': 1024**4}
+    heap = None
+    for arg in jvm_args.split():
+        if arg.startswith('-Xmx'):
+            size = arg[4:].lower()
+            unit = size[-1:] if size[-1:] in units else ''
+            try:
+                heap = int(size[:len(size) - len(unit)]) * units[unit]
+            except ValueError:
+                pass
+    return heap
+
 def _ensure_path(start, end):
     """
     Helper function for building the correct path to Java. Handled cases:
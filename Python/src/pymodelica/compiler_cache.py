@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2014 Modelon AB
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Module containing an on-disk cache of compiled FMUs and FMUXs. Each entry is
+stored under a hash of everything that the compilation result depends on, so
+compiling the same model again with unchanged inputs only copies the stored
+unit.
+
+Normally the cache is not used directly, instead it is enabled with the
+argument cache in compile_fmu and compile_fmux.
+"""
+
+import os
+import shutil
+import pickle
+import hashlib
+import tempfile
+
+import pymodelica as pym
+
+_cache = None
+
+class CompilerCache(object):
+    """
+    A size bounded cache of compiled units. When the total size of the stored
+    units exceeds the limit, the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir=None, max_size=2*1024**3, hardlink=False):
+        """
+        Create a compiler cache.
+
+        Parameters::
+
+            cache_dir --
+                The directory where the compiled units are stored. It is
+                created if it does not exist.
+                Default: compiler_cache in the .jmodelica.org directory in the
+                home directory of the user.
+
+            max_size --
+                The maximum total size of the stored units in bytes.
+                Default: 2 GB
+
+            hardlink --
+                Hardlink stored units to compile_to instead of copying them,
+                if the file system allows it. The linked unit must then not be
+                modified in place.
+                Default: False
+        """
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser('~'), '.jmodelica.org',
+                'compiler_cache')
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hardlink = hardlink
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_key(self, class_name, file_name, compiler, target, version,
+                platform, compiler_options, compile_to):
+        """
+        Compute the cache key of a compilation, see get_compilation_key.
+
+        Returns::
+
+            The key as a string.
+        """
+        return get_compilation_key(class_name, file_name, compiler, target,
+            version, platform, compiler_options, compile_to)
+
+    def lookup(self, key, compile_to):
+        """
+        Look up a compilation in the cache. If it is found, the stored unit is
+        placed at compile_to in the same way as by the compiler.
+
+        Parameters::
+
+            key --
+                The key of the compilation, see get_key.
+
+            compile_to --
+                The compile_to argument of the compilation.
+
+        Returns::
+
+            A CompilerResult object with the name of the unit and the
+            warnings given when the unit was compiled, or None if the
+            compilation is not in the cache.
+        """
+        from .compiler import CompilerResult
+        entry = os.path.join(self.cache_dir, key)
+        info_file = os.path.join(entry, 'info.pickle')
+        try:
+            with open(info_file, 'rb') as stream:
+                info = pickle.load(stream)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        if os.path.isdir(compile_to):
+            unit = os.path.join(os.path.abspath(compile_to), info['name'])
+        else:
+            unit = os.path.abspath(compile_to)
+            if not os.path.isdir(os.path.dirname(unit)):
+                os.makedirs(os.path.dirname(unit))
+        if os.path.exists(unit):
+            os.remove(unit)
+        stored = os.path.join(entry, info['name'])
+        try:
+            if self.hardlink:
+                try:
+                    os.link(stored, unit)
+                except (OSError, AttributeError):
+                    shutil.copyfile(stored, unit)
+            else:
+                shutil.copyfile(stored, unit)
+        except (IOError, OSError):
+            # The entry has been removed by someone else
+            return None
+
+        # The modification time of the info file marks when it was last used
+        os.utime(info_file, None)
+        return CompilerResult(unit, info['warnings'])
+
+    def store(self, key, class_name, result):
+        """
+        Store a compiled unit in the cache and evict old entries if the cache
+        has grown too large.
+
+        Parameters::
+
+            key --
+                The key of the compilation, see get_key.
+
+            class_name --
+                The name of the compiled model class.
+
+            result --
+                The CompilerResult of the compilation.
+        """
+        if result is None or not os.path.isfile(result):
+            return
+        entry = os.path.join(self.cache_dir, key)
+        if os.path.isdir(entry):
+            return
+
+        # Build the entry in a temporary directory that is renamed when it is
+        # complete, so that a partly written entry is never found
+        tmp_entry = tempfile.mkdtemp(prefix='tmp_', dir=self.cache_dir)
+        name = os.path.basename(result)
+        try:
+            shutil.copyfile(result, os.path.join(tmp_entry, name))
+            info = {'class_name': class_name, 'name': name,
+                    'warnings': result.get_warnings()}
+            with open(os.path.join(tmp_entry, 'info.pickle'), 'wb') as stream:
+                pickle.dump(info, stream, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # Stored by another process in the meantime
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+        self.evict()
+
+    def evict(self, max_size=None):
+        """
+        Remove the least recently used entries until the total size of the
+        cache is at most max_size.
+
+        Parameters::
+
+            max_size --
+                The size in bytes to reduce the cache to.
+                Default: The max_size of the cache.
+        """
+        if max_size is None:
+            max_size = self.max_size
+        entries = []
+        total = 0
+        for (entry, info_file) in self._entries():
+            try:
+                size = sum(os.path.getsize(f) for f in _list_files(entry))
+                entries.append((os.path.getmtime(info_file), size, entry))
+            except OSError:
+                continue
+            total += size
+        entries.sort()
+        for (_, size, entry) in entries:
+            if total <= max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def invalidate(self, class_name=None):
+        """
+        Remove entries from the cache.
+
+        Parameters::
+
+            class_name --
+                Only remove the entries of this model class. If None, all
+                entries are removed.
+                Default: None
+        """
+        for (entry, info_file) in self._entries():
+            if class_name is not None:
+                try:
+                    with open(info_file, 'rb') as stream:
+                        if pickle.load(stream)['class_name'] != class_name:
+                            continue
+                except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                    pass
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def get_size(self):
+        """
+        Returns the total size of the cache in bytes.
+        """
+        return sum(os.path.getsize(f) for f in _list_files(self.cache_dir))
+
+    def _entries(self):
+        """
+        Returns a list of tuples with the directory and the info file of each
+        complete entry.
+        """
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            entry = os.path.join(self.cache_dir, name)
+            info_file = os.path.join(entry, 'info.pickle')
+            if not name.startswith('tmp_') and os.path.isfile(info_file):
+                entries.append((entry, info_file))
+        return entries
+
+def get_compilation_key(class_name, file_name, compiler, target, version,
+                        platform, compiler_options, compile_to='.'):
+    """
+    Compute a key which identifies the result of a compilation. The key
+    depends on the contents of the files and libraries in file_name, the
+    libraries in MODELICAPATH, the compiler options, the target, version and
+    platform, the compiler and the pymodelica version.
+
+    The libraries in MODELICAPATH are identified by the name, size and
+    modification time of their files, while the contents of the files in
+    file_name are hashed.
+
+    Returns::
+
+        The key as a string.
+    """
+    h = hashlib.sha1()
+    def update(*items):
+        for item in items:
+            h.update(repr(item).encode('utf-8'))
+
+    update(getattr(pym, '__version__', None), class_name, compiler,
+        target, version, platform)
+    update(sorted((str(k), str(v)) for (k, v) in compiler_options.items()))
+    # When compile_to is a file the model is renamed to its name
+    if not os.path.isdir(compile_to):
+        update(os.path.basename(compile_to))
+
+    for path in file_name:
+        update(path)
+        for f in _list_files(path):
+            update(os.path.relpath(f, path))
+            with open(f, 'rb') as stream:
+                for block in iter(lambda: stream.read(1 << 20), b''):
+                    h.update(block)
+
+    for path in pym.environ['MODELICAPATH'].split(os.pathsep) + \
+            pym.environ['COMPILER_JARS'].split(os.pathsep):
+        update(path)
+        for f in _list_files(path):
+            stat = os.stat(f)
+            update(os.path.relpath(f, path), stat.st_size, stat.st_mtime)
+    return h.hexdigest()
+
+def _list_files(path):
+    """
+    Helper function. Returns a sorted list of the files in path, which can be
+    a file or a directory. Non-existing paths give an empty list.
+    """
+    if os.path.isfile(path):
+        return [path]
+    files = []
+    for (root, dirs, names) in os.walk(path):
+        dirs.sort()
+        files.extend(os.path.join(root, name) for name in sorted(names))
+    return files
+
+def get_compiler_cache():
+    """
+    Get the compiler cache used by compile_fmu and compile_fmux when cache is
+    True.
+
+    Returns::
+
+        The CompilerCache.
+    """
+    global _cache
+    if _cache is None:
+        _cache = CompilerCache()
+    return _cache
@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#    Copyright (C) 2014 Modelon AB
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, version 3 of the License.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Module containing a persistent compiler server. The server is a separate
+process which keeps a JVM with the compiler classes loaded between
+compilations, so that the JVM start up is only paid once. Compile requests are
+sent to the server over a local socket (a named pipe on Windows) and the XML
+log of each compilation is streamed back and handled by the CompilerLogHandler,
+in the same way as the log of a compilation in a separate JVM.
+
+Normally the server is not used directly, instead it is enabled with the
+argument compiler_server in compile_fmu and compile_fmux.
+"""
+
+import os
+import sys
+import threading
+import tempfile
+import binascii
+import subprocess
+from subprocess import Popen, PIPE
+from multiprocessing.connection import Listener, Client
+
+from .compiler_logging import CompilerLogHandler
+from . import compiler_exceptions
+from .compiler_exceptions import JError
+
+_server = None
+
+class CompilerServer(object):
+    """
+    Client side handle to a persistent compiler server process.
+    """
+
+    def __init__(self, jvm_args=''):
+        """
+        Create a handle to a compiler server. The server process is started on
+        the first compilation or by calling start.
+
+        Parameters::
+
+            jvm_args --
+                String of arguments to be passed to the JVM of the server, in
+                addition to the environment variable JVM_ARGS. Since the JVM is
+                kept between compilations these can only be given when the
+                server is created.
+                Default: Empty string
+        """
+        self.jvm_args = jvm_args
+        self._process = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def is_running(self):
+        """
+        Returns True if the server process is running.
+        """
+        return self._process is not None and self._process.poll() is None
+
+    def start(self):
+        """
+        Start the server process, if it is not already running.
+        """
+        with self._lock:
+            self._start()
+
+    def _start(self):
+        if self.is_running():
+            return
+        self._close_connection()
+
+        import pymodelica as pym
+        env = dict(os.environ)
+        env['JVM_ARGS'] = ' '.join([pym.environ['JVM_ARGS'], self.jvm_args]).strip()
+        authkey = os.urandom(32)
+
+        if sys.platform == 'win32':
+            si = subprocess.STARTUPINFO()
+            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        else:
+            si = None
+        self._process = Popen([sys.executable, '-m', 'pymodelica.compiler_server'],
+            stdin=PIPE, stdout=PIPE, env=env, startupinfo=si)
+        # The authentication key is passed on stdin, which is also kept open
+        # so that the server exits together with this process
+        self._process.stdin.write(binascii.hexlify(authkey) + b'\n')
+        self._process.stdin.flush()
+        address = self._process.stdout.readline().decode('utf-8').strip()
+        if not address:
+            self._process.wait()
+            self._process = None
+            raise JError("The compiler server failed to start.")
+        self._conn = Client(address, authkey=authkey)
+
+    def stop(self):
+        """
+        Stop the server process.
+        """
+        with self._lock:
+            if self.is_running():
+                try:
+                    self._conn.send(('stop', None))
+                except (IOError, EOFError):
+                    pass
+                self._process.stdin.close()
+                self._process.wait()
+            self._close_connection()
+            self._process = None
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def compile(self, class_name, file_name, compiler, target, version,
+                platform, compiler_options, compile_to, compiler_log_level):
+        """
+        Compile a model in the server. The arguments are the same as for
+        compile_separate_process, except for jvm_args which are given when the
+        server is created.
+
+        Returns::
+
+            A CompilerResult object with the name of the generated unit (or
+            'None' if no unit was generated) and a list of warnings given by
+            the compiler.
+        """
+        import pymodelica as pym
+        request = {'class_name':         class_name,
+                   'file_name':          file_name,
+                   'compiler':           compiler,
+                   'target':             target,
+                   'version':            version,
+                   'platform':           platform,
+                   'compiler_options':   compiler_options,
+                   'compile_to':         compile_to,
+                   'compiler_log_level': compiler_log_level,
+                   'modelicapath':       pym.environ['MODELICAPATH'],
+                   'cwd':                os.getcwd()}
+        with self._lock:
+            self._start()
+            self._conn.send(('compile', request))
+            (kind, error) = self._conn.recv()
+            if kind == 'error':
+                _raise_error(*error)
+
+            (read_fd, write_fd) = os.pipe()
+            log = CompilerLogHandler()
+            log.start(os.fdopen(read_fd, 'rb'))
+            (kind, data) = (None, None)
+            try:
+                with os.fdopen(write_fd, 'wb') as stream:
+                    (kind, data) = self._conn.recv()
+                    while kind == 'log':
+                        stream.write(data)
+                        stream.flush()
+                        (kind, data) = self._conn.recv()
+            finally:
+                result = log.end()
+            if kind == 'error':
+                _raise_error(*data)
+            return result
+
+def _raise_error(name, message):
+    """
+    Helper function. Raises the error from the compiler module with the given
+    name, or JError if there is no such error.
+    """
+    error = getattr(compiler_exceptions, name, None)
+    if isinstance(error, type) and issubclass(error, JError) and \
+            error is not compiler_exceptions.CompilerError:
+        raise error(message)
+    raise JError(message)
+
+def get_compiler_server():
+    """
+    Get the compiler server used by compile_fmu and compile_fmux. The server
+    process is started on first use.
+
+    Returns::
+
+        The CompilerServer.
+    """
+    global _server
+    if _server is None:
+        _server = CompilerServer()
+    return _server
+
+def stop_compiler_server():
+    """
+    Stop the compiler server used by compile_fmu and compile_fmux, if it has
+    been started.
+    """
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+def _compile(conn, request):
+    """
+    Compile one request in the server process and stream the XML log back
+    over the connection. Errors other than those logged by the compiler are
+    raised, and are sent as the reply to the request by the caller.
+    """
+    from .compiler import _get_compiler, _gen_log_level
+    from .compiler_wrappers import jpype_jexception_compatibility
+    from .compiler_interface import CompilerException
+
+    (fd, log_file) = tempfile.mkstemp(prefix='JM_SERVER_LOG_', suffix='.xml')
+    os.close(fd)
+    try:
+        os.chdir(request['cwd'])
+        comp = _get_compiler(request['file_name'], request['compiler'])
+        comp.set_modelicapath(request['modelicapath'])
+        comp.set_options(request['compiler_options'])
+        comp.set_compiler_logger(_gen_log_level(request['compiler_log_level'],
+            ':' + log_file))
+        comp.set_target_platforms(request['platform'])
+        conn.send(('started', None))
+
+        done = threading.Event()
+        tail = threading.Thread(target=_stream_log, args=(conn, log_file, done))
+        tail.start()
+        java_comp = comp._compiler
+        try:
+            java_comp.compileUnit(request['class_name'], request['file_name'],
+                request['target'], request['version'], request['compile_to'])
+        except comp._java_exception as ex:
+            # Log the exception in the same way as the compiler does when it
+            # is started from the command line
+            if jpype_jexception_compatibility:
+                is_compiler_exception = type(ex) is CompilerException
+            else:
+                is_compiler_exception = ex.javaClass() is CompilerException
+            if is_compiler_exception:
+                if comp.get_boolean_option('generate_html_diagnostics') and \
+                        java_comp.getDiagnosticsGenerator() is not None:
+                    java_comp.getDiagnosticsGenerator().writeProblems(
+                        ex.__javaobject__.getProblems())
+                java_comp.log().logCompilerException(ex.__javaobject__)
+            else:
+                java_comp.log().error(ex.__javaobject__)
+        finally:
+            java_comp.closeLogger()
+            done.set()
+            tail.join()
+        conn.send(('done', None))
+    finally:
+        os.remove(log_file)
+
+def _stream_log(conn, log_file, done):
+    """
+    Send the contents of the log file over the connection as it is written,
+    until done is set and the whole file has been sent.
+    """
+    with open(log_file, 'rb') as stream:
+        while True:
+            finished = done.wait(0.05)
+            data = stream.read()
+            while data:
+                conn.send(('log', data))
+                data = stream.read()
+            if finished:
+                return
+
+def _watch_parent(stream):
+    """
+    Exit the server process when the stream from the parent process is closed.
+    """
+    stream.read()
+    os._exit(0)
+
+def _serve():
+    """
+    Main loop of the server process.
+    """
+    authkey = binascii.unhexlify(sys.stdin.readline().strip())
+    listener = Listener(authkey=authkey)
+    sys.stdout.write(listener.address + '\n')
+    sys.stdout.flush()
+    # Only the address is read from stdout by the parent, any other output
+    # from the compiler is sent to stderr instead
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    watcher = threading.Thread(target=_watch_parent, args=(sys.stdin,))
+    watcher.daemon = True
+    watcher.start()
+
+    # Start the JVM before the first request arrives
+    from . import compiler_wrappers
+
+    try:
+        while True:
+            conn = listener.accept()
+            try:
+                while True:
+                    (kind, request) = conn.recv()
+                    if kind == 'stop':
+                        return
+                    try:
+                        _compile(conn, request)
+                    except Exception as ex:
+                        # Keep serving, the client raises the error. If the
+                        # connection is broken the reply fails as well.
+                        conn.send(('error', (type(ex).__name__, str(ex))))
+            except (IOError, EOFError):
+                pass
+            finally:
+                conn.close()
+    finally:
+        listener.close()
+
+if __name__ == '__main__':
+    _serve()
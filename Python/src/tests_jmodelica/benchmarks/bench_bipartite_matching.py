@@ -0,0 +1,97 @@
+#!/usr/bin/env python 
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2016 Modelon AB
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Scaling benchmark of matching equations and variables and computing strongly
+connected components in pyjmi.symbolic_elimination.BipartiteGraph on synthetic
+sparse DAEs.
+"""
+
+import time
+import numpy as np
+
+from pyjmi.symbolic_elimination import (BipartiteGraph, EliminationOptions, Equation, Variable,
+                                        Edge)
+
+def create_sparse_dae(n, n_inc=3, seed=0):
+    """
+    Create equations, variables and edges of a synthetic sparse DAE that is structurally nonsingular.
+
+    Each equation depends on a randomly permuted variable, which guarantees a perfect matching, and
+    on n_inc further random variables.
+    """
+    rng = np.random.RandomState(seed)
+    equations = [Equation('eq_%d' % i, i, i, False) for i in range(n)]
+    variables = [Variable('var_%d' % i, i, i, False, False) for i in range(n)]
+    perm = rng.permutation(n)
+    edges = []
+    for i in range(n):
+        for j in sorted(set([perm[i]] + list(rng.randint(0, n, n_inc)))):
+            edges.append(Edge(equations[i], variables[j]))
+    return (equations, variables, edges)
+
+def run_benchmark(sizes=[100, 1000, 10000, 100000], n_inc=3, n_rep=3):
+    """
+    Time maximum_match and scc for synthetic sparse DAEs of increasing size.
+
+    Parameters::
+
+        sizes --
+            Numbers of equations.
+            Default: [100, 1000, 10000, 100000]
+
+        n_inc --
+            Number of random incidences per equation, in addition to its matchable variable.
+            Default: 3
+
+        n_rep --
+            Number of repetitions. The best time is reported.
+            Default: 3
+
+    Returns::
+
+        times --
+            Dictionary with the best times for each matching algorithm and for 'scc', as lists ordered as
+            sizes.
+    """
+    algorithms = ['hopcroft_karp', 'scipy']
+    times = dict((alg, []) for alg in algorithms + ['scc'])
+    print("%10s %15s %15s %15s" % ("n", "hopcroft_karp", "scipy", "scc"))
+    for n in sizes:
+        (equations, variables, edges) = create_sparse_dae(n, n_inc)
+        for alg in algorithms:
+            options = EliminationOptions()
+            options['matching'] = alg
+            graph = BipartiteGraph(equations, variables, edges, options)
+            best = float('inf')
+            for i in range(n_rep):
+                t0 = time.time()
+                graph.maximum_match()
+                best = min(best, time.time() - t0)
+            times[alg].append(best)
+        best = float('inf')
+        for i in range(n_rep):
+            t0 = time.time()
+            graph.scc()
+            best = min(best, time.time() - t0)
+        times['scc'].append(best)
+        print("%10d %13.4f s %13.4f s %13.4f s" % (n, times['hopcroft_karp'][-1], times['scipy'][-1],
+                                                   times['scc'][-1]))
+    return times
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python 
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 Modelon AB
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of parsing the vector and matrix leaves of JMI logs, comparing the
+numeric fast path with the general regular expression based parsing.
+"""
+
+import os
+import re
+import time
+
+import numpy as N
+
+from pyjmi.log import parser
+from tests_jmodelica import get_files_path
+
+leaf_pattern = re.compile(r'<(vector|matrix) name="[^"]*">([^<]*)</\1>')
+
+def general_vector(text):
+    """
+    Parse a vector leaf without the numeric fast path.
+    """
+    text = text.strip()
+    if text == "":
+        return N.zeros(0)
+    parts = filter(None, map(str, parser.comma_pattern.split(text)))
+    return N.asarray([parser.parse_value(part) for part in parts])
+
+def general_matrix(text):
+    """
+    Parse a matrix leaf without the numeric fast path.
+    """
+    text = text.strip()
+    if text == "":
+        return N.zeros((0,0))
+    parts = parser.semicolon_pattern.split(text)[1::2]
+    if parser.split_on_empty_match:
+        parts.pop()
+    return N.asarray([general_vector(part) for part in parts])
+
+def run_benchmark(file_names=None, n_rep=5):
+    """
+    Time the parsing of all vector and matrix leaves in JMI logs.
+
+    Parameters::
+
+        file_names --
+            List of JMI log files.
+            Default: The logs in tests_jmodelica/files/FMU_logs.
+
+        n_rep --
+            Number of repetitions. The best time is reported.
+            Default: 5
+
+    Returns::
+
+        times --
+            Dictionary with the best times for the keys 'general' and 'fast'.
+    """
+    if file_names is None:
+        log_dir = os.path.join(get_files_path(), 'FMU_logs')
+        file_names = [os.path.join(log_dir, name) for name in
+                      sorted(os.listdir(log_dir))]
+
+    leaves = []
+    for file_name in file_names:
+        xml = []
+        with open(file_name, 'r') as f:
+            parser.filter_jmi_log(xml.append, f)
+        leaves.extend(leaf_pattern.findall(''.join(xml)))
+
+    parsers = {'general': {'vector': general_vector, 'matrix': general_matrix},
+               'fast':    {'vector': parser.parse_vector,
+                           'matrix': parser.parse_matrix}}
+    times = {}
+    results = {}
+    for (name, parse) in parsers.items():
+        times[name] = float('inf')
+        for i in range(n_rep):
+            t0 = time.time()
+            results[name] = [parse[kind](text) for (kind, text) in leaves]
+            times[name] = min(times[name], time.time() - t0)
+
+    for (general, fast) in zip(results['general'], results['fast']):
+        assert general.dtype == fast.dtype and N.array_equal(general, fast)
+
+    print("Parsed %d vector and matrix leaves" % len(leaves))
+    print("General: %.4f s" % times['general'])
+    print("Fast:    %.4f s" % times['fast'])
+    print("Speedup: %.1f" % (times['general'] / times['fast']))
+    return times
+
+if __name__ == "__main__":
+    run_benchmark()
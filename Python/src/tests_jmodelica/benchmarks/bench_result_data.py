@@ -0,0 +1,86 @@
+#!/usr/bin/env python 
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 Modelon AB
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark of creating LocalDAECollocationAlgResult objects, comparing the
+Dymola result file round trip with the in-memory result data.
+"""
+
+import os
+import time
+
+from pyjmi import transfer_optimization_problem
+from pyjmi.common.io import ResultDymolaTextual
+from tests_jmodelica import get_files_path
+
+def run_benchmark(n_e=200, n_cp=3, n_rep=5):
+    """
+    Time the creation of a result object after solving the CSTR optimization
+    problem, with and without writing a result file.
+
+    Parameters::
+
+        n_e --
+            Number of finite elements.
+            Default: 200
+
+        n_cp --
+            Number of collocation points.
+            Default: 3
+
+        n_rep --
+            Number of repetitions. The best time is reported.
+            Default: 5
+
+    Returns::
+
+        times --
+            Dictionary with the best times for the keys 'file' and 'memory'.
+    """
+    file_path = os.path.join(get_files_path(), "Modelica", "CSTR.mop")
+    op = transfer_optimization_problem("CSTR.CSTR_Opt_Bounds_Lagrange",
+                                       file_path)
+    opts = op.optimize_options()
+    opts['n_e'] = n_e
+    opts['n_cp'] = n_cp
+    opts['verbosity'] = 0
+    opts['IPOPT_options']['print_level'] = 0
+    opts['result_file_name'] = 'bench_result_data.txt'
+    solver = op.prepare_optimization(options=opts)
+    solver.optimize()
+    collocator = solver.collocator
+
+    times = {'file': float('inf'), 'memory': float('inf')}
+    for i in range(n_rep):
+        t0 = time.time()
+        file_name = collocator.export_result_dymola(opts['result_file_name'])
+        ResultDymolaTextual(file_name)
+        times['file'] = min(times['file'], time.time() - t0)
+
+        t0 = time.time()
+        res_mem = collocator.get_result_data()
+        times['memory'] = min(times['memory'], time.time() - t0)
+
+    print("Result data with %d points and %d variables:" %
+          res_mem.get_data_matrix().shape)
+    print("File round trip: %.4f s" % times['file'])
+    print("In memory:       %.4f s" % times['memory'])
+    print("Speedup:         %.1f" % (times['file'] / times['memory']))
+    return times
+
+if __name__ == "__main__":
+    run_benchmark()
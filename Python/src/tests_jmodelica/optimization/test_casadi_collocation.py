@@ -56,6 +56,126 @@ def assert_results(res, cost_ref, u_norm_ref,
     N.testing.assert_allclose(cost, cost_ref, cost_rtol)
     N.testing.assert_allclose(u_norm, u_norm_ref, u_norm_rtol)
 
+def assert_bounds_and_init(col):
+    """
+    Helper function for asserting that the bounds and initial guesses of a
+    collocator equal those computed separately for every variable and
+    collocation point.
+    """
+    op = col.op
+    xx_lb = col.get_xx_lb().copy()
+    xx_ub = col.get_xx_ub().copy()
+    xx_init = col.get_xx_init().copy()
+
+    # Free parameters
+    for var in col.mvar_vectors['p_opt']:
+        name = var.getName()
+        (ind, _) = col.name_map[name]
+        (sf, _) = col._get_affine_scaling(name, -1, -1)
+        xx_lb[col.var_indices['p_opt'][ind]] = op.get_attr(var, "min") / sf
+        xx_ub[col.var_indices['p_opt'][ind]] = op.get_attr(var, "max") / sf
+
+    # Variables at the collocation points
+    for vt in ['dx', 'x', 'w', 'unelim_u']:
+        for var in col.mvar_vectors[vt]:
+            name = var.getName()
+            v_min = op.get_attr(var, "min")
+            v_max = op.get_attr(var, "max")
+            (ind, _) = col.name_map[name]
+            for i in range(1, col.n_e + 1):
+                for k in col.time_points[i]:
+                    d, e = col._get_affine_scaling(name, i, k)
+                    v_init = N.ravel(col._eval_initial(var, i, k))[0]
+                    if col._normalize_min_time and vt == "dx":
+                        v_init *= col._denorm_tf_init - col._denorm_t0_init
+                    global_ind = col.var_indices[vt][i][k][ind]
+                    xx_lb[global_ind] = (v_min - e) / d
+                    xx_ub[global_ind] = (v_max - e) / d
+                    xx_init[global_ind] = (v_init - e) / d
+
+    # Continuity variables
+    if not col.eliminate_cont_var:
+        k = col.n_cp + col.is_gauss
+        for i in range(2, col.n_e + 1):
+            for xx in [xx_lb, xx_ub, xx_init]:
+                xx[col.var_indices['x'][i][0]] = xx[col.var_indices['x'][i - 1][k]]
+
+    N.testing.assert_array_equal(col.get_xx_lb(), xx_lb)
+    N.testing.assert_array_equal(col.get_xx_ub(), xx_ub)
+    N.testing.assert_allclose(col.get_xx_init(), xx_init, rtol=1e-14, atol=1e-14)
+
+def get_result_loops(col):
+    """
+    Helper function for computing the trajectories of dx, x, unelim_u and w
+    of a collocator by evaluating the collocation polynomials point by
+    point, as get_result used to do.
+
+    Eliminated derivatives, continuity variables and inputs, blocking
+    factors, free element lengths and minimum time problems are not
+    handled.
+    """
+    xx = col.primal_opt.copy()
+    vi = col.var_indices
+    pol = col.pol
+    n_cp = col.n_cp
+    var_types = ['dx', 'x', 'unelim_u', 'w']
+    h_scaled = col.horizon * N.array(col.h)
+
+    # Rescale solution
+    if col.variable_scaling and not col.write_scaled_result:
+        for i in range(1, col.n_e + 1):
+            for k in col.time_points[i]:
+                for vt in var_types:
+                    for var in col.mvar_vectors[vt]:
+                        name = var.getName()
+                        (ind, _) = col.name_map[name]
+                        d, e = col._get_affine_scaling(name, i, k)
+                        global_ind = vi[vt][i][k][ind]
+                        xx[global_ind] = d * xx[global_ind] + e
+        for i in range(1, col.n_e):
+            xx[vi['x'][i + 1][0]] = xx[vi['x'][i][n_cp + col.is_gauss]]
+        if col.is_gauss:
+            for i in range(1, col.n_e + 1):
+                if col.quadrature_constraint:
+                    x_np1 = xx[vi['x'][i][0]] + h_scaled[i] * sum(
+                        pol.w[k] * xx[vi['dx'][i][k]] for k in range(1, n_cp + 1))
+                else:
+                    x_np1 = sum(xx[vi['x'][i][k]] * pol.eval_basis(k, 1, True)
+                                for k in range(n_cp + 1))
+                xx[vi['x'][i][n_cp + 1]] = x_np1
+
+    # Get solution trajectories
+    traj = dict((vt, []) for vt in var_types)
+    if col.result_mode == "collocation_points":
+        for i in range(1, col.n_e + 1):
+            for k in sorted(col.time_points[i].keys()):
+                for vt in var_types:
+                    traj[vt].append(xx[vi[vt][i][k]])
+    elif col.result_mode == "element_interpolation":
+        for i in range(1, col.n_e + 1):
+            for tau in N.linspace(0, 1, col.n_eval_points):
+                traj['x'].append(sum(xx[vi['x'][i][k]] * pol.eval_basis(k, tau, True)
+                                     for k in range(n_cp + 1)))
+                for vt in ['unelim_u', 'w']:
+                    traj[vt].append(sum(xx[vi[vt][i][k]] * pol.eval_basis(k, tau, False)
+                                        for k in range(1, n_cp + 1)))
+                traj['dx'].append(sum(xx[vi['x'][i][k]] * pol.eval_basis_der(k, tau)
+                                      for k in range(n_cp + 1)) / h_scaled[i])
+    elif col.result_mode == "mesh_points":
+        for vt in var_types:
+            traj[vt].append(xx[vi[vt][1][0]])
+        k = n_cp + col.is_gauss
+        for i in range(1, col.n_e + 1):
+            traj['x'].append(xx[vi['x'][i][k]])
+            for vt in ['dx', 'unelim_u', 'w']:
+                if col.discr == "LGR":
+                    traj[vt].append(xx[vi[vt][i][k]])
+                else:
+                    traj[vt].append(sum(xx[vi[vt][i][l]] * pol.eval_basis(l, 1, False)
+                                        for l in range(1, n_cp + 1)))
+    return dict((vt, N.array(traj[vt]).reshape([len(traj[vt]), col.n_var[vt]]))
+                for vt in var_types)
+
 class TestLocalDAECollocator(object):
     
     """
@@ -1746,6 +1866,157 @@ class TestLocalDAECollocator(object):
         op.optimize(self.algorithm, opts)
         assert(os.path.exists("vdp_custom_file_name.txt"))
 
+    @testattr(casadi_base = True)
+    def test_write_result_file(self):
+        """
+        Test that the in-memory result matches the result loaded from file.
+        """
+        op = self.vdp_bounds_lagrange_op
+        opts = self.optimize_options(op, self.algorithm)
+        opts['result_file_name'] = "vdp_write_result_file.txt"
+        try:
+            os.remove("vdp_write_result_file.txt")
+        except OSError:
+            pass
+        res_file = op.optimize(self.algorithm, opts)
+
+        opts['result_file_name'] = "vdp_no_result_file.txt"
+        opts['write_result_file'] = False
+        try:
+            os.remove("vdp_no_result_file.txt")
+        except OSError:
+            pass
+        res_mem = op.optimize(self.algorithm, opts)
+        assert(not os.path.exists("vdp_no_result_file.txt"))
+        assert(res_mem.result_file is None)
+
+        assert(sorted(res_mem.keys()) == sorted(res_file.keys()))
+        for name in ['time', 'x1', 'x2', 'der(x1)', 'u']:
+            N.testing.assert_allclose(res_mem[name], res_file[name],
+                                      rtol=1e-12, atol=1e-12)
+
+        # Export the in-memory result and compare with the written file
+        res_mem.export_result_dymola("vdp_no_result_file.txt")
+        with open("vdp_no_result_file.txt") as f_mem:
+            with open("vdp_write_result_file.txt") as f_file:
+                assert(f_mem.read() == f_file.read())
+
+        # Exporting a result to its own result file leaves the file unchanged
+        res_file.export_result_dymola("vdp_write_result_file.txt")
+        with open("vdp_no_result_file.txt") as f_mem:
+            with open("vdp_write_result_file.txt") as f_file:
+                assert(f_mem.read() == f_file.read())
+
+    @testattr(casadi_base = True)
+    def test_get_shifted_xx(self):
+        """
+        Test that interpolating onto a grid shifted by one element length
+        agrees with shifting the NLP vector one element.
+        """
+        op = self.vdp_bounds_lagrange_op
+        opts = self.optimize_options(op, self.algorithm)
+        opts['n_e'] = 20
+        res = op.optimize(self.algorithm, opts)
+        col = res.get_solver().collocator
+        xx = col.primal_opt
+
+        N.testing.assert_allclose(col.get_shifted_xx(xx, 0.), xx)
+        h = (col.tf - col.t0) / opts['n_e']
+        N.testing.assert_allclose(col.get_shifted_xx(xx, h),
+                                  xx[col.get_shift_indices(1)],
+                                  rtol=1e-6, atol=1e-6)
+
+    @testattr(casadi_base = True)
+    def test_bounds_and_init(self):
+        """
+        Test that the bounds and initial guesses of the NLP variables equal
+        those computed for one variable and collocation point at a time.
+
+        The CSTR has unbounded and bounded variables, states with fixed
+        start values and nominal values, and is tested with invariant and
+        time-variant scaling. Free parameters and free time horizons are
+        tested with a parameter estimation and a minimum time problem.
+        """
+        op = self.cstr_lagrange_op
+        opts = self.optimize_options(op, self.algorithm)
+        opts['n_e'] = 10
+        opts['n_cp'] = 3
+        opts['result_file_name'] = "cstr_bounds_result.txt"
+        op.optimize(self.algorithm, opts)
+        traj = ResultDymolaTextual("cstr_bounds_result.txt")
+        for discr in ['LGR', 'LG']:
+            opts['discr'] = discr
+            opts['variable_scaling'] = True
+            assert_bounds_and_init(op.prepare_optimization(options=opts).collocator)
+            opts['variable_scaling'] = False
+            assert_bounds_and_init(op.prepare_optimization(options=opts).collocator)
+            opts['variable_scaling'] = True
+            opts['init_traj'] = traj
+            opts['nominal_traj'] = traj
+            opts['nominal_traj_mode'] = {'_default_mode': 'time-variant'}
+            col = op.prepare_optimization(options=opts).collocator
+            assert col._using_variant_variable_scaling('cstr.c')
+            assert_bounds_and_init(col)
+            opts['init_traj'] = None
+            opts['nominal_traj'] = None
+
+        op = self.second_order_par_est_op
+        quad_pen = OrderedDict()
+        quad_pen['y'] = N.array([[0., 15.], [0., 1.]])
+        opts = self.optimize_options(op, self.algorithm)
+        opts['external_data'] = ExternalData(quad_pen=quad_pen, Q=N.array([[1.]]))
+        opts['n_e'] = 8
+        col = op.prepare_optimization(options=opts).collocator
+        assert col.n_var['p_opt'] == 2
+        assert_bounds_and_init(col)
+
+        op = self.vdp_unscaled_min_time_op
+        opts = self.optimize_options(op, self.algorithm)
+        opts['n_e'] = 8
+        col = op.prepare_optimization(options=opts).collocator
+        assert col._normalize_min_time
+        assert_bounds_and_init(col)
+
+    @testattr(casadi_base = True)
+    def test_get_result_loops(self):
+        """
+        Test that the trajectories given by get_result equal those computed
+        by evaluating the collocation polynomials point by point, for all
+        discretizations and result modes, with and without scaling.
+        """
+        op = self.cstr_lagrange_op
+        opts = self.optimize_options(op, self.algorithm)
+        opts['n_e'] = 5
+        opts['n_cp'] = 3
+        opts['result_file_name'] = "cstr_result_loops_result.txt"
+        op.optimize(self.algorithm, opts)
+        traj = ResultDymolaTextual("cstr_result_loops_result.txt")
+        opts['nominal_traj_mode'] = {'_default_mode': 'time-variant'}
+        N.random.seed(1)
+        for (discr, quadrature_constraint) in [('LGR', True), ('LG', True), ('LG', False)]:
+            for result_mode in ['collocation_points', 'element_interpolation', 'mesh_points']:
+                for nominal_traj in [None, traj]:
+                    for variable_scaling in [True, False]:
+                        opts['discr'] = discr
+                        opts['quadrature_constraint'] = quadrature_constraint
+                        opts['result_mode'] = result_mode
+                        opts['variable_scaling'] = variable_scaling
+                        opts['nominal_traj'] = nominal_traj
+                        col = op.prepare_optimization(options=opts).collocator
+                        assert col.n_var['elim_u'] == 0
+
+                        # Evaluate at a perturbed initial guess, which does not
+                        # satisfy the collocation equations
+                        col.primal_opt = (col.get_xx_init() +
+                                          N.random.rand(col.get_n_xx()))
+                        (_, dx, x, u, w, _, _, _) = col.get_result()
+                        ref = get_result_loops(col)
+                        N.testing.assert_allclose(dx, ref['dx'], rtol=1e-10, atol=1e-8)
+                        N.testing.assert_allclose(x, ref['x'], rtol=1e-10, atol=1e-8)
+                        N.testing.assert_allclose(u[:, col._unelim_input_indices],
+                                                  ref['unelim_u'], rtol=1e-10, atol=1e-8)
+                        N.testing.assert_allclose(w, ref['w'], rtol=1e-10, atol=1e-8)
+
     @testattr(casadi_base = True)
     def test_result_mode(self):
         """
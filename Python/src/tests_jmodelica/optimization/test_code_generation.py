@@ -34,13 +34,15 @@ def result_distance(res1, res2, names):
 
 @testattr(casadi_base = True)
 def test_code_gen():
+    import tempfile
+    import shutil
     var_names = ('x1', 'x2', 'u')
     func_names = ['nlp_test', 'grad_f_test', 'jac_g_test', 'hess_lag_test']
-    exts = ['.c']
     if os.name == 'nt':
-        exts.append('.dll')
+        ext = '.dll'
     else:
-        exts.append('.so')
+        ext = '.so'
+    cache_dir = tempfile.mkdtemp()
     
     file_path = os.path.join(get_files_path(), 'Modelica', 'VDP.mop')
     op = transfer_optimization_problem("VDP_pack.VDP_Opt2", file_path)
@@ -52,31 +54,38 @@ def test_code_gen():
     
     # First solver: generate and compile new C code
     solver1 = op.prepare_optimization(options = opt_opts)
-    solver1.enable_codegen('test')
+    solver1.enable_codegen('test', cache_dir)
     
     # Check that files were created and compiled, and store the
     # time that they were last changed
     file_ctimes = {}
     for func_name in func_names:
-        for ext in exts:
-            file_name = func_name + ext
-            assert os.path.isfile(file_name)
-            file_ctimes[file_name] = os.stat(file_name).st_ctime
+        file_names = [f for f in os.listdir(cache_dir)
+                      if f.startswith(func_name + '_') and f.endswith(ext)]
+        assert len(file_names) == 1
+        assert os.path.isfile(os.path.join(cache_dir, file_names[0][:-len(ext)] + '.c'))
+        file_ctimes[file_names[0]] = os.stat(os.path.join(cache_dir, file_names[0])).st_ctime
     
     res1 = solver1.optimize()
     
     # Second solver: use existing code generated by the first solver
     solver2 = op.prepare_optimization(options = opt_opts)
-    solver2.enable_codegen('test')
+    solver2.enable_codegen('test', cache_dir)
     
-    # Check that files weren't modified
-    for func_name in func_names:
-        for ext in exts:
-            file_name = func_name + ext
-            assert file_ctimes[file_name] == os.stat(file_name).st_ctime
+    # Check that files weren't modified and that no new ones were compiled
+    for file_name in file_ctimes:
+        assert file_ctimes[file_name] == os.stat(os.path.join(cache_dir, file_name)).st_ctime
+    assert len([f for f in os.listdir(cache_dir) if f.endswith(ext)]) == 4
     
     res2 = solver2.optimize()
     
+    # Third solver: a different NLP must not use the existing code
+    opt_opts['n_e'] = opt_opts['n_e'] + 1
+    solver3 = op.prepare_optimization(options = opt_opts)
+    solver3.enable_codegen('test', cache_dir)
+    assert len([f for f in os.listdir(cache_dir) if f.endswith(ext)]) > 4
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    
     # Check that all solvers gave the same result
     assert result_distance(res0, res1, var_names) < 1e-6
     assert result_distance(res0, res2, var_names) < 1e-6
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 Modelon AB
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests the function evaluations in worker processes of pyjmi.optimization.dfo."""
+
+import os
+import shutil
+import tempfile
+import functools
+import numpy as N
+from tests_jmodelica import testattr
+
+try:
+    from pyjmi.optimization import dfo
+    from pyjmi.optimization.thread_feval import FevalPool
+except (NameError, ImportError):
+    pass
+
+func_file = """
+import numpy as N
+
+def dfo_quad(x):
+    return float((x[0] - 1.0)**2 + 2.0*(x[1] - 0.5)**2)
+"""
+
+def dfo_quad(x, a=1.0):
+    x = N.asarray(x)
+    return (x[..., 0] - a)**2 + 2.0*(x[..., 1] - 0.5)**2
+
+class TestFevalPool(object):
+    """
+    Tests the function evaluations in persistent worker processes.
+    """
+
+    def setUp(self):
+        """Write the objective function file in a temporary directory."""
+        self.curr_dir = os.getcwd()
+        self.tmp_dir = tempfile.mkdtemp()
+        os.chdir(self.tmp_dir)
+        with open('dfo_quad.py', 'w') as f:
+            f.write(func_file)
+
+    def tearDown(self):
+        os.chdir(self.curr_dir)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _sub_dirs(self):
+        return sorted(d for d in os.listdir(self.tmp_dir) if d.startswith('dir'))
+
+    @testattr(stddist_base = True)
+    def test_feval(self):
+        """
+        Test the function values and that replaced workers reuse the
+        sub-directories.
+        """
+        pool = FevalPool('dfo_quad.py', 2, fevals_per_worker=1)
+        try:
+            x = N.array([[0., 0.], [1., 0.5], [2., 1.], [3., -1.]])
+            for i in range(5):
+                N.testing.assert_allclose(pool.feval(x), dfo_quad(x))
+            N.testing.assert_allclose(pool.feval(x[0]), 1.5)
+        finally:
+            pool.close()
+        assert self._sub_dirs() == ['dir_1', 'dir_2']
+
+    @testattr(stddist_base = True)
+    def test_nelme_persistent_workers(self):
+        """
+        Test nelme with the objective function evaluated by persistent workers.
+        """
+        x_opt, f_opt, _, _, _ = dfo.nelme('dfo_quad.py', N.array([0., 0.]),
+                                          lb=N.array([-2., -2.]),
+                                          ub=N.array([3., 3.]),
+                                          x_tol=1e-6, f_tol=1e-10, disp=False,
+                                          nbr_cores=2, persistent_workers=True,
+                                          fevals_per_worker=10)
+        N.testing.assert_allclose(x_opt, [1., 0.5], atol=1e-3)
+        N.testing.assert_allclose(f_opt, 0., atol=1e-6)
+        assert self._sub_dirs() == ['dir_1', 'dir_2']
+
+    @testattr(stddist_base = True)
+    def test_seqbar_file(self):
+        """
+        Test that seqbar gives the same result with the objective function
+        given as a file as with a callable.
+        """
+        lb = N.array([-1., -1.])
+        ub = N.array([3., 3.])
+        res_file = dfo.seqbar('dfo_quad.py', N.array([0., 0.]), lb, ub, disp=False,
+                              nbr_cores=2)
+        res_func = dfo.seqbar(dfo_quad, N.array([0., 0.]), lb, ub, disp=False)
+        N.testing.assert_allclose(res_file[0], res_func[0])
+        N.testing.assert_allclose(res_file[1], res_func[1])
+        N.testing.assert_allclose(res_file[0], [1., 0.5], atol=1e-2)
+
+    @testattr(stddist_base = True)
+    def test_seqbar_callables(self):
+        """
+        Test seqbar with callables that are not plain functions.
+        """
+        lb = N.array([-1., -1.])
+        ub = N.array([3., 3.])
+        res_func = dfo.seqbar(dfo_quad, N.array([0., 0.]), lb, ub, disp=False)
+        res_partial = dfo.seqbar(functools.partial(dfo_quad, a=1.0), N.array([0., 0.]),
+                                 lb, ub, disp=False)
+        N.testing.assert_allclose(res_partial[0], res_func[0])
+        assert self._sub_dirs() == []
@@ -314,6 +314,60 @@ def test_compare():
     assert identification.calculate_risk(identification.get_cost()-idObj1.get_cost(),1,2) == result[0]['risk'] 
     
 
+@testattr(casadi_base = True)
+def test_prepared_identification():
+    # Locate the model and file paths 
+    file_path = os.path.join(get_files_path(),'Modelica',"DrumBoiler.mo")
+    modelPath = "DrumBoiler"
+
+    # Load measurement data
+    RCdata = get_test_data()
+    measurements = RCdata['measurements'] 
+    time = RCdata['time'] 
+
+    # Extract control signal data from measurements
+    inputs={}
+    inputs['uc']= measurements.pop('uc')
+    inputs['fc']= measurements.pop('fc')
+
+    # Transfer model to Casadi interface
+    op = transfer_optimization_problem(modelPath, file_path, accept_model=True )
+    op_opts = op.optimize_options()
+
+    # Create greybox object
+    GB = GreyBox(op, op_opts, measurements, inputs, time)
+    
+    # Set some variable attributes
+    GB.set_variable_attribute(GB.get_noise_covariance_variable('E'), 'max', 100)
+    GB.set_variable_attribute(GB.get_noise_covariance_variable('P'), 'max', 100)
+    GB.set_variable_attribute('x10', 'initialGuess', 148)
+    GB.set_variable_attribute('x20', 'initialGuess', 27.5)
+    
+    # Discretize once with all candidate parameters free
+    nullModelFree = set(['GreyBox_r_E', 'GreyBox_r_P', 'x10', 'x20'])
+    GB.prepare_identification(nullModelFree.union(['TD', 'A4']))
+    
+    identification = GB.identify(nullModelFree)
+    idObj1 = identification.release(set(['TD']))
+    idObj2 = identification.release(set(['A4']))
+    
+    # Assert free variables
+    assert idObj1.free_parameters == frozenset(nullModelFree.union(['TD']))
+    assert idObj2.free_parameters == frozenset(nullModelFree.union(['A4']))
+    
+    # Assert that the fixed candidates keep their values
+    N.testing.assert_allclose(idObj1.result.final('A4'), op.get('A4'))
+    N.testing.assert_allclose(idObj2.result.final('TD'), op.get('TD'))
+    
+    # Same results as when the problem is discretized for each identification
+    result = identification.compare([idObj1, idObj2])
+    N.testing.assert_allclose(result[0]['cost'], 5466.596970228651, 1e-3)
+    N.testing.assert_allclose(result[1]['cost'], 5630.90033894926, 1e-3)
+    
+    # Parameters that were not candidates can not be freed
+    N.testing.assert_raises(ValueError, GB.identify, 
+                            nullModelFree.union(['TR']))
+
 @testattr(casadi_base = True)
 def test_risk_calculation():
     
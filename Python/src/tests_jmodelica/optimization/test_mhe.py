@@ -529,7 +529,42 @@ class TestMHE:
                                   [0.00000000e+00, 1.00180909e-01, -2.75727273e-02],
                                   [0.00000000e+00, -2.75727273e-02, 9.19090909e-02]])) \
                                  <= small).all() == True
-                   
+
+    @testattr(casadi_base = True)
+    def test_linearization_vectors(self):
+        """
+        Test that the covariance update with the work point given as
+        vectors gives the same result as with lists of tuples.
+        """
+        P = []
+        for k in range(2):
+            op = transfer_optimization_problem(self.CSTR_cpath,
+                                               self.CSTR_fpath,
+                                               accept_model = True,
+                                               compiler_options = \
+                                               {"state_initial_equations":True,
+                                                "common_subexp_elim":False})
+            MHE_object = MHE(op, 0.1, 5,
+                             self.CSTR_x_0_guess,
+                             self.CSTR_dx_0,
+                             self.CSTR_c_0,
+                             self.CSTR_MHE_opts)
+            EKF_object = MHE_object.EKF_object
+            if k == 0:
+                P.append(EKF_object.get_next_P(1., [('c',1000.),('T',350.)],
+                            [('der(c)', -16.665532637956801),
+                             ('der(T)', -1.7613805165047101)],
+                            [('Tc', 350.)], []))
+            else:
+                x = {'c':1000., 'T':350.}
+                dx = {'c':-16.665532637956801, 'T':-1.7613805165047101}
+                names = EKF_object._state_names
+                P.append(EKF_object.get_next_P_vectors(1.,
+                            N.array([x[name] for name in names]),
+                            N.array([dx[name] for name in names]),
+                            N.array([350.]), N.array([])))
+        N.testing.assert_array_almost_equal(P[0], P[1])
+
     def _CSTR_test_linearization(self, MHE_object):
         """
         """
@@ -848,6 +883,128 @@ class TestMHE:
                 #Check that the estimation match the expected values
                 assert(N.abs(x_est_t[name] - res[name][k]) < small) == True
         
+    @testattr(casadi_base = True)
+    def test_persistent_solver(self):
+        """
+        Test that the persistent solver gives the same estimates as 
+        discretizing the problem in every sample.
+        """
+        u = N.array([200., 230.90169944, 258.77852523, 280.90169944, 
+                     295.10565163, 300., 295.10565163, 280.90169944, 
+                     258.77852523, 230.90169944, 200.])
+        y_T = N.array([350.49995133, 350.62330131, 348.36492738, 
+                       350.66030448, 349.06684452, 350.30260073, 
+                       350.88973306, 351.02143123,352.25379842, 
+                       350.69031449, 350.52862786])
+        y_c = N.array([1000.15989016, 995.19520286, 995.36670838, 
+                       992.97568672, 994.39361231, 993.60003461, 
+                       991.27116652, 984.54130088, 984.5513898 , 
+                       987.03969368, 979.94914004])
+        nbr_of_points = 11
+        sample_time = 1.0/(nbr_of_points - 1)
+        horizon = 5
+        
+        MHE_objects = []
+        for persistent in [False, True]:
+            op = transfer_optimization_problem(self.CSTR_cpath, 
+                                               self.CSTR_fpath, 
+                                               accept_model = True, 
+                                               compiler_options = \
+                                               {"state_initial_equations":True,
+                                                "common_subexp_elim":False})
+            opts = self.CSTR_MHE_opts.copy()
+            opts['persistent_solver'] = persistent
+            MHE_objects.append(MHE(op, sample_time, horizon, 
+                                   self.CSTR_x_0_guess, self.CSTR_dx_0, 
+                                   self.CSTR_c_0, opts))
+        
+        small = 1e-4
+        for k in range(1, nbr_of_points):
+            u_in = [('Tc', u[k-1])]
+            y_in = [('T', y_T[k-1]), ('c', y_c[k-1])]
+            x_est = MHE_objects[0].step(u_in, y_in)
+            x_est_persistent = MHE_objects[1].step(u_in, y_in)
+            for name in ['c', 'T']:
+                assert(N.abs(x_est[name] - x_est_persistent[name]) < small)
+        #The persistent collocator should have been used
+        assert MHE_objects[1]._collocator is not None
+
+    @testattr(casadi_base = True)
+    def test_keep_history(self):
+        """
+        Test that the history of the estimates is kept when the
+        horizon moves.
+        """
+        u = N.array([200., 230.90169944, 258.77852523, 280.90169944,
+                     295.10565163, 300., 295.10565163, 280.90169944])
+        y_T = N.array([350.49995133, 350.62330131, 348.36492738,
+                       350.66030448, 349.06684452, 350.30260073,
+                       350.88973306, 351.02143123])
+        y_c = N.array([1000.15989016, 995.19520286, 995.36670838,
+                       992.97568672, 994.39361231, 993.60003461,
+                       991.27116652, 984.54130088])
+        sample_time = 0.1
+        horizon = 3
+        op = transfer_optimization_problem(self.CSTR_cpath,
+                                           self.CSTR_fpath,
+                                           accept_model = True,
+                                           compiler_options = \
+                                           {"state_initial_equations":True,
+                                            "common_subexp_elim":False})
+        opts = self.CSTR_MHE_opts.copy()
+        opts['keep_history'] = True
+        MHE_object = MHE(op, sample_time, horizon, self.CSTR_x_0_guess,
+                         self.CSTR_dx_0, self.CSTR_c_0, opts)
+
+        estimates = []
+        for k in range(len(u)):
+            x_est = MHE_object.step([('Tc', u[k])],
+                                    [('T', y_T[k]), ('c', y_c[k])])
+            estimates.append(x_est['T'])
+            #Only the current horizon is used in the estimation
+            assert MHE_object.x_est.shape[1] == min(k + 2, horizon + 1)
+
+        history = MHE_object.get_history()
+        N.testing.assert_array_almost_equal(history['time'],
+                                            sample_time*N.arange(len(u) + 1))
+        N.testing.assert_array_equal(history['T'][1:], estimates)
+        assert history['T'][0] == self.CSTR_x_0_guess['T']
+
+    @testattr(casadi_base = True)
+    def test_horizon_copies(self):
+        """
+        Test that the estimates, inputs and measurements returned by the 
+        MHE object are not changed when the horizon moves.
+        """
+        u = N.array([200., 230.90169944, 258.77852523, 280.90169944,
+                     295.10565163, 300., 295.10565163, 280.90169944])
+        y_T = N.array([350.49995133, 350.62330131, 348.36492738,
+                       350.66030448, 349.06684452, 350.30260073,
+                       350.88973306, 351.02143123])
+        y_c = N.array([1000.15989016, 995.19520286, 995.36670838,
+                       992.97568672, 994.39361231, 993.60003461,
+                       991.27116652, 984.54130088])
+        op = transfer_optimization_problem(self.CSTR_cpath,
+                                           self.CSTR_fpath,
+                                           accept_model = True,
+                                           compiler_options = \
+                                           {"state_initial_equations":True,
+                                            "common_subexp_elim":False})
+        MHE_object = MHE(op, 0.1, 3, self.CSTR_x_0_guess,
+                         self.CSTR_dx_0, self.CSTR_c_0, self.CSTR_MHE_opts)
+
+        kept = []
+        for k in range(len(u)):
+            MHE_object.step([('Tc', u[k])], [('T', y_T[k]), ('c', y_c[k])])
+            arrays = (MHE_object.x_est, MHE_object.u, MHE_object.y)
+            kept.append((arrays, [a.copy() for a in arrays]))
+            #Changing the returned arrays does not change the estimator
+            MHE_object.x_est[:] = 0
+            N.testing.assert_array_equal(MHE_object.x_est, arrays[0])
+        for (arrays, copies) in kept:
+            for (a, a_copy) in zip(arrays, copies):
+                N.testing.assert_array_equal(a, a_copy)
+
     @testattr(casadi_base = True)
     def VDP_test(self):
         """
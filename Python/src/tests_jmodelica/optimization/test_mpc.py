@@ -7,6 +7,8 @@
 
 import os
 import nose
+import shutil
+import tempfile
 
 from collections import OrderedDict
 import numpy as N
@@ -22,7 +24,7 @@ try:
     from pyjmi import transfer_to_casadi_interface
     from pyjmi.optimization.casadi_collocation import *
     import casadi
-    from pyjmi.optimization.mpc import MPC
+    from pyjmi.optimization.mpc import MPC, MPCResultStore
     from pyjmi.optimization.casadi_collocation import BlockingFactors
 except (NameError, ImportError):
     pass
@@ -45,6 +47,68 @@ def assert_results(res, input_name, u_norm_ref, u_norm_rtol=1e-4):
     u_norm = N.linalg.norm(u) / N.sqrt(len(u))
     N.testing.assert_allclose(u_norm, u_norm_ref, u_norm_rtol)
 
+def shift_xx(MPC_object, xx_result):
+    """
+    Shifts the NLP result vector one sample by concatenating its parts, the 
+    way MPC._shift_xx did before using precomputed indices.
+    """
+    split_map = {'x': 0, 'dx': 1, 'w': 2, 'unelim_u': 3, 'p_opt': 5}
+    coll = MPC_object.collocator
+    gsi = coll.global_split_indices
+    n_e = MPC_object.options['n_e']
+    n_cp = MPC_object.options['n_cp']
+    n_e_s = MPC_object.n_e_s
+    factors = MPC_object.options['blocking_factors'].factors
+    shifted_xx = xx_result[0:0]
+
+    # Shift x, dx and w
+    is_x = 1
+    for vk in ['x', 'dx', 'w']:
+        start = gsi[split_map[vk]]
+        end = gsi[split_map[vk]+1]
+        n_var = coll.n_var[vk]
+        shifted_xx = N.concatenate(
+            (shifted_xx, xx_result[start+n_var*n_e_s*(n_cp+is_x):end]))
+        for i in range((n_cp+is_x)*n_e_s):
+            shifted_xx = N.concatenate((shifted_xx, xx_result[end-n_var:end]))
+        is_x = 0
+
+    # Shift inputs without blocking factors
+    n_cont_u = len([var for var in coll.mvar_vectors['unelim_u']
+                    if var.getName() not in factors])
+    start_cont_u = gsi[split_map['unelim_u']]
+    end_cont_u = start_cont_u + n_cont_u*n_cp*n_e
+    shifted_xx = N.concatenate(
+        (shifted_xx, xx_result[start_cont_u+n_cont_u*n_cp*n_e_s:end_cont_u]))
+    for i in range(n_cp*n_e_s):
+        shifted_xx = N.concatenate(
+            (shifted_xx, xx_result[end_cont_u-n_cont_u:end_cont_u]))
+
+    # Shift inputs with blocking factors
+    n_bf_u = coll.n_var['unelim_u'] - n_cont_u
+    start_bf_u = end_cont_u
+    for name in factors:
+        end_bf_u = start_bf_u + len(factors[name])
+        shifted_xx = N.concatenate(
+            (shifted_xx, xx_result[start_bf_u+n_bf_u:end_bf_u]))
+        shifted_xx = N.concatenate(
+            (shifted_xx, xx_result[end_bf_u-n_bf_u:end_bf_u]))
+        start_bf_u = end_bf_u
+
+    # Shift initial controls, dx and w
+    start = gsi[split_map['unelim_u']] + (n_cp*n_e_s-1)*n_cont_u
+    shifted_xx = N.concatenate((shifted_xx, xx_result[start:start+n_cont_u]))
+    for vk in ['dx', 'w']:
+        n_var = coll.n_var[vk]
+        start = gsi[split_map[vk]] + (n_cp*n_e_s-1)*n_var
+        shifted_xx = N.concatenate((shifted_xx, xx_result[start:start+n_var]))
+
+    # Add p_opt
+    shifted_xx = N.concatenate(
+        (shifted_xx, xx_result[gsi[split_map['p_opt']]:
+                               gsi[split_map['p_opt']+1]]))
+    return shifted_xx
+
 class TestMPCClass(object):
     """
     Tests pyjmi.optimization.mpc.
@@ -272,44 +336,92 @@ class TestMPCClass(object):
         N.testing.assert_('Solve_Succeeded', MPC_object.collocator.
                                         solver_object.getStat('return_status'))
 
-    #~ @testattr(casadi_base = True)
-    #~ def test_shift_xx(self):
-        #~ """
-        #~ Test that the result from the shift operation equals the result from
-        #~ extracting initial trajectories from a result file. 
-        #~ """
-        #~ op = transfer_to_casadi_interface("CSTR.CSTR_MPC_Parameter", 
-                                        #~ self.cstr_file_path,
-                            #~ compiler_options={"state_initial_equations":True})
-        #~ op.set('_start_c', float(self.c_0_A))
-        #~ op.set('_start_T', float(self.T_0_A))
-        
-        #~ # Set options collocation
-        #~ n_e = 50
-        #~ opt_opts = op.optimize_options()
-        #~ opt_opts['n_e'] = n_e
-        #~ opt_opts['IPOPT_options']['print_level'] = 0
-          
-        #~ # Define some MPC-options
-        #~ sample_period = 3
-        #~ horizon = 50
-        #~ seed = 7
-        
-        #~ # Create MPC-object using trajectories
-        #~ MPC_object = MPC(op, opt_opts, sample_period, horizon, noise_seed=seed, 
-                        #~ initial_guess='trajectory')
-        
-        #~ MPC_object.update_state()
-        #~ u_k1 = MPC_object.sample()
-        #~ MPC_object.update_state()
-        #~ # Do shifting
-        #~ MPC_object._shift_xx()
-        
-        #~ u_k2 = MPC_object.sample()
+    @testattr(casadi_base = True)
+    def test_shift_xx(self):
+        """
+        Test that the shift indices give the same result as shifting the NLP
+        result vector piece by piece.
+        """
+        cases = [("CSTR.CSTR_MPC", 3, 1),
+                 ("CSTR.CSTR_MPC_Parameter", 3, 2),
+                 ("CSTR.CSTR_elim_vars_MPC", 2, 2)]
+        for (class_name, n_cp, n_e_s) in cases:
+            op = transfer_to_casadi_interface(class_name, self.cstr_file_path,
+                            compiler_options={"state_initial_equations":True})
+            op.set('_start_c', float(self.c_0_A))
+            op.set('_start_T', float(self.T_0_A))
+
+            # Set options collocation
+            horizon = 10
+            opt_opts = op.optimize_options()
+            opt_opts['n_e'] = n_e_s*horizon
+            opt_opts['n_cp'] = n_cp
+            opt_opts['IPOPT_options']['print_level'] = 0
+            
+            # Create MPC-object, which adds blocking factors to Tc
+            MPC_object = MPC(op, opt_opts, 3, horizon)
+            coll = MPC_object.collocator
+            assert 'Tc' in MPC_object.options['blocking_factors'].factors
+            if class_name == "CSTR.CSTR_elim_vars_MPC":
+                assert coll.n_var['w'] > 0
+            else:
+                assert coll.n_var['w'] == 0
+
+            xx_result = N.random.rand(coll.n_xx)
+            indices = MPC_object._get_shift_indices(coll.n_xx)
+            N.testing.assert_array_equal(xx_result[indices],
+                                         shift_xx(MPC_object, xx_result))
 
-        #~ # Assert that the shifted result equals the result from result
-        #~ N.testing.assert_array_almost_equal(MPC_object.collocator.xx_init, 
-                                            #~ MPC_object.shifted_xx)
+            # Shift the last successful result
+            MPC_object.found_solution = False
+            MPC_object.shifted_xx = xx_result
+            MPC_object._shift_xx()
+            N.testing.assert_array_equal(coll.xx_init, 
+                                         shift_xx(MPC_object, xx_result))
+            N.testing.assert_array_equal(MPC_object.shifted_xx, coll.xx_init)
+
+    @testattr(casadi_base = True)
+    def test_shift_dual_warm_start(self):
+        """
+        Test that shifting the bound multipliers together with the primal 
+        variables does not increase the number of iterations compared to 
+        only shifting the primal variables.
+        """
+        class PrimalShiftMPC(MPC):
+            def _shift_xx(self):
+                if self.found_solution:
+                    self.shifted_xx = shift_xx(self, self.collocator.primal_opt)
+                else:
+                    self.shifted_xx = shift_xx(self, self.shifted_xx)
+                self.collocator.xx_init = self.shifted_xx
+
+        iterations = []
+        for mpc_class in [MPC, PrimalShiftMPC]:
+            op = transfer_to_casadi_interface("CSTR.CSTR_MPC", 
+                                              self.cstr_file_path,
+                            compiler_options={"state_initial_equations":True})
+            
+            # Set options collocation
+            opt_opts = op.optimize_options()
+            opt_opts['n_e'] = 50
+            opt_opts['IPOPT_options']['print_level'] = 0
+            
+            # Create MPC-object
+            MPC_object = mpc_class(op, opt_opts, 3, 50, noise_seed=7,
+                                   constr_viol_costs={'T': 1e6})
+            MPC_object.update_state({'_start_c': 587.47543496, 
+                                     '_start_T': 345.64619542})
+            MPC_object.sample()
+            for k in range(4):
+                MPC_object.update_state()
+                MPC_object.sample()
+            
+            (stats, _) = MPC_object.get_solver_stats()
+            iterations.append([stat[1] for stat in stats])
+
+        N.testing.assert_equal(iterations[0][0], iterations[1][0])
+        assert sum(iterations[0]) <= sum(iterations[1]), \
+            "Iterations {} are more than {}".format(*iterations)
 
     @testattr(casadi_base = True)
     def test_infeasible_return_input(self):
@@ -458,6 +570,99 @@ class TestMPCClass(object):
         N.testing.assert_equal(sample_period, result2['time'][0])
         N.testing.assert_equal(sample_period*(horizon+1), result2['time'][-1])
 
+    @testattr(casadi_base = True)
+    def test_comp_result_file(self):
+        """
+        Test that the complete result is the same when it is stored in a 
+        file as when it is kept in memory.
+        """
+        sim_fmu = compile_fmu("CSTR.CSTR_MPC_Model", self.cstr_file_path, 
+                            compiler_options={"state_initial_equations":True})
+        sim_model = load_fmu(sim_fmu)
+        
+        tmp_dir = tempfile.mkdtemp()
+        file_name = os.path.join(tmp_dir, 'comp_result.bin')
+        sample_period = 5
+        horizon = 10
+        results = []
+        try:
+            for comp_result_file in [None, file_name]:
+                op = transfer_to_casadi_interface("CSTR.CSTR_MPC", 
+                                                  self.cstr_file_path,
+                            compiler_options={"state_initial_equations":True})
+                opt_opts = op.optimize_options()
+                opt_opts['n_e'] = horizon
+                opt_opts['n_cp'] = 2
+                opt_opts['IPOPT_options']['print_level'] = 0
+                
+                MPC_object = MPC(op, opt_opts, sample_period, horizon, 
+                                 constr_viol_costs={'T': 1e6}, noise_seed=1,
+                                 comp_result_file=comp_result_file)
+                
+                x_k = {'_start_c': self.c_0_A, '_start_T': self.T_0_A}
+                for k in range(3):
+                    MPC_object.update_state(x_k)
+                    u_k = MPC_object.sample()
+                    sim_model.reset()
+                    sim_model.set(list(x_k.keys()), list(x_k.values()))
+                    sim_res = sim_model.simulate(start_time=k*sample_period, 
+                                            final_time=(k+1)*sample_period, 
+                                            input=u_k)
+                    x_k = MPC_object.extract_states(sim_res, mean=0, 
+                                                    st_dev=0.005)
+                results.append(MPC_object.get_complete_results())
+            
+            res_store = MPC_object.res
+            N.testing.assert_equal(os.path.getsize(file_name), 
+                                   8*res_store.n_rows*res_store.n_columns)
+            for name in ['time', 'c', 'T', 'Tc']:
+                N.testing.assert_array_equal(results[0][name], 
+                                             results[1][name])
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    @testattr(casadi_base = True)
+    def test_update_state_trajectory(self):
+        """
+        Test that update_state extracts the states from the previous 
+        optimization with initial_guess='trajectory'.
+        """
+        op = transfer_to_casadi_interface("CSTR.CSTR_MPC", 
+                                        self.cstr_file_path,
+                            compiler_options={"state_initial_equations":True})
+        op.set('_start_c', float(self.c_0_A))
+        op.set('_start_T', float(self.T_0_A))
+        
+        # Set options collocation
+        n_e = 50
+        opt_opts = op.optimize_options()
+        opt_opts['n_e'] = n_e
+        opt_opts['IPOPT_options']['print_level'] = 0
+          
+        # Define some MPC-options
+        sample_period = 3
+        horizon = 50
+        seed = 7
+        cvc = {'T': 1e6}
+        
+        # Create MPC-object
+        MPC_object = MPC(op, opt_opts, sample_period, horizon, 
+                                constr_viol_costs=cvc, noise_seed=seed, 
+                                initial_guess='trajectory')
+
+        MPC_object.update_state()
+        u_k1 = MPC_object.sample()
+        MPC_object.update_state()
+        
+        # The states are the result at the end of the first sample plus noise
+        result1 = MPC_object.get_results_this_sample()
+        ind = MPC_object._nbr_values_sample-1
+        N.testing.assert_allclose(op.get('_start_c'), result1['c'][ind], 5e-2)
+        N.testing.assert_allclose(op.get('_start_T'), result1['T'][ind], 5e-2)
+        
+        u_k2 = MPC_object.sample()
+        assert MPC_object.found_solution
+
     #~ @testattr(casadi_base = True)
     #~ def test_set(self):
         #~ """
@@ -782,3 +987,69 @@ class TestMPCClass(object):
         N.testing.assert_array_almost_equal(complete_result['T'],complete_result_elim['T'])
         N.testing.assert_array_almost_equal(complete_result['Tc'],complete_result_elim['Tc'])
           
+
+class TestMPCResultStore(object):
+    """
+    Tests pyjmi.optimization.mpc.MPCResultStore.
+    """
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.tmp_dir, 'comp_result.bin')
+        self.blocks = [N.arange(6.).reshape(2, 3), N.array([6., 7., 8.]),
+                       N.arange(9., 18.).reshape(3, 3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    @testattr(casadi_base = True)
+    def test_empty(self):
+        """
+        Test the data of a store without blocks.
+        """
+        for file_name in [None, self.file_name]:
+            store = MPCResultStore(3, file_name)
+            N.testing.assert_equal(store.n_rows, 0)
+            N.testing.assert_equal(store.get_data().shape, (0, 3))
+        N.testing.assert_equal(os.path.getsize(self.file_name), 0)
+
+    @testattr(casadi_base = True)
+    def test_append(self):
+        """
+        Test appending several blocks to a store in memory.
+        """
+        store = MPCResultStore(3)
+        store.append(self.blocks[0])
+        store.append(self.blocks[1])
+        N.testing.assert_array_equal(store.get_data(), 
+                                     N.arange(9.).reshape(3, 3))
+        
+        # Append after the blocks have been joined
+        store.append(self.blocks[2])
+        N.testing.assert_equal(store.n_rows, 6)
+        N.testing.assert_array_equal(store.get_data(), 
+                                     N.arange(18.).reshape(6, 3))
+        N.testing.assert_array_equal(store.get_data(), 
+                                     N.arange(18.).reshape(6, 3))
+
+    @testattr(casadi_base = True)
+    def test_append_file(self):
+        """
+        Test appending several blocks to a store in a file.
+        """
+        with open(self.file_name, 'wb') as f:
+            f.write(b'old content')
+        store = MPCResultStore(3, self.file_name)
+        N.testing.assert_equal(os.path.getsize(self.file_name), 0)
+        
+        store.append(self.blocks[0])
+        store.append(self.blocks[1])
+        data = store.get_data()
+        assert isinstance(data, N.memmap)
+        N.testing.assert_array_equal(data, N.arange(9.).reshape(3, 3))
+        del data
+        
+        store.append(self.blocks[2])
+        N.testing.assert_equal(store.n_rows, 6)
+        N.testing.assert_equal(os.path.getsize(self.file_name), 8*18)
+        N.testing.assert_array_equal(store.get_data(), 
+                                     N.arange(18.).reshape(6, 3))
@@ -1631,3 +1631,159 @@ def test_ModelIdentifier():
     optProblem = load_optimization_problem("identifierTest.identfierTestModel", optproblemsFile)
     assert strnorm(optProblem.getIdentifier()) ==\
            strnorm("identifierTest_identfierTestModel")
+
+@testattr(casadi_base = True)
+def test_SaveAndLoadOptimizationProblem():
+    import tempfile
+    from pyjmi.casadi_interface import save_model, load_model
+    from pyjmi.casadi_interface import transfer_optimization_problem as transfer_op
+    file_name = os.path.join(tempfile.mkdtemp(), "op.pickle")
+    for class_name in ["atomicOptimizationMixedConstraints", "atomicOptimizationTimedVariables"]:
+        optProblem = transfer_op(class_name, optproblemsFile)
+        save_model(optProblem, file_name)
+        loaded = load_model(file_name)
+        assert strnorm(loaded.getDaeResidual()) == strnorm(optProblem.getDaeResidual())
+        assert strnorm(loaded.getInitialResidual()) == strnorm(optProblem.getInitialResidual())
+        assert strnorm(computeStringRepresentationForContainer(loaded.getPathConstraints())) ==\
+               strnorm(computeStringRepresentationForContainer(optProblem.getPathConstraints()))
+        assert strnorm(computeStringRepresentationForContainer(loaded.getPointConstraints())) ==\
+               strnorm(computeStringRepresentationForContainer(optProblem.getPointConstraints()))
+        assert str(loaded.getObjective()) == str(optProblem.getObjective())
+        assert loaded.getIdentifier() == optProblem.getIdentifier()
+        assert len(loaded.getAllVariables()) == len(optProblem.getAllVariables())
+        assert len(loaded.getTimedVariables()) == len(optProblem.getTimedVariables())
+        for (tv, loaded_tv) in zip(optProblem.getTimedVariables(), loaded.getTimedVariables()):
+            assert tv.getBaseVariable().getName() == loaded_tv.getBaseVariable().getName()
+    os.remove(file_name)
+
+@testattr(casadi_base = True)
+def test_TransferOptimizationProblemCache():
+    import shutil
+    import pickle
+    import tempfile
+    import numpy as N
+    import pyjmi.casadi_interface as casadi_interface
+    from pyjmi.casadi_interface import transfer_optimization_problem as transfer_op
+    tmp_dir = tempfile.mkdtemp()
+    cache_dir = os.path.join(tmp_dir, 'cache')
+    vdpFile = os.path.join(tmp_dir, 'VDP.mop')
+    shutil.copyfile(os.path.join(get_files_path(), 'Modelica', 'VDP.mop'), vdpFile)
+    class_name = "VDP_pack.VDP_Opt_Scaled_Min_Time"
+    def cache_files():
+        return sorted(os.listdir(cache_dir))
+    def no_transfer(*args, **kwargs):
+        raise AssertionError("The problem was compiled although it is cached")
+    try:
+        # Cache miss
+        optProblem = transfer_op(class_name, vdpFile)
+        transfer_op(class_name, vdpFile, cache=cache_dir)
+        assert len(cache_files()) == 1
+
+        # Cache hit, without compiling
+        transfer = casadi_interface._transfer_optimization_problem
+        casadi_interface._transfer_optimization_problem = no_transfer
+        try:
+            loaded = transfer_op(class_name, vdpFile, cache=cache_dir)
+        finally:
+            casadi_interface._transfer_optimization_problem = transfer
+        assert len(cache_files()) == 1
+
+        # Variable attributes
+        assert len(loaded.getAllVariables()) == len(optProblem.getAllVariables())
+        for var in optProblem.getAllVariables():
+            loaded_var = loaded.getVariable(var.getName())
+            for attr in ['min', 'max', 'nominal', 'initialGuess', 'free', 'start', 'fixed']:
+                assert str(loaded_var.getAttribute(attr)) == str(var.getAttribute(attr))
+        tf = loaded.getVariable('tf')
+        assert loaded.get_attr(tf, 'free')
+        assert loaded.get_attr(tf, 'min') == 0.2
+        assert loaded.get_attr(tf, 'initialGuess') == 2.
+
+        # The loaded problem gives the same optimum
+        res = optProblem.optimize()
+        res_loaded = loaded.optimize()
+        for name in ['time', 'x1', 'x2', 'u']:
+            N.testing.assert_allclose(res_loaded[name], res[name], rtol=1e-8, atol=1e-8)
+        N.testing.assert_allclose(res_loaded.final('tf'), res.final('tf'), rtol=1e-8)
+
+        # Editing the model file invalidates the cached problem
+        with open(vdpFile) as f:
+            text = f.read()
+        with open(vdpFile, 'w') as f:
+            f.write(text.replace("tf(free=true, min=0.2,", "tf(free=true, min=0.3,"))
+        edited = transfer_op(class_name, vdpFile, cache=cache_dir)
+        assert edited.get_attr(edited.getVariable('tf'), 'min') == 0.3
+        assert len(cache_files()) == 2
+
+        # An incompatible cached file is replaced by transferring again
+        for name in cache_files():
+            with open(os.path.join(cache_dir, name), 'wb') as f:
+                pickle.dump({}, f)
+        edited = transfer_op(class_name, vdpFile, cache=cache_dir)
+        assert edited.get_attr(edited.getVariable('tf'), 'min') == 0.3
+        casadi_interface._transfer_optimization_problem = no_transfer
+        try:
+            edited = transfer_op(class_name, vdpFile, cache=cache_dir)
+        finally:
+            casadi_interface._transfer_optimization_problem = transfer
+        assert edited.get_attr(edited.getVariable('tf'), 'min') == 0.3
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+@testattr(casadi_base = True)
+def test_AugmentSensitivities():
+    import numpy as N
+    import casadi
+    from pyjmi.casadi_interface import transfer_model as transfer_mod
+    cstrFile = os.path.join(get_files_path(), 'Modelica', 'CSTR.mop')
+    parameters = ["c0", "T0", "k0"]
+    model = transfer_mod("CSTR.CSTR_elim_vars", cstrFile)
+    mvars = {}
+    for (vk, kind) in [('dx', model.DERIVATIVE), ('x', model.DIFFERENTIATED),
+                       ('w', model.REAL_ALGEBRAIC)]:
+        mvars[vk] = [var for var in model.getVariables(kind)
+                     if not var.isAlias() and not var.wasEliminated()]
+    dae = model.getDaeResidual()
+    init = model.getInitialResidual()
+    model.augment_sensitivities(parameters)
+    sens_dae = model.getDaeResidual()
+    sens_init = model.getInitialResidual()
+    assert sens_dae.numel() == (len(parameters) + 1) * dae.numel()
+    assert sens_init.numel() == (len(parameters) + 1) * init.numel()
+
+    # Dense formulation, differentiating every residual with respect to every variable
+    def dense_sens_eqs(res, par):
+        eqs = []
+        for i in range(res.numel()):
+            eq = casadi.MX(0.)
+            for vk in ['dx', 'x', 'w']:
+                for mvar in mvars[vk]:
+                    if vk == 'dx':
+                        name = "der(d%s/d%s)" % (mvar.getMyDifferentiatedVariable().getName(), par)
+                    else:
+                        name = "d%s/d%s" % (mvar.getName(), par)
+                    eq += casadi.jacobian(res[i], mvar.getVar()) * model.getVariable(name).getVar()
+            eq += casadi.jacobian(res[i], model.getVariable(par).getVar())
+            eqs.append(eq)
+        return eqs
+    dense_dae = [eq for par in parameters for eq in dense_sens_eqs(dae, par)]
+    dense_init = [eq for par in parameters for eq in dense_sens_eqs(init, par)]
+
+    # Compare the sensitivity equations at random points
+    inputs = [model.getTimeVariable()] + [var.getVar() for var in model.getAllVariables()
+                                          if not var.isAlias()]
+    outputs = [casadi.vertcat([sens_dae[i] for i in range(dae.numel(), sens_dae.numel())]),
+               casadi.vertcat(dense_dae),
+               casadi.vertcat([sens_init[i] for i in range(init.numel(), sens_init.numel())]),
+               casadi.vertcat(dense_init)]
+    f = casadi.MXFunction(inputs, outputs)
+    f.init()
+    N.random.seed(1)
+    for k in range(3):
+        for i in range(len(inputs)):
+            f.setInput(0.5 + N.random.rand(), i)
+        f.evaluate()
+        N.testing.assert_allclose(f.output(0).toArray(), f.output(1).toArray(),
+                                   rtol=1e-10, atol=1e-12)
+        N.testing.assert_allclose(f.output(2).toArray(), f.output(3).toArray(),
+                                   rtol=1e-10, atol=1e-12)
@@ -369,6 +369,92 @@ class Test_Compiler_functions:
                fmuname+" was not created."
         os.remove(fmuname)
 
+    @testattr(stddist_base = True)
+    def test_compile_fmu_compiler_server(self):
+        """
+        Test that it is possible to compile several FMUs with the same compiler 
+        server and that the result is the same as in a separate process.
+        """
+        from pymodelica.compiler_server import CompilerServer
+        server = CompilerServer()
+        try:
+            for i in range(2):
+                fmuname = compile_fmu(Test_Compiler_functions.cpath_mc, Test_Compiler_functions.fpath_mc, 
+                    compiler_server=server)
+                assert os.access(fmuname, os.F_OK) == True, \
+                       fmuname+" was not created."
+                assert server.is_running()
+            reference = compile_fmu(Test_Compiler_functions.cpath_mc, Test_Compiler_functions.fpath_mc)
+            nose.tools.assert_equal(fmuname, reference)
+            nose.tools.assert_equal(len(fmuname.get_warnings()), len(reference.get_warnings()))
+            os.remove(fmuname)
+            
+            path = os.path.join(get_files_path(), 'Modelica','CorruptCodeGenTests.mo')
+            cl = 'CorruptCodeGenTests.CorruptTest1'
+            nose.tools.assert_raises(pym.compiler_exceptions.CompilerError, pym.compile_fmu, cl, path, 
+                compiler_server=server)
+        finally:
+            server.stop()
+        assert not server.is_running()
+
+    @testattr(stddist_base = True)
+    def test_compile_fmu_cache(self):
+        """
+        Test that a compilation result is reused from the compiler cache.
+        """
+        import tempfile
+        from pymodelica.compiler_cache import CompilerCache
+        cache_dir = tempfile.mkdtemp()
+        try:
+            cache = CompilerCache(cache_dir)
+            fmuname = compile_fmu(Test_Compiler_functions.cpath_mc, Test_Compiler_functions.fpath_mc, 
+                cache=cache)
+            os.remove(fmuname)
+            nose.tools.assert_equal(len(cache._entries()), 1)
+            
+            cached = compile_fmu(Test_Compiler_functions.cpath_mc, Test_Compiler_functions.fpath_mc, 
+                cache=cache)
+            nose.tools.assert_equal(cached, fmuname)
+            nose.tools.assert_equal(len(cached.get_warnings()), len(fmuname.get_warnings()))
+            assert os.access(cached, os.F_OK) == True, \
+                   cached+" was not created."
+            nose.tools.assert_equal(len(cache._entries()), 1)
+            
+            compile_fmu(Test_Compiler_functions.cpath_mc, Test_Compiler_functions.fpath_mc, 
+                target='cs', cache=cache)
+            nose.tools.assert_equal(len(cache._entries()), 2)
+            
+            cache.invalidate(Test_Compiler_functions.cpath_mc)
+            nose.tools.assert_equal(len(cache._entries()), 0)
+            os.remove(cached)
+        finally:
+            shutil.rmtree(cache_dir)
+
+    @testattr(stddist_base = True)
+    def test_compile_fmus(self):
+        """
+        Test that several FMUs can be compiled in parallel and that a failed 
+        compilation does not stop the other ones.
+        """
+        import tempfile
+        compile_to = tempfile.mkdtemp()
+        try:
+            path = os.path.join(get_files_path(), 'Modelica','CorruptCodeGenTests.mo')
+            jobs = [{'class_name': Test_Compiler_functions.cpath_mc, 
+                     'file_name': Test_Compiler_functions.fpath_mc, 'target': target, 
+                     'compile_to': os.path.join(compile_to, target + '.fmu')}
+                    for target in ['me', 'cs']]
+            jobs.append({'class_name': 'CorruptCodeGenTests.CorruptTest1', 'file_name': path})
+            results = pym.compile_fmus(jobs, max_workers=2)
+            nose.tools.assert_equal(len(results), 3)
+            for (job, result) in zip(jobs[:2], results[:2]):
+                nose.tools.assert_equal(result, job['compile_to'])
+                assert os.access(result, os.F_OK) == True, \
+                       result+" was not created."
+            assert isinstance(results[2], pym.compiler_exceptions.CompilerError)
+        finally:
+            shutil.rmtree(compile_to)
+
     @testattr(stddist_full = True)
     def test_compiler_error(self):
         """ Test that a CompilerError is raised if compilation errors are found in the model."""
@@ -29,7 +29,7 @@ from pymodelica.compiler import compile_fmu
 from pyfmi.fmi import FMUModel, FMUException, FMUModelME1, FMUModelCS1, load_fmu, FMUModelCS2, FMUModelME2, PyEventInfo
 import pyfmi.fmi_algorithm_drivers as ad
 from pyfmi.common.core import get_platform_dir
-from pyjmi.log import parse_jmi_log, gather_solves
+from pyjmi.log import parse_jmi_log, parse_xml_log, gather_solves, iterate_jmi_log, iterate_solves
 from pyfmi.common.io import ResultHandler
 import pyfmi.fmi as fmi
 
@@ -961,6 +961,68 @@ class Test_Logger:
         nose.tools.assert_almost_equal( d[0].block_solves[0].iterations[0].scaled_residual_norm,
                                         1.2432316741177614E+01 )
 
+    @testattr(stddist_full = True)
+    def test_parse_log_file_index(self):
+        """
+        Test that finding nodes in a log parsed with and without the type 
+        index gives the same nodes
+        """
+        file_name = os.path.join(path_to_fmu_logs, 'LoggerTest_log.txt')
+        log = parse_jmi_log(file_name)
+        ref = parse_jmi_log(file_name, index=False)
+
+        for types in ['EquationSolve', 'KinsolInfo', ('NewtonSolve', 'JacobianUpdated')]:
+            nodes = log.find(types)
+            ref_nodes = ref.find(types)
+            assert len(nodes)==len(ref_nodes)
+            for (node, ref_node) in zip(nodes, ref_nodes):
+                assert node.type==ref_node.type
+                assert len(node.find('KinsolInfo'))==len(ref_node.find('KinsolInfo'))
+
+    @testattr(stddist_full = True)
+    def test_parse_log_file_index_keys(self):
+        """
+        Test that keyed nodes named like the index attributes of a node can
+        be accessed as attributes in an indexed log
+        """
+        from io import StringIO
+        log = parse_xml_log(StringIO(u'<Log><Solve>'
+                                     u'<value name="index">3</value>'
+                                     u'<value name="start">0.5</value>'
+                                     u'<value name="end">1.5</value>'
+                                     u'<Solve><value name="index">4</value></Solve>'
+                                     u'</Solve></Log>'))
+        solve = log.find('Solve')[0]
+        assert solve.index==3
+        assert solve.start==0.5
+        assert solve.end==1.5
+        assert len(log.find('Solve'))==1
+        assert solve.nodes[3].index==4
+
+    @testattr(stddist_full = True)
+    def test_iterate_log_file(self):
+        """
+        Test that iterating over the solves in a pregenerated log file gives 
+        the same solves as parsing the whole log
+        """
+        file_name = os.path.join(path_to_fmu_logs, 'LoggerTest_log.txt')
+        d = gather_solves(parse_jmi_log(file_name))
+        solves = list(iterate_solves(iterate_jmi_log(file_name)))
+
+        assert len(solves)==len(d)
+        for (solve, ref) in zip(solves, d):
+            assert solve.t==ref.t
+            assert len(solve.block_solves)==len(ref.block_solves)
+            for (block_solve, ref_block_solve) in zip(solve.block_solves, ref.block_solves):
+                assert len(block_solve.iterations)==len(ref_block_solve.iterations)
+                for (it, ref_it) in zip(block_solve.iterations, ref_block_solve.iterations):
+                    assert N.array_equiv(it.ivs, ref_it.ivs)
+                    assert ('jacobian' in it) == ('jacobian' in ref_it)
+                    if 'jacobian' in it:
+                        assert N.array_equiv(it.jacobian, ref_it.jacobian)
+
+        assert len(list(iterate_jmi_log(file_name, 'NewtonSolve')))==len(parse_jmi_log(file_name).find('NewtonSolve'))
+
 
 class Test_SetDependentParameterError:
     """
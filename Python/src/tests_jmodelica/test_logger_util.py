@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (C) 2014 Modelon AB
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests the FMU log utilities in pyjmi.logger_util."""
+
+import os
+import shutil
+import tempfile
+import numpy as N
+from tests_jmodelica import testattr
+
+try:
+    from pyjmi.logger_util import get_structured_fmu_log, iterate_structured_fmu_log
+    from pyjmi.logger_util import FMU_write_log_to_file
+except (NameError, ImportError):
+    pass
+
+prefix = "FMIL: module = Model, log level = 4: "
+
+log_lines = ["FMIL: module = FMICAPI, log level = 5: Calling fmiInitialize\n",
+             "[NLE_ITERS];-1;Model equations evaluation invoked at time:;;;1.5\n",
+             "[NLE_SCALING];0;Updating residual scaling;;;4.0;1.0;\n",
+             "[NLE_ITERS];0;Newton solver invoked;;;x1;y1;\n",
+             "[NLE_ITERS];0;Max;;;10.0;20.0;\n",
+             "[NLE_ITERS];0;Min;;;-10.0;-20.0;\n",
+             "[NLE_ITERS];0;Variable nominal;;;1.0;2.0;\n",
+             "[NLE_ITERS];0;Initial guess;;;0.5;0.25;\n",
+             "[NLE_JAC];0;Jacobian;;;1.0;2.0;\n",
+             "[NLE_JAC];0;Jacobian;;;3.0;4.0;\n",
+             "[NLE_ITERS];0;Iteration;;;0.5;0.25;\n",
+             "[NLE_ITERS];0;Residuals;2.5;;1.5;-2.0;\n",
+             "[NLE_ITERS];0;Iteration;;;0.75;0.5;\n",
+             "[NLE_ITERS];0;Residuals;0.0;;0.0;0.0;\n",
+             "[NLE_ITERS];0;Limitation;;;x1 10.0;y1 20.0;\n",
+             "[NLE_ITERS];0;Newton solver finished with exit flag;1;;\n",
+             "[NLE_ITERS];-1;Model equations evaluation finished;;;\n",
+             "[NLE_ITERS];-1;Model equations evaluation invoked at time:;;;2.0\n",
+             "[NLE_ITERS];0;Newton solver invoked;;;x1;y1;\n",
+             "[NLE_ITERS];0;Iteration;;;0.75;0.5;\n",
+             "[NLE_ITERS];0;Residuals;0.0;;0.0;0.0;\n",
+             "[NLE_ITERS];0;Newton solver finished;;;\n",
+             "[NLE_ITERS];-1;Model equations evaluation finished;;;\n"]
+
+class TestLoggerUtil(object):
+    """
+    Tests the extraction and filtering of a small synthetic FMU log.
+    """
+
+    def setUp(self):
+        """Write the log in a temporary directory."""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_file = os.path.join(self.tmp_dir, 'log.txt')
+        with open(self.log_file, 'w') as f:
+            for l in log_lines:
+                f.write(l if l.startswith("FMIL") else prefix + l)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    @testattr(stddist_base = True)
+    def test_get_structured_fmu_log(self):
+        """
+        Test the solves, block solves and iterations extracted from the log.
+        """
+        d = get_structured_fmu_log(self.log_file)
+        assert len(d) == 2
+        assert [s['time'] for s in d] == [1.5, 2.0]
+        assert len(d[0]['block_solves']) == 1
+        assert len(d[1]['block_solves']) == 1
+
+        bl = d[0]['block_solves'][0]
+        assert bl['names'] == ['x1', 'y1']
+        assert bl['block_index'] == 0
+        assert bl['kinsol_exit_flag'] == '1'
+        N.testing.assert_array_equal(bl['max'], [10.0, 20.0])
+        N.testing.assert_array_equal(bl['min'], [-10.0, -20.0])
+        N.testing.assert_array_equal(bl['variable_nominal'], [1.0, 2.0])
+        N.testing.assert_array_equal(bl['initial_guess'], [0.5, 0.25])
+        N.testing.assert_array_equal(bl['initial_residual_scaling'], [4.0, 1.0])
+        assert bl['initial_residual_scaling_updated'] == True
+        assert len(bl['iterations']) == 2
+
+        it = bl['iterations'][0]
+        N.testing.assert_array_equal(it['iteration_variables'], [0.5, 0.25])
+        N.testing.assert_array_equal(it['jacobian'], [[1.0, 2.0], [3.0, 4.0]])
+        assert it['jacobian_updated'] == True
+        N.testing.assert_array_equal(it['residual_scaling'], [4.0, 1.0])
+        assert it['residual_scaling_updated'] == False
+        N.testing.assert_array_equal(it['residuals'], [1.5, -2.0])
+        assert it['scaled_residual_norm'] == 2.5
+        assert 'at_bound' not in it
+
+        it = bl['iterations'][1]
+        N.testing.assert_array_equal(it['iteration_variables'], [0.75, 0.5])
+        N.testing.assert_array_equal(it['jacobian'], [[1.0, 2.0], [3.0, 4.0]])
+        assert it['jacobian_updated'] == False
+        N.testing.assert_array_equal(it['residuals'], [0.0, 0.0])
+        assert it['scaled_residual_norm'] == 0.0
+        assert it['at_bound'] == [('x1', '10.0'), ('y1', '20.0')]
+
+        bl = d[1]['block_solves'][0]
+        assert 'kinsol_exit_flag' not in bl
+        assert 'max' not in bl
+        assert bl['initial_residual_scaling_updated'] == False
+        assert len(bl['iterations']) == 1
+        N.testing.assert_array_equal(bl['iterations'][0]['iteration_variables'], [0.75, 0.5])
+        assert bl['iterations'][0]['jacobian_updated'] == False
+
+    @testattr(stddist_base = True)
+    def test_iterate_structured_fmu_log(self):
+        """
+        Test that the solves are yielded when they are finished.
+        """
+        solves = iterate_structured_fmu_log(self.log_file)
+        assert next(solves)['time'] == 1.5
+        assert next(solves)['time'] == 2.0
+        assert list(solves) == []
+
+    @testattr(stddist_base = True)
+    def test_FMU_write_log_to_file(self):
+        """
+        Test writing the lines of the log with given tags to a file.
+        """
+        file_name = os.path.join(self.tmp_dir, 'fmu_log.txt')
+        FMU_write_log_to_file(self.log_file, ['[NLE_JAC]', '[NLE_SCALING]'], file_name)
+        with open(file_name) as f:
+            assert f.read() == (";0;Updating residual scaling;;;4.0;1.0;\n"
+                                ";0;Jacobian;;;1.0;2.0;\n"
+                                ";0;Jacobian;;;3.0;4.0;\n")
+
+        FMU_write_log_to_file(self.log_file, file_name=file_name)
+        with open(file_name) as f, open(self.log_file) as ref:
+            assert f.read() == ref.read()
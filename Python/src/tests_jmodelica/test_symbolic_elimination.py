@@ -29,6 +29,7 @@ from pymodelica import compile_fmu
 
 try: 
     from pyjmi.symbolic_elimination import BLTOptimizationProblem, EliminationOptions
+    from pyjmi.symbolic_elimination import BipartiteGraph, Equation, Variable, Edge, create_edges
     from pyjmi import transfer_optimization_problem
     import casadi
     from pyjmi.optimization.casadi_collocation import ExternalData
@@ -524,3 +525,68 @@ class TestSymbolicElimination(object):
         assert_results(res_blt, cost_ref, u_norm_ref, u_norm_rtol=1e-2)
         N.testing.assert_allclose([res_dae['p1'][0], res_dae['p3'][0]], [2.022765, 0.992965], rtol=2e-3)
         N.testing.assert_allclose([res_blt['p1'][0], res_blt['p3'][0]], [2.022765, 0.992965], rtol=2e-3)
+
+class TestBipartiteGraph(object):
+
+    """
+    Tests pyjmi.symbolic_elimination.BipartiteGraph.
+    """
+
+    def _create_graph(self, incidences, matching):
+        equations = [Equation('eq_%d' % i, i, i, False) for i in range(len(incidences))]
+        variables = [Variable('var_%d' % i, i, i, False, False) for i in range(len(incidences))]
+        edges = [Edge(equations[i], variables[j]) for (i, row) in enumerate(incidences) for j in row]
+        options = EliminationOptions()
+        options['matching'] = matching
+        return BipartiteGraph(equations, variables, edges, options)
+
+    @testattr(casadi_base = True)
+    def test_create_edges(self):
+        """Test incidences found from the Jacobian sparsity, with a variable as the whole residual."""
+        x = [casadi.MX.sym('x%d' % i) for i in range(3)]
+        t = casadi.MX.sym('t')
+        residuals = [x[0] * x[2] - t, x[1], casadi.sin(x[0]) + t]
+        equations = [Equation('eq_%d' % i, i, i, False, res) for (i, res) in enumerate(residuals)]
+        variables = [Variable('x%d' % i, i, i, False, False, mx_var=x[i]) for i in range(3)]
+        edges = create_edges(equations, variables)
+        assert [(edge.eq.local_index, edge.var.local_index) for edge in edges] == [(0, 0), (0, 2), (1, 1), (2, 0)]
+
+    @testattr(casadi_base = True)
+    def test_maximum_match(self):
+        """Test matching when the greedy initial matching leaves a long augmenting path."""
+        incidences = [[0, 1], [0], [1, 2], [3], [2, 3, 4], [4, 5]]
+        for matching in ['hopcroft_karp', 'scipy']:
+            graph = self._create_graph(incidences, matching)
+            graph.maximum_match()
+            matches = [(eq.local_index, var.local_index) for (eq, var) in graph.matches]
+            assert matches == [(i, [1, 0, 2, 3, 4, 5][i]) for i in range(6)]
+
+    @testattr(casadi_base = True)
+    def test_maximum_match_singular(self):
+        """Test that structurally singular systems are detected."""
+        for matching in ['hopcroft_karp', 'scipy']:
+            graph = self._create_graph([[0], [0], [1, 2]], matching)
+            N.testing.assert_raises(RuntimeError, graph.maximum_match)
+            graph = self._create_graph([[], [0, 1], [1, 2]], matching)
+            N.testing.assert_raises(RuntimeError, graph.maximum_match)
+
+    @testattr(casadi_base = True)
+    def test_scc(self):
+        """Test the components and their order."""
+        graph = self._create_graph([[0, 1], [1], [0, 2, 3], [2, 3]], 'hopcroft_karp')
+        graph.maximum_match()
+        graph.scc()
+        components = [sorted(eq.local_index for eq in component.equations) for component in graph.components]
+        assert components == [[1], [0], [2, 3]]
+        assert sorted(eq.global_blt_index for eq in graph.equations[:2]) == [0, 1]
+        assert graph.equations[1].global_blt_index == 0
+
+    @testattr(casadi_base = True)
+    def test_scc_long_chain(self):
+        """Test a chain of scalar components longer than the recursion limit."""
+        n = sys.getrecursionlimit() + 100
+        graph = self._create_graph([[i, i + 1] for i in range(n - 1)] + [[n - 1]], 'hopcroft_karp')
+        graph.maximum_match()
+        graph.scc()
+        assert len(graph.components) == n
+        assert [eq.global_blt_index for eq in graph.equations] == list(range(n - 1, -1, -1))
@@ -301,3 +301,28 @@ class Test_AlgorithmMethods_UKF:
         N.testing.assert_allclose(self.ukf.K, [[0.99995099], [0.00497003]], rtol=1e-6)
         N.testing.assert_allclose(self.ukf.P, [[1.00099995e-01, 4.97003235e-07],
                                        [4.97003235e-07, 1.00115269e+00]], rtol=1e-6)
+    
+    def test_keep_parameters(self):
+        #Parameter values set before the UKF is created are kept when the model is reset
+        model = load_fmu(get_fmu())
+        model.set('x1_0', 0.5)
+        ukf = UKF(model, self.x_0, ['x1'], 0.01, self.options)
+        assert ukf._parameters == [('x1_0', 0.5)]
+        N.testing.assert_allclose(model.get('x1_0'), 0.5)
+        assert self.ukf._parameters == []
+    
+    def test_predict_parallel(self):
+        #Simulate the sigma points in two worker processes
+        self.ukf.update_options(nbr_processes=2, fmu_file=get_fmu())
+        u = (['u'], N.transpose(N.vstack((0.0,0.1))))
+        known_values = {}
+        try:
+            self.ukf.predict(u, known_values)
+        finally:
+            self.ukf.close()
+        #Assert same prediction as when simulating in the calling process
+        N.testing.assert_allclose(self.ukf.xp, [[1.00988634], [0.0172094]], rtol=1e-6)
+        N.testing.assert_allclose(self.ukf.yp, [[1.00988634]], rtol=1e-6)
+        N.testing.assert_allclose(self.ukf.K, [[0.99995099], [0.00497003]], rtol=1e-6)
+        N.testing.assert_allclose(self.ukf.P, [[1.00099995e-01, 4.97003235e-07],
+                                       [4.97003235e-07, 1.00115269e+00]], rtol=1e-6)